@@ -1,22 +1,39 @@
 """
 Jenkins 定时发版 Web 服务
-主应用入口
+主应用入口：gunicorn 'app:create_app()'。导入本模块不会启动后台线程，
+调度器与通知投递由 create_app 按 EMBEDDED_SCHEDULER 决定是否在本进程运行
 """
 import os
 import json
+import atexit
+import hmac
 import logging
-import threading
+from concurrent.futures import ThreadPoolExecutor
 from flask import Flask, render_template, jsonify, request
 from datetime import datetime, timedelta
 import pytz
+import requests
 
 from config import Config
-from database import init_db, get_db
-from jenkins_client import JenkinsClient
-from scheduler import Scheduler
-from feishu_notifier import FeishuNotifier
+from database import init_db, get_db, epoch_ms
+from jenkins_client import JenkinsClientRegistry, qualify_job_path, split_job_ref
+from scheduler import SchedulerService
+from scheduler_ipc import (BUILD_EVENT, EXECUTE_PLAN, INVALIDATE_JENKINS, SCHEDULER_SERVICE, pending_command_count,
+                           read_heartbeat, send_command)
+from notification_outbox import outbox_stats
 from repo_config import REPO_TYPES, get_param_names_for_repo_type
-from gitlab_client import GitLabClient
+from gitlab_client import GitLabClientRegistry, GitLabConfigNotFound
+from gitlab_cache import GitLabCache
+from folder_config import FolderConfigResolver
+from build_events import BuildEventHub, parse_jenkins_event
+from log_stream import LogStreamRegistry
+from http_cache import json_response
+from sse import sse_response
+from cache_sync import (FOLDER_CONFIG, GITLAB_ALL, GITLAB_CONFIG, GITLAB_PROJECTS, JENKINS_CONTROLLER, JENKINS_PARAMS,
+                        CacheInvalidationSync, record_invalidation)
+from plan_events import PLAN_SUMMARY_COLUMNS, PlanEventFeed, latest_event_id, plan_summary
+from archive import unpack_items
+from job_stats import ALL_TIME, SORT_KEYS as JOB_STATS_SORT_KEYS, query_job_stats, week_key
 
 # 配置日志
 logging.basicConfig(
@@ -28,16 +45,86 @@ logger = logging.getLogger(__name__)
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# 初始化数据库
-init_db()
-
 # 初始化组件
-jenkins_client = JenkinsClient()
-feishu_notifier = FeishuNotifier()
-scheduler = Scheduler(jenkins_client, feishu_notifier)
-
-# 启动后台调度器
-scheduler.start()
+build_events = BuildEventHub()
+# 多 Jenkins 控制器：按 job_path 前缀路由到各自的客户端
+jenkins_clients = JenkinsClientRegistry(event_hub=build_events)
+log_streams = LogStreamRegistry(jenkins_clients)
+# 计划列表页的状态实时推送，所有连接共享一路事件读取
+plan_event_feed = PlanEventFeed()
+# GitLab 客户端按配置复用长连接
+gitlab_clients = GitLabClientRegistry()
+# 所有用户共享的分支/项目列表缓存
+gitlab_cache = GitLabCache(gitlab_clients.get, Config.GITLAB_CACHE_TTL)
+# 文件夹参数配置/分支来源的就近解析（前缀树快照，配置写接口调用后失效）
+folder_config_resolver = FolderConfigResolver(Config.FOLDER_CONFIG_CACHE_TTL)
+# 内嵌在本进程的调度服务（EMBEDDED_SCHEDULER），独立部署调度进程时为 None
+scheduler_service = None
+
+
+def _invalidate_caches(scope, payload=None):
+    """按失效记录失效本进程的缓存，返回清除条数（配置写接口与多 worker 同步共用）"""
+    payload = payload or {}
+    if scope == FOLDER_CONFIG:
+        folder_config_resolver.invalidate()
+        return 1
+    if scope == GITLAB_CONFIG:
+        gitlab_clients.invalidate(payload['config_id'])
+        return gitlab_cache.invalidate_config(payload['config_id'])
+    if scope == GITLAB_PROJECTS:
+        return gitlab_cache.invalidate_project(payload['refs'], config_id=payload.get('config_id'))
+    if scope == GITLAB_ALL:
+        return gitlab_cache.invalidate()
+    if scope == JENKINS_CONTROLLER:
+        jenkins_clients.invalidate(payload['controller_id'])
+        return 1
+    if scope == JENKINS_PARAMS:
+        return jenkins_clients.invalidate_job_parameters(payload.get('path'))
+    logger.warning(f"未知的缓存失效类型: {scope}")
+    return 0
+
+
+def _record_and_invalidate(scope, payload=None):
+    """没有配置写入的失效（webhook、手动清缓存）：单独写一条记录通知其他进程，并失效本进程缓存"""
+    with get_db() as conn:
+        record_invalidation(conn, scope, payload)
+        conn.commit()
+    return _invalidate_caches(scope, payload)
+
+
+# 多 worker 部署时同步其他进程的缓存失效（各进程的缓存相互独立）
+cache_sync = CacheInvalidationSync(_invalidate_caches)
+
+
+@app.before_request
+def _sync_caches():
+    cache_sync.sync()
+
+
+def create_app(embedded=None):
+    """应用工厂：初始化数据库；embedded（默认取 EMBEDDED_SCHEDULER）为真时在本进程启动调度器与通知投递，
+    与 Web 共用 Jenkins 客户端和构建事件中转。内嵌模式只能单 worker 运行"""
+    global scheduler_service
+    init_db()
+    if embedded is None:
+        embedded = Config.EMBEDDED_SCHEDULER
+    if embedded and scheduler_service is None:
+        scheduler_service = SchedulerService(jenkins_clients=jenkins_clients, build_events=build_events)
+        scheduler_service.start()
+        # 进程退出时（gunicorn worker 收到 SIGTERM、开发服务器 Ctrl+C）中断执行中的计划，下次启动后续跑
+        atexit.register(scheduler_service.stop)
+        logger.info("调度器与通知投递已在 Web 进程内启动")
+    return app
+
+
+def _notify_scheduler(kind, payload):
+    """交给调度服务处理：内嵌时直接调用并返回结果，否则写入命令表由独立调度进程领取（返回 None）"""
+    if scheduler_service is not None:
+        return scheduler_service.handle_command(kind, payload)
+    with get_db() as conn:
+        send_command(conn, kind, payload)
+        conn.commit()
+    return None
 
 
 @app.route('/health')
@@ -67,70 +154,145 @@ def config_page():
 def get_jenkins_jobs():
     """获取 Jenkins 任务列表（树状）"""
     try:
-        jobs = jenkins_client.get_jobs()
-        return jsonify({'success': True, 'data': jobs})
+        # 直接拼接缓存的任务树 JSON，避免每次请求重新序列化整棵树；任务树版本即 ETag
+        body, version = jenkins_clients.get_jobs_json()
+        return json_response(b'{"success":true,"data":' + body + b'}', etag=version)
     except Exception as e:
         logger.error(f"获取 Jenkins 任务列表失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def _job_parent_folder_paths(job_path):
-    """Jenkins job path 的父文件夹 path 列表（就近优先）。"""
-    parts = job_path.strip().split('/')
-    if len(parts) < 2:
-        return []
-    idx = -2
-    out = []
-    while -idx <= len(parts):
-        parent_path = '/'.join(parts[:idx])
-        if parent_path:
-            out.append(parent_path)
-        idx -= 2
-    return out
+@app.route('/api/jenkins/events', methods=['POST'])
+def receive_jenkins_event():
+    """接收 Jenkins 构建开始/结束推送（Notification 插件或通用 Webhook），唤醒等待该构建的计划（结果仍向 Jenkins 确认）。
+    需开启 JENKINS_EVENTS_ENABLED 并配置 JENKINS_EVENTS_TOKEN，通过 ?token= 或 X-Jenkins-Event-Token 头携带；
+    非默认控制器需带 ?controller=<id>"""
+    if not Config.JENKINS_EVENTS_ENABLED:
+        return jsonify({'success': False, 'error': '未开启构建事件推送'}), 404
+    if not Config.JENKINS_EVENTS_TOKEN:
+        return jsonify({'success': False, 'error': '未配置 JENKINS_EVENTS_TOKEN，拒绝接收构建事件'}), 403
+    token = request.args.get('token') or request.headers.get('X-Jenkins-Event-Token') or ''
+    if not hmac.compare_digest(token, Config.JENKINS_EVENTS_TOKEN):
+        return jsonify({'success': False, 'error': 'token 无效'}), 403
+    event = parse_jenkins_event(request.get_json(silent=True))
+    if not event:
+        return jsonify({'success': False, 'error': '无法识别的事件'}), 400
+    # 额外的 Jenkins 控制器推送时带 ?controller=<id>，job_path 与 queue id 都按控制器区分
+    controller_id = request.args.get('controller', type=int)
+    event['job_path'] = qualify_job_path(controller_id, event['job_path'])
+    if event['queue_id'] is not None:
+        event['queue_id'] = (controller_id, event['queue_id'])
+    matched = _notify_scheduler(BUILD_EVENT, event)
+    logger.info(
+        f"收到 Jenkins 构建事件: {event['job_path']} #{event['build_number']} {event['phase']}"
+        + (f" {event['result']}" if event['result'] else '') + ("（匹配执行中的计划）" if matched else '')
+        + ("（已转交调度进程）" if matched is None else '')
+    )
+    return jsonify({'success': True, 'data': {'matched': matched}})
+
+
+def _apply_job_config(data, resolved):
+    """把就近解析结果合并进 Jenkins 参数数据（param_definitions / repo_type / 分支来源）"""
+    data = dict(data)
+    if resolved['param_config_id'] is not None and resolved['param_definitions']:
+        data['param_definitions'] = resolved['param_definitions']
+    elif resolved['repo_type']:
+        data['repo_type'] = resolved['repo_type']
+        param_names = get_param_names_for_repo_type(resolved['repo_type'])
+        if param_names:
+            data['param_names'] = param_names
+    data['branch_source_configured'] = resolved['gitlab_config_id'] is not None and resolved['gitlab_project_id'] is not None
+    if data['branch_source_configured']:
+        data['gitlab_config_id'] = resolved['gitlab_config_id']
+        data['gitlab_project_id'] = resolved['gitlab_project_id']
+    return data
+
+
+# ---------- Jenkins 控制器 ----------
+@app.route('/api/jenkins/controllers', methods=['GET'])
+def list_jenkins_controllers():
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, name, base_url, username, api_token, max_concurrency FROM jenkins_controllers ORDER BY id')
+            rows = cursor.fetchall()
+        data = [{'id': r[0], 'name': r[1], 'base_url': r[2], 'username': r[3] or '', 'api_token': r[4] or '',
+                 'max_concurrency': r[5]} for r in rows]
+        return jsonify({'success': True, 'data': data})
+    except Exception as e:
+        logger.error(f"获取 Jenkins 控制器列表失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def _get_folder_param_config_for_job(conn, job_path):
-    """按就近原则解析任务使用的 Jenkins 参数配置，返回 (config_id, param_definitions) 或 (None, None)。"""
-    cursor = conn.cursor()
-    for parent_path in _job_parent_folder_paths(job_path):
-        cursor.execute(
-            'SELECT j.id, j.param_definitions FROM folder_configs f JOIN jenkins_param_configs j ON f.jenkins_param_config_id=j.id WHERE f.folder_path=?',
-            (parent_path,)
-        )
-        row = cursor.fetchone()
-        if row:
-            try:
-                defs = json.loads(row[1]) if row[1] else []
-                return (row[0], defs)
-            except (ValueError, TypeError):
-                pass
-    return (None, None)
-
-
-def _get_branch_source_for_job(conn, job_path):
-    """按就近原则解析分支来源：先任务覆盖，再文件夹。返回 (gitlab_config_id, gitlab_project_id) 或 (None, None)。"""
-    cursor = conn.cursor()
-    cursor.execute('SELECT gitlab_config_id, gitlab_project_id FROM job_gitlab_override WHERE jenkins_job_path=?', (job_path,))
-    row = cursor.fetchone()
-    if row and row[0] is not None and row[1] is not None:
-        return (row[0], row[1])
-    for parent_path in _job_parent_folder_paths(job_path):
-        cursor.execute('SELECT gitlab_config_id, gitlab_project_id FROM folder_configs WHERE folder_path=?', (parent_path,))
-        row = cursor.fetchone()
-        if row and row[0] is not None and row[1] is not None:
-            return (row[0], row[1])
-    return (None, None)
+@app.route('/api/jenkins/controllers', methods=['POST'])
+def create_jenkins_controller():
+    try:
+        body = request.get_json() or {}
+        name = (body.get('name') or '').strip()
+        base_url = (body.get('base_url') or '').strip()
+        username = (body.get('username') or '').strip()
+        api_token = (body.get('api_token') or '').strip()
+        max_concurrency = body.get('max_concurrency') or Config.JENKINS_MAX_CONCURRENCY
+        if not name or not base_url:
+            return jsonify({'success': False, 'error': '缺少 name / base_url'}), 400
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'INSERT INTO jenkins_controllers (name, base_url, username, api_token, max_concurrency) VALUES (?, ?, ?, ?, ?)',
+                (name, base_url, username, api_token, int(max_concurrency))
+            )
+            uid = cursor.lastrowid
+            record_invalidation(conn, JENKINS_CONTROLLER, {'controller_id': uid})
+            conn.commit()
+        _invalidate_caches(JENKINS_CONTROLLER, {'controller_id': uid})
+        _notify_scheduler(INVALIDATE_JENKINS, {'controller_id': uid})
+        return jsonify({'success': True, 'data': {'id': uid}})
+    except Exception as e:
+        logger.error(f"创建 Jenkins 控制器失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
-def _get_folder_repo_type_for_job(conn, job_path):
-    """兼容旧逻辑：从 folder_repo_config 解析 repo_type。"""
-    cursor = conn.cursor()
-    for parent_path in _job_parent_folder_paths(job_path):
-        cursor.execute('SELECT repo_type FROM folder_repo_config WHERE folder_path=?', (parent_path,))
-        row = cursor.fetchone()
-        if row and row[0]:
-            return row[0]
-    return None
+@app.route('/api/jenkins/controllers/<int:controller_id>', methods=['PUT'])
+def update_jenkins_controller(controller_id):
+    try:
+        body = request.get_json() or {}
+        name = (body.get('name') or '').strip()
+        base_url = (body.get('base_url') or '').strip()
+        username = (body.get('username') or '').strip()
+        api_token = (body.get('api_token') or '').strip()
+        max_concurrency = body.get('max_concurrency') or Config.JENKINS_MAX_CONCURRENCY
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'UPDATE jenkins_controllers SET name=?, base_url=?, username=?, api_token=?, max_concurrency=? WHERE id=?',
+                (name, base_url, username, api_token, int(max_concurrency), controller_id)
+            )
+            record_invalidation(conn, JENKINS_CONTROLLER, {'controller_id': controller_id})
+            conn.commit()
+            if cursor.rowcount == 0:
+                return jsonify({'success': False, 'error': '控制器不存在'}), 404
+        _invalidate_caches(JENKINS_CONTROLLER, {'controller_id': controller_id})
+        _notify_scheduler(INVALIDATE_JENKINS, {'controller_id': controller_id})
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jenkins/controllers/<int:controller_id>', methods=['DELETE'])
+def delete_jenkins_controller(controller_id):
+    try:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM jenkins_controllers WHERE id=?', (controller_id,))
+            record_invalidation(conn, JENKINS_CONTROLLER, {'controller_id': controller_id})
+            conn.commit()
+            if cursor.rowcount == 0:
+                return jsonify({'success': False, 'error': '控制器不存在'}), 404
+        _invalidate_caches(JENKINS_CONTROLLER, {'controller_id': controller_id})
+        _notify_scheduler(INVALIDATE_JENKINS, {'controller_id': controller_id})
+        return jsonify({'success': True})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
 
 
 # ---------- GitLab 配置 ----------
@@ -200,9 +362,11 @@ def update_gitlab_config(config_id):
                 'UPDATE gitlab_configs SET name=?, base_url=?, token=?, ssl_verify=? WHERE id=?',
                 (name, base_url, token, 1 if ssl_verify else 0, config_id)
             )
+            record_invalidation(conn, GITLAB_CONFIG, {'config_id': config_id})
             conn.commit()
             if cursor.rowcount == 0:
                 return jsonify({'success': False, 'error': '配置不存在'}), 404
+        _invalidate_caches(GITLAB_CONFIG, {'config_id': config_id})
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -214,9 +378,11 @@ def delete_gitlab_config(config_id):
         with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM gitlab_configs WHERE id=?', (config_id,))
+            record_invalidation(conn, GITLAB_CONFIG, {'config_id': config_id})
             conn.commit()
             if cursor.rowcount == 0:
                 return jsonify({'success': False, 'error': '配置不存在'}), 404
+        _invalidate_caches(GITLAB_CONFIG, {'config_id': config_id})
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -228,16 +394,15 @@ def gitlab_projects():
     if not config_id:
         return jsonify({'success': False, 'error': '缺少 config_id'}), 400
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT base_url, token, ssl_verify FROM gitlab_configs WHERE id=?', (config_id,))
-            row = cursor.fetchone()
-        if not row:
-            return jsonify({'success': False, 'error': 'GitLab 配置不存在'}), 404
-        client = GitLabClient(row[0], row[1] or '', bool(row[2]))
-        projects = client.get_projects(search=request.args.get('search'))
+        projects = gitlab_cache.get_projects(config_id, search=request.args.get('search'))
         out = [{'id': p.get('id'), 'name': p.get('name'), 'path_with_namespace': p.get('path_with_namespace')} for p in projects]
         return jsonify({'success': True, 'data': out})
+    except GitLabConfigNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except (ValueError, requests.RequestException) as e:
+        # GitLab 不可达或返回登录页/HTML/非 JSON
+        logger.warning(f"获取 GitLab 项目列表失败（上游）: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 502
     except Exception as e:
         logger.error(f"获取 GitLab 项目列表失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -245,13 +410,15 @@ def gitlab_projects():
 
 @app.route('/api/gitlab/branches', methods=['GET'])
 def gitlab_branches():
+    """分支列表。带 q（搜索词）或 limit 时按前缀搜索：整名前缀优先，其次分段前缀（如 2026 命中 release/2026.10），
+    同组按最近提交时间排序，返回 data（分支名）与 total（匹配总数）；都不带时返回全部分支名"""
     job_path = request.args.get('job_path')
     config_id = request.args.get('config_id', type=int)
     project_id = request.args.get('project_id')
     if job_path:
         try:
-            with get_db() as conn:
-                gitlab_config_id, gitlab_project_id = _get_branch_source_for_job(conn, job_path)
+            resolved = folder_config_resolver.resolve([job_path])[job_path]
+            gitlab_config_id, gitlab_project_id = resolved['gitlab_config_id'], resolved['gitlab_project_id']
             if not gitlab_config_id or gitlab_project_id is None:
                 return jsonify({'success': False, 'error': '未配置分支来源', 'data': []}), 200
             config_id, project_id = gitlab_config_id, gitlab_project_id
@@ -259,22 +426,120 @@ def gitlab_branches():
             return jsonify({'success': False, 'error': str(e)}), 500
     if not config_id or project_id is None:
         return jsonify({'success': False, 'error': '缺少 config_id 或 project_id（或通过 job_path 解析）'}), 400
+    q = request.args.get('q')
+    limit = request.args.get('limit', type=int)
     try:
-        with get_db() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT base_url, token, ssl_verify FROM gitlab_configs WHERE id=?', (config_id,))
-            row = cursor.fetchone()
-        if not row:
-            return jsonify({'success': False, 'error': 'GitLab 配置不存在'}), 404
-        client = GitLabClient(row[0], row[1] or '', bool(row[2]))
-        branches = client.get_branches(project_id)
-        out = [b.get('name', '') for b in branches]
-        return jsonify({'success': True, 'data': out})
+        index = gitlab_cache.get_branch_index(config_id, project_id)
+        if q is None and limit is None:
+            return json_response({'success': True, 'data': [b['name'] for b in index.branches]})
+        # 带 q / limit 时走服务端搜索，只返回排名靠前的少量分支
+        names, total = index.search(q, min(max(limit or 20, 1), 200))
+        return json_response({'success': True, 'data': names, 'total': total})
+    except GitLabConfigNotFound as e:
+        return jsonify({'success': False, 'error': str(e)}), 404
+    except (ValueError, requests.RequestException) as e:
+        logger.warning(f"获取 GitLab 分支失败（上游）: {e}")
+        return jsonify({'success': False, 'error': str(e)}), 502
     except Exception as e:
         logger.error(f"获取 GitLab 分支失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/gitlab/branches/common', methods=['POST'])
+def gitlab_common_branches():
+    """批量设置分支前的校验。body: job_paths, branch?。
+    按就近原则解析每个任务的分支来源，并发（走共享缓存）取各项目分支，返回所有项目共有的分支；
+    传 branch 时同时返回缺少该分支的任务。未配置分支来源的任务单独列出，不参与求交集"""
+    body = request.get_json(silent=True) or {}
+    job_paths = body.get('job_paths')
+    if not isinstance(job_paths, list) or not all(isinstance(p, str) for p in job_paths):
+        return jsonify({'success': False, 'error': 'job_paths 必须为字符串数组'}), 400
+    job_paths = [p for p in job_paths if p]
+    branch = body.get('branch') or ''
+    if not isinstance(branch, str):
+        return jsonify({'success': False, 'error': 'branch 必须为字符串'}), 400
+    branch = branch.strip()
+    if not job_paths:
+        return jsonify({'success': False, 'error': '缺少 job_paths'}), 400
+    try:
+        resolved = folder_config_resolver.resolve(job_paths)
+        # 同一项目的多个任务只取一次分支
+        jobs_by_source = {}
+        unconfigured = []
+        for path in dict.fromkeys(job_paths):
+            r = resolved[path]
+            if r['gitlab_config_id'] is None or r['gitlab_project_id'] is None:
+                unconfigured.append(path)
+            else:
+                jobs_by_source.setdefault((r['gitlab_config_id'], str(r['gitlab_project_id'])), []).append(path)
+
+        def fetch(source):
+            try:
+                return source, {b['name'] for b in gitlab_cache.get_branches(*source)}, None
+            except Exception as e:
+                return source, None, str(e)
+
+        common = None
+        missing = []
+        errors = {}
+        if jobs_by_source:
+            with ThreadPoolExecutor(max_workers=min(len(jobs_by_source), Config.GITLAB_PAGE_WORKERS * 2)) as pool:
+                for source, names, error in pool.map(fetch, jobs_by_source):
+                    if error is not None:
+                        for path in jobs_by_source[source]:
+                            errors[path] = error
+                        continue
+                    common = names if common is None else common & names
+                    if branch and branch not in names:
+                        missing.extend(jobs_by_source[source])
+        data = {
+            'common': sorted(common or []),
+            'projects': len(jobs_by_source),
+            'missing': missing,
+            'unconfigured': unconfigured,
+            'errors': errors,
+        }
+        if branch:
+            data['branch'] = branch
+            data['branch_exists'] = not missing and not errors and bool(jobs_by_source)
+        return jsonify({'success': True, 'data': data})
+    except Exception as e:
+        logger.error(f"计算共有分支失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/gitlab/hooks', methods=['POST'])
+def receive_gitlab_hook():
+    """GitLab push / tag push webhook：失效对应项目的分支缓存。
+    配置了 GITLAB_WEBHOOK_TOKEN 时校验 X-Gitlab-Token 头；可带 ?config_id= 只失效该 GitLab 配置下的项目"""
+    if Config.GITLAB_WEBHOOK_TOKEN and request.headers.get('X-Gitlab-Token', '') != Config.GITLAB_WEBHOOK_TOKEN:
+        return jsonify({'success': False, 'error': 'token 无效'}), 403
+    payload = request.get_json(silent=True) or {}
+    project = payload.get('project') or {}
+    refs = {payload.get('project_id'), project.get('id'), project.get('path_with_namespace')}
+    refs.discard(None)
+    if not refs:
+        return jsonify({'success': False, 'error': '缺少项目信息'}), 400
+    removed = _record_and_invalidate(GITLAB_PROJECTS, {'refs': sorted(map(str, refs)),
+                                                       'config_id': request.args.get('config_id', type=int)})
+    logger.info(f"收到 GitLab {payload.get('object_kind') or 'webhook'} 事件: 项目 {sorted(map(str, refs))}, 失效分支缓存 {removed} 条")
+    return jsonify({'success': True, 'data': {'invalidated': removed}})
+
+
+@app.route('/api/gitlab/cache', methods=['DELETE'])
+def invalidate_gitlab_cache():
+    """手动失效 GitLab 缓存：带 project_id 只失效该项目分支，带 config_id 失效该配置，都不带则清空"""
+    config_id = request.args.get('config_id', type=int)
+    project_id = request.args.get('project_id')
+    if project_id:
+        removed = _record_and_invalidate(GITLAB_PROJECTS, {'refs': [project_id], 'config_id': config_id})
+    elif config_id:
+        removed = _record_and_invalidate(GITLAB_CONFIG, {'config_id': config_id})
+    else:
+        removed = _record_and_invalidate(GITLAB_ALL)
+    return jsonify({'success': True, 'data': {'invalidated': removed}})
+
+
 # ---------- 配置字典 ----------
 @app.route('/api/dictionaries', methods=['GET'])
 def list_dictionaries():
@@ -284,7 +549,7 @@ def list_dictionaries():
             cursor.execute('SELECT id, name, description, items FROM config_dictionaries ORDER BY id')
             rows = cursor.fetchall()
         data = [{'id': r[0], 'name': r[1], 'description': r[2] or '', 'items': r[3]} for r in rows]
-        return jsonify({'success': True, 'data': data})
+        return json_response({'success': True, 'data': data})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -465,9 +730,11 @@ def update_jenkins_param_config(config_id):
                 cursor.execute('UPDATE jenkins_param_configs SET name=?, gitlab_config_id=?, param_definitions=? WHERE id=?', (name or None, gitlab_config_id, defs_json, config_id))
             else:
                 cursor.execute('UPDATE jenkins_param_configs SET name=?, gitlab_config_id=? WHERE id=?', (name or None, gitlab_config_id, config_id))
+            record_invalidation(conn, FOLDER_CONFIG)
             conn.commit()
             if cursor.rowcount == 0:
                 return jsonify({'success': False, 'error': '配置不存在'}), 404
+        _invalidate_caches(FOLDER_CONFIG)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -479,9 +746,11 @@ def delete_jenkins_param_config(config_id):
         with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('DELETE FROM jenkins_param_configs WHERE id=?', (config_id,))
+            record_invalidation(conn, FOLDER_CONFIG)
             conn.commit()
             if cursor.rowcount == 0:
                 return jsonify({'success': False, 'error': '配置不存在'}), 404
+        _invalidate_caches(FOLDER_CONFIG)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -537,7 +806,9 @@ def set_folder_config():
             else:
                 cursor.execute('DELETE FROM folder_configs WHERE folder_path=?', (folder_path,))
                 cursor.execute('DELETE FROM folder_repo_config WHERE folder_path=?', (folder_path,))
+            record_invalidation(conn, FOLDER_CONFIG)
             conn.commit()
+        _invalidate_caches(FOLDER_CONFIG)
         return jsonify({'success': True})
     except Exception as e:
         logger.error(f"设置文件夹配置失败: {e}", exc_info=True)
@@ -576,7 +847,9 @@ def set_job_gitlab_override():
                 ''', (job_path, gitlab_config_id, gitlab_project_id))
             else:
                 cursor.execute('DELETE FROM job_gitlab_override WHERE jenkins_job_path=?', (job_path,))
+            record_invalidation(conn, FOLDER_CONFIG)
             conn.commit()
+        _invalidate_caches(FOLDER_CONFIG)
         return jsonify({'success': True})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
@@ -584,28 +857,34 @@ def set_job_gitlab_override():
 
 @app.route('/api/job-gitlab-override/batch', methods=['POST'])
 def set_job_gitlab_override_batch():
-    """body: job_paths: string[], gitlab_config_id?: number, gitlab_project_id?。同一 config+project 应用到多个任务；若 config/project 为空则删除这些任务的覆盖"""
+    """body: job_paths: string[], gitlab_config_id?: number, gitlab_project_id?。同一 config+project 应用到多个任务；若 config/project 为空则删除这些任务的覆盖。
+    先整体校验再在一个事务里批量写入，任一任务路径无效时不做任何修改"""
     try:
         body = request.get_json() or {}
         job_paths = body.get('job_paths')
         if not isinstance(job_paths, list):
             return jsonify({'success': False, 'error': '缺少或无效的 job_paths'}), 400
-        job_paths = [str(p).strip() for p in job_paths if (p or '').strip()]
+        if any(p is not None and not isinstance(p, str) for p in job_paths):
+            return jsonify({'success': False, 'error': 'job_paths 只能包含字符串'}), 400
+        job_paths = list(dict.fromkeys(p.strip() for p in job_paths if (p or '').strip()))
         gitlab_config_id = body.get('gitlab_config_id')
         gitlab_project_id = body.get('gitlab_project_id')
+        upsert = gitlab_config_id is not None and gitlab_project_id is not None
         with get_db() as conn:
             cursor = conn.cursor()
-            for job_path in job_paths:
-                if not job_path:
-                    continue
-                if gitlab_config_id is not None and gitlab_project_id is not None:
-                    cursor.execute('''
-                        INSERT OR REPLACE INTO job_gitlab_override (jenkins_job_path, gitlab_config_id, gitlab_project_id) VALUES (?, ?, ?)
-                    ''', (job_path, gitlab_config_id, gitlab_project_id))
-                else:
-                    cursor.execute('DELETE FROM job_gitlab_override WHERE jenkins_job_path=?', (job_path,))
+            if upsert:
+                cursor.execute('SELECT 1 FROM gitlab_configs WHERE id=?', (gitlab_config_id,))
+                if not cursor.fetchone():
+                    return jsonify({'success': False, 'error': 'GitLab 配置不存在'}), 404
+                cursor.executemany('''
+                    INSERT OR REPLACE INTO job_gitlab_override (jenkins_job_path, gitlab_config_id, gitlab_project_id) VALUES (?, ?, ?)
+                ''', [(job_path, gitlab_config_id, gitlab_project_id) for job_path in job_paths])
+            else:
+                cursor.executemany('DELETE FROM job_gitlab_override WHERE jenkins_job_path=?', [(job_path,) for job_path in job_paths])
+            record_invalidation(conn, FOLDER_CONFIG)
             conn.commit()
-        return jsonify({'success': True})
+        _invalidate_caches(FOLDER_CONFIG)
+        return jsonify({'success': True, 'data': {'count': len(job_paths)}})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)}), 500
 
@@ -623,102 +902,177 @@ def get_jenkins_job_parameters():
     if not path:
         return jsonify({'success': False, 'error': '缺少 path 参数'}), 400
     try:
-        data = jenkins_client.get_job_parameters_and_status(path)
-        with get_db() as conn:
-            param_config_id, param_definitions = _get_folder_param_config_for_job(conn, path)
-            gitlab_config_id, gitlab_project_id = _get_branch_source_for_job(conn, path)
-        if param_config_id is not None and param_definitions:
-            data['param_definitions'] = param_definitions
-        else:
-            with get_db() as conn2:
-                repo_type = _get_folder_repo_type_for_job(conn2, path)
-            if repo_type:
-                data['repo_type'] = repo_type
-                param_names = get_param_names_for_repo_type(repo_type)
-                if param_names:
-                    data['param_names'] = param_names
-        data['branch_source_configured'] = gitlab_config_id is not None and gitlab_project_id is not None
-        if data['branch_source_configured']:
-            data['gitlab_config_id'] = gitlab_config_id
-            data['gitlab_project_id'] = gitlab_project_id
-        return jsonify({'success': True, 'data': data})
+        data = jenkins_clients.get_job_parameters_and_status(path)
+        resolved = folder_config_resolver.resolve([path])[path]
+        return jsonify({'success': True, 'data': _apply_job_config(data, resolved)})
     except Exception as e:
         logger.error(f"获取任务参数失败 path={path}: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+
+@app.route('/api/jenkins/job/parameters/batch', methods=['POST'])
+def get_jenkins_job_parameters_batch():
+    """body: paths: string[]。批量返回多个任务的参数（结构同单任务接口），未缓存的任务并发请求 Jenkins；
+    单个任务失败不影响其他任务，失败信息放在 errors 中"""
+    try:
+        body = request.get_json() or {}
+        paths = body.get('paths')
+        if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+            return jsonify({'success': False, 'error': 'paths 必须为字符串数组'}), 400
+        paths = [p.strip() for p in paths if p.strip()]
+        results, errors = jenkins_clients.get_jobs_parameters_batch(paths)
+        resolved = folder_config_resolver.resolve(list(results))
+        data = {path: _apply_job_config(results[path], resolved[path]) for path in results}
+        for path, error in errors.items():
+            logger.warning(f"批量获取任务参数失败 path={path}: {error}")
+        return jsonify({'success': True, 'data': data, 'errors': errors})
+    except Exception as e:
+        logger.error(f"批量获取任务参数失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/jenkins/job/parameters/cache', methods=['DELETE'])
+def invalidate_jenkins_job_parameters():
+    """失效任务参数缓存：带 path 参数时仅失效该任务，否则清空全部"""
+    path = (request.args.get('path') or '').strip() or None
+    if path is not None:
+        controller_id, job_path = split_job_ref(path)
+        if not job_path:
+            return jsonify({'success': False, 'error': 'path 格式错误'}), 400
+        try:
+            # 先确认控制器存在，避免写入其他进程也无法执行的失效记录
+            jenkins_clients.get(controller_id)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 404
+    try:
+        cleared = _record_and_invalidate(JENKINS_PARAMS, {'path': path})
+        return jsonify({'success': True, 'data': {'cleared': cleared}})
+    except Exception as e:
+        logger.error(f"失效任务参数缓存失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+def _plan_date_bound(value, end=False):
+    """日期筛选参数（YYYY-MM-DD 或 ISO 时间，不带时区按东八区）转为毫秒时间戳。
+    end=True 且只给日期时取次日零点（不含），使结束日当天整天都被包含"""
+    value = (value or '').strip()
+    if not value:
+        return None
+    if len(value) == 10:
+        day = datetime.strptime(value, '%Y-%m-%d')
+        return epoch_ms(day + timedelta(days=1) if end else day)
+    return epoch_ms(value)
+
+
 @app.route('/api/plans', methods=['GET'])
 def list_plans():
-    """获取发版计划列表"""
+    """获取发版计划列表（按 id 倒序，游标分页）。
+    参数：limit（默认 50，最大 200）；before_id 取更早的一页，after 取比该 id 更新的计划；
+    status（可逗号分隔多个）、date_from / date_to（按计划时间）、job_path（包含该任务的计划）、execution_mode。
+    返回 data、has_more（游标方向上是否还有更多）、next_before_id（还有更早的计划时为本页最后一条 id，否则为 null）
+    与 last_event_id（查询前的最新状态事件 id，用于从此处订阅 /api/plans/stream）"""
     try:
-        import pytz
-        tz_shanghai = pytz.timezone('Asia/Shanghai')
-        
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        before_id = request.args.get('before_id', type=int)
+        after_id = request.args.get('after', type=int)
+        where = []
+        params = []
+        if before_id is not None:
+            where.append('id < ?')
+            params.append(before_id)
+        if after_id is not None:
+            where.append('id > ?')
+            params.append(after_id)
+        statuses = [x for x in (request.args.get('status') or '').split(',') if x]
+        if statuses:
+            where.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        mode = request.args.get('execution_mode')
+        if mode:
+            where.append("COALESCE(execution_mode, 'serial') = ?" if mode == 'serial' else 'execution_mode = ?')
+            params.append(mode)
+        try:
+            date_from = _plan_date_bound(request.args.get('date_from'))
+            date_to = _plan_date_bound(request.args.get('date_to'), end=True)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'date_from / date_to 格式应为 YYYY-MM-DD 或 ISO 时间'}), 400
+        if date_from:
+            where.append('scheduled_epoch_ms >= ?')
+            params.append(date_from)
+        if date_to:
+            where.append('scheduled_epoch_ms < ?')
+            params.append(date_to)
+        job_path = request.args.get('job_path')
+        if job_path:
+            where.append('id IN (SELECT plan_id FROM release_plan_items WHERE jenkins_job_name = ?)')
+            params.append(job_path)
+
+        # after 取紧邻游标的较新计划，按 id 正序取出后再倒过来
+        order = 'ASC' if after_id is not None and before_id is None else 'DESC'
+        sql = (f"SELECT {', '.join(PLAN_SUMMARY_COLUMNS)} FROM release_plans"
+               + (' WHERE ' + ' AND '.join(where) if where else '')
+               + f' ORDER BY id {order} LIMIT ?')
         with get_db() as conn:
+            # 先取事件 id 再查列表：之后的变化都会在订阅时补发
+            last_event_id = latest_event_id(conn)
             cursor = conn.cursor()
-            cursor.execute('''
-                SELECT p.*, COUNT(i.id) as item_count
-                FROM release_plans p
-                LEFT JOIN release_plan_items i ON p.id = i.plan_id
-                GROUP BY p.id
-                ORDER BY p.created_at DESC
-                LIMIT 100
-            ''')
+            cursor.execute(sql, params + [limit + 1])
             rows = cursor.fetchall()
-        
-        result = []
-        for row in rows:
-            plan_dict = {
-                'id': row['id'],
-                'scheduled_at': row['scheduled_at'],
-                'created_at': row['created_at'],
-                'status': row['status'],
-                'default_branch': row['default_branch'],
-                'item_count': row['item_count'],
-                'execution_mode': row['execution_mode'] if 'execution_mode' in row.keys() and row['execution_mode'] else 'serial'
-            }
-            result.append(plan_dict)
-        return jsonify({'success': True, 'data': result})
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if order == 'ASC':
+            rows.reverse()
+
+        result = [plan_summary(row) for row in rows]
+        next_before_id = result[-1]['id'] if has_more and order == 'DESC' else None
+        return json_response({'success': True, 'data': result, 'next_before_id': next_before_id, 'has_more': has_more,
+                              'last_event_id': last_event_id})
     except Exception as e:
         logger.error(f"获取计划列表失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _plan_item_dict(item_row):
+    """计划项行（sqlite Row 或归档解压出的 dict）转为接口格式"""
+    build_params = None
+    raw = item_row['build_params'] if 'build_params' in item_row.keys() else None
+    if raw:
+        try:
+            build_params = json.loads(raw)
+        except (ValueError, TypeError):
+            pass
+    return {
+        'id': item_row['id'],
+        'jenkins_job_name': item_row['jenkins_job_name'],
+        'branch': item_row['branch'],
+        'operation': item_row['operation'],
+        'pod_num': item_row['pod_num'],
+        'params': build_params,
+        'triggered': bool(item_row['triggered']),
+        'build_number': item_row['build_number'],
+        'success': bool(item_row['success']) if item_row['success'] is not None else None,
+        'failure_reason': item_row['failure_reason']
+    }
+
+
 @app.route('/api/plans/<int:plan_id>', methods=['GET'])
 def get_plan(plan_id):
-    """获取计划详情"""
+    """获取计划详情；已归档的计划从归档表读取，返回中 archived 为 true"""
     try:
+        archived = False
         with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('SELECT * FROM release_plans WHERE id=?', (plan_id,))
             plan_row = cursor.fetchone()
             
-            if not plan_row:
-                return jsonify({'success': False, 'error': '计划不存在'}), 404
-            
-            cursor.execute('SELECT * FROM release_plan_items WHERE plan_id=?', (plan_id,))
-            item_rows = cursor.fetchall()
-        
-        items = []
-        for item_row in item_rows:
-            build_params = None
-            raw = item_row['build_params'] if 'build_params' in item_row.keys() else None
-            if raw:
-                try:
-                    build_params = json.loads(raw)
-                except (ValueError, TypeError):
-                    pass
-            item_dict = {
-                'id': item_row['id'],
-                'jenkins_job_name': item_row['jenkins_job_name'],
-                'branch': item_row['branch'],
-                'operation': item_row['operation'],
-                'pod_num': item_row['pod_num'],
-                'params': build_params,
-                'triggered': bool(item_row['triggered']),
-                'build_number': item_row['build_number'],
-                'success': bool(item_row['success']) if item_row['success'] is not None else None,
-                'failure_reason': item_row['failure_reason']
-            }
-            items.append(item_dict)
+            if plan_row:
+                cursor.execute('SELECT * FROM release_plan_items WHERE plan_id=? ORDER BY id', (plan_id,))
+                item_rows = cursor.fetchall()
+            else:
+                cursor.execute('SELECT * FROM release_plan_archive WHERE id=?', (plan_id,))
+                plan_row = cursor.fetchone()
+                if not plan_row:
+                    return jsonify({'success': False, 'error': '计划不存在'}), 404
+                item_rows = unpack_items(plan_row['items_blob'])
+                archived = True
         
         plan_dict = {
             'id': plan_row['id'],
@@ -727,7 +1081,8 @@ def get_plan(plan_id):
             'status': plan_row['status'],
             'default_branch': plan_row['default_branch'],
             'execution_mode': plan_row['execution_mode'] if 'execution_mode' in plan_row.keys() and plan_row['execution_mode'] else 'serial',
-            'items': items
+            'items': [_plan_item_dict(item_row) for item_row in item_rows],
+            'archived': archived
         }
         return jsonify({'success': True, 'data': plan_dict})
     except Exception as e:
@@ -735,6 +1090,104 @@ def get_plan(plan_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/plans/archive', methods=['GET'])
+def list_archived_plans():
+    """获取已归档计划列表（按 id 倒序，游标分页），只返回汇总，详情见 /api/plans/<id>。
+    参数：limit（默认 50，最大 200）、before_id、status（可逗号分隔多个）、date_from / date_to、job_path"""
+    try:
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+        before_id = request.args.get('before_id', type=int)
+        where = []
+        params = []
+        if before_id is not None:
+            where.append('id < ?')
+            params.append(before_id)
+        statuses = [x for x in (request.args.get('status') or '').split(',') if x]
+        if statuses:
+            where.append(f"status IN ({','.join('?' * len(statuses))})")
+            params.extend(statuses)
+        try:
+            date_from = _plan_date_bound(request.args.get('date_from'))
+            date_to = _plan_date_bound(request.args.get('date_to'), end=True)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'date_from / date_to 格式应为 YYYY-MM-DD 或 ISO 时间'}), 400
+        if date_from:
+            where.append('scheduled_epoch_ms >= ?')
+            params.append(date_from)
+        if date_to:
+            where.append('scheduled_epoch_ms < ?')
+            params.append(date_to)
+        job_path = request.args.get('job_path')
+        if job_path:
+            # job_paths 为按行拼接的任务路径
+            where.append("instr(char(10) || job_paths || char(10), char(10) || ? || char(10)) > 0")
+            params.append(job_path)
+
+        sql = ('SELECT id, scheduled_at, created_at, status, default_branch, execution_mode, '
+               'item_count, success_count, fail_count, archived_at FROM release_plan_archive'
+               + (' WHERE ' + ' AND '.join(where) if where else '')
+               + ' ORDER BY id DESC LIMIT ?')
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(sql, params + [limit + 1])
+            rows = cursor.fetchall()
+        has_more = len(rows) > limit
+        result = []
+        for row in rows[:limit]:
+            result.append({
+                'id': row['id'],
+                'scheduled_at': row['scheduled_at'],
+                'created_at': row['created_at'],
+                'status': row['status'],
+                'default_branch': row['default_branch'],
+                'item_count': row['item_count'],
+                'success_count': row['success_count'],
+                'fail_count': row['fail_count'],
+                'execution_mode': row['execution_mode'] or 'serial',
+                'archived_at': row['archived_at']
+            })
+        next_before_id = result[-1]['id'] if has_more else None
+        return jsonify({'success': True, 'data': result, 'next_before_id': next_before_id, 'has_more': has_more})
+    except Exception as e:
+        logger.error(f"获取归档计划列表失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/plans/stream', methods=['GET'])
+def stream_plan_events():
+    """以 SSE 推送计划与计划项的状态变化（event plan / item），支持 Last-Event-ID / ?after= 续传；
+    无法续传时推送 event reset，客户端应重新加载列表"""
+    after = request.headers.get('Last-Event-ID') or request.args.get('after')
+    try:
+        after = max(int(after), 0) if after not in (None, '') else None
+    except ValueError:
+        after = None
+    return sse_response(plan_event_feed.stream(after))
+
+
+@app.route('/api/plans/<int:plan_id>/items/<int:item_id>/log', methods=['GET'])
+def stream_plan_item_log(plan_id, item_id):
+    """以 SSE 推送任务构建的控制台日志（增量），支持 Last-Event-ID / ?offset= 续传"""
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT jenkins_job_name, build_number FROM release_plan_items WHERE id=? AND plan_id=?',
+            (item_id, plan_id)
+        )
+        row = cursor.fetchone()
+    if not row:
+        return jsonify({'success': False, 'error': '任务不存在'}), 404
+    if not row['build_number']:
+        return jsonify({'success': False, 'error': '任务尚未触发构建'}), 400
+    offset = request.headers.get('Last-Event-ID') or request.args.get('offset') or 0
+    try:
+        offset = max(int(offset), 0)
+    except ValueError:
+        offset = 0
+    stream = log_streams.stream(row['jenkins_job_name'], row['build_number'], offset)
+    return sse_response(stream)
+
+
 @app.route('/api/plans/<int:plan_id>/cancel', methods=['POST', 'PATCH'])
 def cancel_plan(plan_id):
     """取消待执行的计划（仅 pending 可取消）"""
@@ -777,6 +1230,23 @@ def terminate_plan(plan_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _plan_item_row(item_data):
+    """请求中的计划项转为 (jenkins_job_name, branch, operation, pod_num, build_params)。
+    支持按任务真实参数名传参（params），兼容 GitLab/云效等不同任务"""
+    item_params = item_data.get('params')
+    if isinstance(item_params, dict) and item_params:
+        build_params_json = json.dumps(item_params)
+        branch = (item_params.get('BRANCH_TAG') or item_params.get('GIT_BRANCH') or item_params.get('REPO_BRANCH') or item_params.get('branch') or '')
+        operation = (item_params.get('请选择操作') or item_params.get('操作') or item_params.get('operation') or '')
+        pod_num = (item_params.get('pod_num') or item_params.get('POD_NUM') or '')
+    else:
+        build_params_json = None
+        branch = item_data.get('branch', '') or ''
+        operation = item_data.get('operation', '') or ''
+        pod_num = item_data.get('pod_num', '') or ''
+    return (item_data['jenkins_job_name'], branch, operation, pod_num, build_params_json)
+
+
 @app.route('/api/plans', methods=['POST'])
 def create_plan():
     """创建发版计划"""
@@ -794,7 +1264,16 @@ def create_plan():
         
         if not items_data:
             return jsonify({'success': False, 'error': '至少选择一个任务'}), 400
+        if not isinstance(items_data, list):
+            return jsonify({'success': False, 'error': 'items 必须是数组'}), 400
         # 仅选择参数配置即可发版；未配置 GitLab 项目时分支由用户手动填写，不再拦截
+        # 写库前整体校验并组装好计划项，写入时一次 executemany
+        item_rows = []
+        for index, item_data in enumerate(items_data):
+            job_path = item_data.get('jenkins_job_name') if isinstance(item_data, dict) else None
+            if not isinstance(job_path, str) or not job_path.strip():
+                return jsonify({'success': False, 'error': f'第 {index + 1} 个任务缺少 jenkins_job_name'}), 400
+            item_rows.append(_plan_item_row(item_data))
 
         # 解析时间（东八区）
         tz_shanghai = pytz.timezone('Asia/Shanghai')
@@ -811,22 +1290,12 @@ def create_plan():
         if not execute_immediately and scheduled_at < now_shanghai - timedelta(minutes=2):
             return jsonify({'success': False, 'error': '计划时间必须是未来时间'}), 400
         
-        # 校验任务 path 是否在树中存在（树状接口返回 folder/job 结构）
-        def _job_paths_from_tree(nodes):
-            paths = set()
-            for n in nodes:
-                if n.get('type') == 'job':
-                    paths.add(n.get('path', ''))
-                elif n.get('children'):
-                    paths |= _job_paths_from_tree(n['children'])
-            return paths
+        # 校验任务 path 是否在树中存在
         try:
-            tree = jenkins_client.get_jobs()
-            valid_paths = _job_paths_from_tree(tree) if isinstance(tree, list) else set()
-            for item_data in items_data:
-                path = item_data.get('jenkins_job_name')
-                if valid_paths and path not in valid_paths:
-                    logger.warning(f"任务 {path} 不在可用列表中，但继续创建计划")
+            valid_paths = jenkins_clients.get_job_paths()
+            for row in item_rows:
+                if valid_paths and row[0] not in valid_paths:
+                    logger.warning(f"任务 {row[0]} 不在可用列表中，但继续创建计划")
         except Exception as e:
             logger.warning(f"无法校验任务列表: {e}，继续创建计划")
         
@@ -834,10 +1303,11 @@ def create_plan():
         with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('''
-                INSERT INTO release_plans (scheduled_at, created_at, status, default_branch, execution_mode)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO release_plans (scheduled_at, scheduled_epoch_ms, created_at, status, default_branch, execution_mode)
+                VALUES (?, ?, ?, ?, ?, ?)
             ''', (
                 scheduled_at.isoformat(),
+                epoch_ms(scheduled_at),
                 now_shanghai.isoformat(),
                 'pending',
                 default_branch or '',
@@ -845,42 +1315,92 @@ def create_plan():
             ))
             plan_id = cursor.lastrowid
             
-            # 创建计划项（支持按任务真实参数名传参，兼容 GitLab/云效等不同任务）
-            for item_data in items_data:
-                job_path = item_data.get('jenkins_job_name')
-                item_params = item_data.get('params')
-                if isinstance(item_params, dict) and item_params:
-                    build_params_json = json.dumps(item_params)
-                    branch = (item_params.get('BRANCH_TAG') or item_params.get('GIT_BRANCH') or item_params.get('REPO_BRANCH') or item_params.get('branch') or '')
-                    operation = (item_params.get('请选择操作') or item_params.get('操作') or item_params.get('operation') or '')
-                    pod_num = (item_params.get('pod_num') or item_params.get('POD_NUM') or '')
-                else:
-                    build_params_json = None
-                    branch = item_data.get('branch', '') or ''
-                    operation = item_data.get('operation', '') or ''
-                    pod_num = item_data.get('pod_num', '') or ''
-                cursor.execute('''
-                    INSERT INTO release_plan_items 
-                    (plan_id, jenkins_job_name, branch, operation, pod_num, build_params, triggered)
-                    VALUES (?, ?, ?, ?, ?, ?, 0)
-                ''', (plan_id, job_path, branch, operation, pod_num, build_params_json))
+            cursor.executemany('''
+                INSERT INTO release_plan_items 
+                (plan_id, jenkins_job_name, branch, operation, pod_num, build_params, triggered)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            ''', [(plan_id,) + row for row in item_rows])
+            # 独立调度进程：立即执行的请求与计划同一事务写入命令表，由调度进程领取后提交到执行池
+            if execute_immediately and scheduler_service is None:
+                send_command(conn, EXECUTE_PLAN, {'plan_id': plan_id})
             
             conn.commit()
         
         logger.info(f"创建发版计划 #{plan_id}，计划时间: {scheduled_at}" + ("，立即执行" if execute_immediately else ""))
+        data = {'plan_id': plan_id}
         if execute_immediately:
-            def run_in_background():
-                try:
-                    scheduler.execute_plan(plan_id)
-                except Exception as ex:
-                    logger.error(f"创建后立即执行计划 #{plan_id} 失败: {ex}", exc_info=True)
-            t = threading.Thread(target=run_in_background, daemon=True)
-            t.start()
-        return jsonify({'success': True, 'data': {'plan_id': plan_id}})
+            # 内嵌调度器时直接提交到执行池并返回排队位置（提交前进程退出也会被到期扫描执行）
+            if scheduler_service is not None:
+                data['execution'] = scheduler_service.handle_command(EXECUTE_PLAN, {'plan_id': plan_id})
+            else:
+                data['execution'] = {'plan_id': plan_id, 'state': 'submitted', 'position': None}
+        return jsonify({'success': True, 'data': data})
         
     except Exception as e:
         logger.error(f"创建计划失败: {e}", exc_info=True)
         return jsonify({'success': False, 'error': str(e)}), 500
 
+@app.route('/api/notifications/metrics', methods=['GET'])
+def get_notification_metrics():
+    """飞书通知发件箱投递情况：待投递/失败数量、最早待投递通知等待时长、最近一小时投递延迟等"""
+    try:
+        if scheduler_service is not None:
+            data = scheduler_service.notification_sender.metrics()
+        else:
+            # 投递线程在独立调度进程中，计数取自其心跳
+            data = outbox_stats()
+            heartbeat = read_heartbeat(SCHEDULER_SERVICE, Config.SCHEDULER_HEARTBEAT_INTERVAL * 3)
+            data['counters'] = heartbeat['state'].get('outbox_counters', {}) if heartbeat else {}
+            data['running'] = bool(heartbeat and heartbeat['alive'] and heartbeat['state'].get('outbox_running'))
+        return jsonify({'success': True, 'data': data})
+    except Exception as e:
+        logger.error(f"获取通知投递指标失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/stats/jobs', methods=['GET'])
+def get_job_stats_api():
+    """任务发版统计（读取 job_stats 汇总行，不扫描历史计划项）。
+    参数：period（all 默认 / week 表示本周 / 形如 2026-W42 的 ISO 周）；job_path（可逗号分隔多个，最多 200 个）；
+    sort（total 默认 / fail_count / success_rate / avg_duration / p90_duration，均为倒序，success_rate 为正序）；limit（默认 50，最大 500）"""
+    try:
+        period = (request.args.get('period') or ALL_TIME).strip()
+        if period == 'week':
+            period = week_key()
+        job_paths = [p for p in (request.args.get('job_path') or '').split(',') if p]
+        if len(job_paths) > 200:
+            return jsonify({'success': False, 'error': 'job_path 最多 200 个'}), 400
+        sort = request.args.get('sort') or 'total'
+        if sort not in JOB_STATS_SORT_KEYS:
+            return jsonify({'success': False, 'error': f'不支持的排序字段: {sort}'}), 400
+        limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+        with get_db() as conn:
+            stats, total = query_job_stats(conn, job_paths, period, sort, limit)
+        return jsonify({'success': True, 'data': stats, 'period': period, 'total': total})
+    except Exception as e:
+        logger.error(f"获取任务发版统计失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@app.route('/api/scheduler/status', methods=['GET'])
+def get_scheduler_status():
+    """调度服务状态：运行方式（embedded / standalone）、最近一次心跳（超过 3 个心跳间隔视为不在运行）、待领取的命令数，
+    以及执行池中执行中/排队中的计划（独立调度进程时取自其心跳）"""
+    try:
+        heartbeat = read_heartbeat(SCHEDULER_SERVICE, Config.SCHEDULER_HEARTBEAT_INTERVAL * 3)
+        if scheduler_service is not None:
+            execution = scheduler_service.scheduler.pool.status()
+        else:
+            execution = heartbeat['state'].get('execution') if heartbeat else None
+        return jsonify({'success': True, 'data': {
+            'mode': 'embedded' if scheduler_service is not None else 'standalone',
+            'heartbeat': heartbeat,
+            'pending_commands': pending_command_count(),
+            'execution': execution
+        }})
+    except Exception as e:
+        logger.error(f"获取调度服务状态失败: {e}", exc_info=True)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    create_app().run(host='0.0.0.0', port=5000, debug=False)
@@ -0,0 +1,76 @@
+"""
+历史计划归档
+已结束且计划时间早于保留期的计划移入 release_plan_archive：每个计划保留一行汇总，计划项压缩成一个 zlib(JSON) 字段。
+按小批次、每批一个事务执行，由调度器低频调用，不影响接口与调度扫描
+"""
+import json
+import logging
+import time
+import zlib
+from datetime import datetime
+
+import pytz
+
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+_PLAN_COLUMNS = ('id', 'scheduled_at', 'scheduled_epoch_ms', 'created_at', 'status', 'default_branch',
+                 'execution_mode', 'run_started_at', 'item_count', 'success_count', 'fail_count')
+
+
+def pack_items(item_rows):
+    return zlib.compress(json.dumps([dict(r) for r in item_rows], ensure_ascii=False,
+                                    separators=(',', ':')).encode('utf-8'))
+
+
+def unpack_items(blob):
+    return json.loads(zlib.decompress(blob).decode('utf-8')) if blob else []
+
+
+def archive_finished_plans(retention_days, batch_size=100, max_batches=None):
+    """归档计划时间早于 retention_days 天前的已结束计划，返回归档数量"""
+    cutoff_ms = int((time.time() - retention_days * 86400) * 1000)
+    marks = ','.join('?' * len(FINISHED_STATUSES))
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"SELECT {', '.join(_PLAN_COLUMNS)} FROM release_plans "
+                f"WHERE scheduled_epoch_ms < ? AND status IN ({marks}) ORDER BY scheduled_epoch_ms LIMIT ?",
+                (cutoff_ms, *FINISHED_STATUSES, batch_size)
+            )
+            plans = cursor.fetchall()
+            if not plans:
+                break
+            plan_ids = [p['id'] for p in plans]
+            id_marks = ','.join('?' * len(plan_ids))
+            cursor.execute(f'SELECT * FROM release_plan_items WHERE plan_id IN ({id_marks}) ORDER BY id', plan_ids)
+            items_by_plan = {}
+            for item in cursor.fetchall():
+                items_by_plan.setdefault(item['plan_id'], []).append(item)
+            archived_at = datetime.now(pytz.timezone('Asia/Shanghai')).isoformat()
+            rows = []
+            for p in plans:
+                items = items_by_plan.get(p['id'], [])
+                # 任务路径按行拼接，供归档查询按任务过滤
+                job_paths = '\n'.join(dict.fromkeys(i['jenkins_job_name'] for i in items))
+                rows.append(tuple(p) + (job_paths, pack_items(items), archived_at))
+            cursor.executemany(
+                f"INSERT OR REPLACE INTO release_plan_archive ({', '.join(_PLAN_COLUMNS)}, job_paths, items_blob, archived_at) "
+                f"VALUES ({','.join('?' * (len(_PLAN_COLUMNS) + 3))})",
+                rows
+            )
+            # 先删计划再删计划项，计数触发器不再回写已删除的计划
+            cursor.execute(f'DELETE FROM release_plans WHERE id IN ({id_marks})', plan_ids)
+            cursor.execute(f'DELETE FROM release_plan_items WHERE plan_id IN ({id_marks})', plan_ids)
+            conn.commit()
+        total += len(plan_ids)
+        batches += 1
+    if total:
+        logger.info(f"已归档 {total} 个超过 {retention_days} 天的历史计划")
+    return total
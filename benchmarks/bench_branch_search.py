@@ -0,0 +1,43 @@
+"""
+分支搜索基准：旧的全量列表子串过滤（前端做法） vs BranchIndex 前缀索引
+    python benchmarks/bench_branch_search.py [分支数，默认 5000]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from branch_index import BranchIndex  # noqa: E402
+
+QUERIES = ['release/2026', 'release/2026.01', 'feature/', '2026', 'user-0001', 'hotfix/pay', 'r', 'zzz']
+
+
+def synthetic_branches(total):
+    kinds = ['release/2026.{:05d}', 'feature/user-{:05d}', 'hotfix/payment-{:05d}']
+    return [{'name': kinds[i % 3].format(i), 'committed_date': f'2026-{1 + i % 12:02d}-{1 + i % 28:02d}T08:00:00Z'}
+            for i in range(total)]
+
+
+def timeit(fn, repeat=200):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    branches = synthetic_branches(total)
+    start = time.perf_counter()
+    index = BranchIndex(branches)
+    print(f'分支数: {total}, 构建索引 {(time.perf_counter() - start) * 1000:.1f} ms（每次缓存填充一次）')
+    for q in QUERIES:
+        scan = timeit(lambda: [b['name'] for b in branches if q in b['name'].lower()][:20])
+        indexed = timeit(lambda: index.search(q, 20))
+        names, matched = index.search(q, 20)
+        print(f'{q!r:>18}: 命中 {matched:>5}, 全量过滤 {scan:.3f} ms, 索引 {indexed:.3f} ms, 首条 {names[0] if names else "-"}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+批量写入基准：批量设置任务 GitLab 覆盖（/api/job-gitlab-override/batch）与创建计划（POST /api/plans）。
+对比逐行 cursor.execute 与当前的 executemany 写法（均为一个事务），分别统计纯 SQL 写入与整个接口的耗时
+
+    python benchmarks/bench_bulk_writes.py [覆盖任务数，默认 500] [计划项数，默认 200] [重复次数，默认 20]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+OVERRIDES = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+ITEMS = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+ROUNDS = int(sys.argv[3]) if len(sys.argv) > 3 else 20
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_PATH'] = os.path.join(_tmp, 'bench.db')
+os.environ['FEISHU_WEBHOOK_URL'] = ''
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as web  # noqa: E402
+from database import get_db  # noqa: E402
+
+OVERRIDE_SQL = 'INSERT OR REPLACE INTO job_gitlab_override (jenkins_job_path, gitlab_config_id, gitlab_project_id) VALUES (?, ?, ?)'
+ITEM_SQL = '''
+    INSERT INTO release_plan_items (plan_id, jenkins_job_name, branch, operation, pod_num, build_params, triggered)
+    VALUES (?, ?, ?, ?, ?, ?, 0)
+'''
+PLAN_SQL = "INSERT INTO release_plans (scheduled_at, created_at, status) VALUES ('2026-01-01T00:00:00', '2026-01-01T00:00:00', 'pending')"
+
+
+def _job_paths(n):
+    return [f'c:team{i % 20}/job/svc-{i}' for i in range(n)]
+
+
+def _override_rows(config_id):
+    return [(path, config_id, str(i)) for i, path in enumerate(_job_paths(OVERRIDES))]
+
+
+def _item_rows():
+    return [(path, 'release/2026.10', '拉取代码-编译', '', '{"BRANCH_TAG": "release/2026.10"}') for path in _job_paths(ITEMS)]
+
+
+def overrides_loop(config_id):
+    with get_db() as conn:
+        cursor = conn.cursor()
+        for row in _override_rows(config_id):
+            cursor.execute(OVERRIDE_SQL, row)
+        conn.commit()
+
+
+def overrides_bulk(config_id):
+    with get_db() as conn:
+        conn.cursor().executemany(OVERRIDE_SQL, _override_rows(config_id))
+        conn.commit()
+
+
+def items_loop():
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(PLAN_SQL)
+        plan_id = cursor.lastrowid
+        for row in _item_rows():
+            cursor.execute(ITEM_SQL, (plan_id,) + row)
+        conn.commit()
+
+
+def items_bulk():
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute(PLAN_SQL)
+        plan_id = cursor.lastrowid
+        cursor.executemany(ITEM_SQL, [(plan_id,) + row for row in _item_rows()])
+        conn.commit()
+
+
+def measure(fn, *args):
+    fn(*args)  # 预热
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn(*args)
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    client = web.create_app(embedded=False).test_client()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO gitlab_configs (name, base_url, token) VALUES ('bench', 'http://gitlab.local', 't')")
+        config_id = cursor.lastrowid
+        conn.commit()
+    # 避免创建计划时访问 Jenkins
+    web.jenkins_clients.get_job_paths = lambda: set()
+
+    def api_overrides():
+        r = client.post('/api/job-gitlab-override/batch', json={
+            'job_paths': _job_paths(OVERRIDES), 'gitlab_config_id': config_id, 'gitlab_project_id': '1'})
+        assert r.status_code == 200, r.json
+
+    def api_plan():
+        r = client.post('/api/plans', json={
+            'scheduled_at': '2099-01-01T00:00:00',
+            'items': [{'jenkins_job_name': p, 'params': {'BRANCH_TAG': 'release/2026.10'}} for p in _job_paths(ITEMS)]})
+        assert r.status_code == 200, r.json
+
+    print(f'任务覆盖 {OVERRIDES} 条，计划项 {ITEMS} 条，每项取 {ROUNDS} 次中位数（毫秒）')
+    print(f'  覆盖  逐行 execute : {measure(overrides_loop, config_id):8.2f}')
+    print(f'  覆盖  executemany  : {measure(overrides_bulk, config_id):8.2f}')
+    print(f'  覆盖  接口整体     : {measure(api_overrides):8.2f}')
+    print(f'  计划项 逐行 execute: {measure(items_loop):8.2f}')
+    print(f'  计划项 executemany : {measure(items_bulk):8.2f}')
+    print(f'  创建计划 接口整体  : {measure(api_plan):8.2f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+数据库并发基准：一个线程模拟调度器持续写入（插入计划、逐项更新状态并提交），
+若干线程模拟接口请求读取计划列表，统计读延迟与写入吞吐。
+对比旧做法（每个 with 块新建连接、回滚日志模式）与当前 get_db（按线程复用连接、WAL、synchronous=NORMAL）
+
+    python benchmarks/bench_db_concurrency.py [每轮秒数，默认 5] [读线程数，默认 8]
+"""
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+SECONDS = float(sys.argv[1]) if len(sys.argv) > 1 else 5
+READERS = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_PATH'] = os.path.join(_tmp, 'bench.db')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+LIST_SQL = '''
+    SELECT p.id, p.scheduled_at, p.status, COUNT(i.id)
+    FROM release_plans p LEFT JOIN release_plan_items i ON i.plan_id = p.id
+    GROUP BY p.id ORDER BY p.id DESC LIMIT 100
+'''
+
+
+@contextmanager
+def legacy_get_db(path):
+    """旧实现：每次新建连接，默认回滚日志模式"""
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def seed(get_db):
+    with get_db() as conn:
+        for p in range(500):
+            cur = conn.execute("INSERT INTO release_plans (scheduled_at, created_at, status) VALUES ('2026-01-01 00:00', '2026-01-01 00:00', 'success')")
+            conn.executemany('INSERT INTO release_plan_items (plan_id, jenkins_job_name, triggered, success) VALUES (?, ?, 1, 1)',
+                             [(cur.lastrowid, f'folder/job/svc-{p}-{j}') for j in range(10)])
+
+
+def writer(get_db, stop, counter):
+    while not stop.is_set():
+        with get_db() as conn:
+            cur = conn.execute("INSERT INTO release_plans (scheduled_at, created_at, status) VALUES ('2026-01-01 00:00', '2026-01-01 00:00', 'running')")
+            plan_id = cur.lastrowid
+            conn.commit()
+        for j in range(5):
+            with get_db() as conn:
+                conn.execute('INSERT INTO release_plan_items (plan_id, jenkins_job_name, triggered, build_number) VALUES (?, ?, 1, ?)',
+                             (plan_id, f'folder/job/w-{j}', j))
+                conn.commit()
+            counter[0] += 1
+
+
+def reader(get_db, stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        with get_db() as conn:
+            conn.execute(LIST_SQL).fetchall()
+            conn.execute('SELECT * FROM release_plans WHERE id = ?', (1,)).fetchone()
+        latencies.append((time.perf_counter() - start) * 1000)
+
+
+def run(label, get_db):
+    stop = threading.Event()
+    counter = [0]
+    latencies = []
+    threads = [threading.Thread(target=writer, args=(get_db, stop, counter))]
+    threads += [threading.Thread(target=reader, args=(get_db, stop, latencies)) for _ in range(READERS)]
+    for t in threads:
+        t.start()
+    time.sleep(SECONDS)
+    stop.set()
+    for t in threads:
+        t.join()
+    latencies.sort()
+    p = lambda q: latencies[min(int(len(latencies) * q), len(latencies) - 1)]
+    print(f'{label}: 读 {len(latencies) / SECONDS:.0f} 次/秒, p50 {p(0.5):.2f} ms, p99 {p(0.99):.2f} ms, '
+          f'max {latencies[-1]:.2f} ms; 写入提交 {counter[0] / SECONDS:.0f} 次/秒')
+
+
+def main():
+    database.init_db()
+    seed(database.get_db)
+    legacy_path = os.path.join(_tmp, 'legacy.db')
+    # 旧库：结构相同，回滚日志模式
+    with legacy_get_db(legacy_path) as conn:
+        src = sqlite3.connect(database._db_path)
+        for (sql,) in src.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name NOT LIKE 'sqlite_%'"):
+            conn.execute(sql)
+        src.close()
+    seed(lambda: legacy_get_db(legacy_path))
+    run('旧实现（每次连接 + 回滚日志）', lambda: legacy_get_db(legacy_path))
+    run('get_db（连接复用 + WAL）', database.get_db)
+
+
+if __name__ == '__main__':
+    main()
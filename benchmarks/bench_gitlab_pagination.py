@@ -0,0 +1,72 @@
+"""
+GitLab 分支分页基准：本地模拟 GitLab（5000 个分支、每页响应带固定延迟），
+对比按 X-Next-Page 顺序翻页与按 X-Total-Pages 并发翻页
+
+    python benchmarks/bench_gitlab_pagination.py [分支数，默认 5000] [每页延迟毫秒，默认 30]
+"""
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from gitlab_client import GitLabClient  # noqa: E402
+
+TOTAL = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+LATENCY = (int(sys.argv[2]) if len(sys.argv) > 2 else 30) / 1000.0
+BRANCHES = [{'name': f'release/2026.{i:05d}', 'commit': {'committed_date': f'2026-01-01T00:00:{i % 60:02d}Z'}}
+            for i in range(TOTAL)]
+
+
+class FakeGitLab(BaseHTTPRequestHandler):
+    # 为 True 时不返回 X-Total-Pages（模拟 GitLab 对超大结果集的行为），只能顺序翻页
+    hide_total = False
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        per_page = int(query.get('per_page', ['20'])[0])
+        page = int(query.get('page', ['1'])[0])
+        total_pages = (TOTAL + per_page - 1) // per_page
+        body = json.dumps(BRANCHES[(page - 1) * per_page:page * per_page]).encode()
+        time.sleep(LATENCY)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if not FakeGitLab.hide_total:
+            self.send_header('X-Total-Pages', str(total_pages))
+        if page < total_pages:
+            self.send_header('X-Next-Page', str(page + 1))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def run(client, label):
+    start = time.perf_counter()
+    count = sum(1 for _ in client.iter_branches(1))
+    elapsed = time.perf_counter() - start
+    assert count == TOTAL, count
+    print(f'{label}: {count} 个分支, {elapsed * 1000:.0f} ms')
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGitLab)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = GitLabClient(f'http://127.0.0.1:{server.server_port}', 'token')
+    try:
+        FakeGitLab.hide_total = True
+        run(client, '顺序翻页 (X-Next-Page)')
+        FakeGitLab.hide_total = False
+        run(client, '并发翻页 (X-Total-Pages)')
+    finally:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""
+任务树内存与序列化基准：旧的嵌套 dict（每个节点保存完整 path/url） vs JobTree（平铺数组 + 缓存 JSON）
+
+    python benchmarks/bench_job_tree.py [任务数，默认 10000]
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_tree import JobTree, FOLDER, JOB  # noqa: E402
+
+BASE_URL = 'http://jenkins.example.com:8080'
+
+
+def synthetic_layout(total_jobs):
+    """三层目录：10 个业务线 / 每个 10 个子目录 / 其余为任务"""
+    per_folder = max(total_jobs // 100, 1)
+    for a in range(10):
+        for b in range(10):
+            yield f'business-line-{a}', f'service-group-{b}', [f'service-{a}-{b}-{c}-deploy' for c in range(per_folder)]
+
+
+def build_nested(total_jobs):
+    tree = {}
+    for a, b, jobs in synthetic_layout(total_jobs):
+        top = tree.setdefault(a, {'name': a, 'path': a, 'type': 'folder', 'children': []})
+        sub_path = f'{a}/job/{b}'
+        sub = {'name': b, 'path': sub_path, 'type': 'folder', 'children': []}
+        top['children'].append(sub)
+        for name in jobs:
+            path = f'{sub_path}/job/{name}'
+            sub['children'].append({'name': name, 'path': path, 'url': f'{BASE_URL}/job/{path}/', 'type': 'job'})
+    return list(tree.values())
+
+
+def build_compact(total_jobs):
+    tree = JobTree('', BASE_URL)
+    tops = {}
+    for a, b, jobs in synthetic_layout(total_jobs):
+        if a not in tops:
+            tops[a] = tree.add(-1, a, FOLDER)
+        sub = tree.add(tops[a], b, FOLDER)
+        for name in jobs:
+            tree.add(sub, name, JOB)
+    return tree
+
+
+def measure_memory(builder, total_jobs):
+    tracemalloc.start()
+    obj = builder(total_jobs)
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return obj, size
+
+
+def timeit(fn, repeat=20):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    total_jobs = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    nested, nested_bytes = measure_memory(build_nested, total_jobs)
+    compact, compact_bytes = measure_memory(build_compact, total_jobs)
+    assert json.loads(compact.json_bytes()) == nested
+
+    print(f'节点数: {len(compact)}')
+    print(f'内存: 嵌套 dict {nested_bytes / 1024:.0f} KiB, JobTree {compact_bytes / 1024:.0f} KiB '
+          f'({nested_bytes / compact_bytes:.1f}x)')
+    print(f'每次请求序列化: json.dumps(嵌套 dict) {timeit(lambda: json.dumps(nested).encode()):.2f} ms, '
+          f'JobTree.json_bytes()（已缓存）{timeit(compact.json_bytes, 1000):.4f} ms')
+    print(f'首次序列化 JobTree: {timeit(lambda: JobTree.json_bytes(_fresh_copy(compact))):.2f} ms')
+    print(f'job_paths(): {timeit(compact.job_paths):.2f} ms')
+
+
+def _fresh_copy(tree):
+    copy = JobTree(tree.path_prefix, tree.base_url)
+    copy.parents, copy.names, copy.kinds = tree.parents, tree.names, tree.kinds
+    return copy
+
+
+if __name__ == '__main__':
+    main()
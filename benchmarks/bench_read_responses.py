@@ -0,0 +1,79 @@
+"""
+读接口响应基准：任务树（/api/jenkins/jobs）与全部分支（/api/gitlab/branches）。
+分别统计不压缩、gzip 压缩与带 If-None-Match 命中 304 时的接口耗时和响应字节数；
+另对比 json 标准库与 orjson（已安装时）序列化分支列表的耗时
+
+    python benchmarks/bench_read_responses.py [任务数，默认 20000] [分支数，默认 5000] [重复次数，默认 50]
+"""
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+JOBS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+BRANCHES = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+ROUNDS = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+
+_tmp = tempfile.mkdtemp()
+os.environ['DATABASE_PATH'] = os.path.join(_tmp, 'bench.db')
+os.environ['FEISHU_WEBHOOK_URL'] = ''
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app as web  # noqa: E402
+import http_cache  # noqa: E402
+from branch_index import BranchIndex  # noqa: E402
+
+
+def _job_tree():
+    folders = []
+    for f in range(JOBS // 100 or 1):
+        children = [{'name': f'svc-{f}-{i}', 'path': f'team{f}/job/svc-{f}-{i}', 'type': 'job'} for i in range(100)]
+        folders.append({'name': f'team{f}', 'path': f'team{f}', 'type': 'folder', 'children': children})
+    return json.dumps(folders, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def measure(fn):
+    fn()  # 预热
+    samples = []
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples)
+
+
+def main():
+    tree = _job_tree()
+    web.jenkins_clients.get_jobs_json = lambda: (tree, 'bench-v1')
+    branches = [{'name': f'release/2026.{i // 30 + 1}.{i % 30}', 'committed_date': '2026-10-01T00:00:00Z'}
+                for i in range(BRANCHES)]
+    index = BranchIndex(branches)
+    web.gitlab_cache.get_branch_index = lambda config_id, project_id: index
+    client = web.create_app(embedded=False).test_client()
+
+    print(f'任务 {JOBS} 个，分支 {BRANCHES} 个，每项取 {ROUNDS} 次中位数')
+    for label, url in (('任务树', '/api/jenkins/jobs'), ('全部分支', '/api/gitlab/branches?config_id=1&project_id=1')):
+        plain = client.get(url)
+        etag = plain.headers['ETag']
+        zipped = client.get(url, headers={'Accept-Encoding': 'gzip'})
+        cached = client.get(url, headers={'If-None-Match': etag})
+        print(f'  {label}')
+        print(f'    不压缩         : {measure(lambda: client.get(url)):8.2f} ms  {len(plain.data):>9} 字节')
+        print(f'    gzip           : {measure(lambda: client.get(url, headers={"Accept-Encoding": "gzip"})):8.2f} ms'
+              f'  {len(zipped.data):>9} 字节')
+        print(f'    304            : {measure(lambda: client.get(url, headers={"If-None-Match": etag})):8.2f} ms'
+              f'  {len(cached.data):>9} 字节')
+
+    payload = {'success': True, 'data': [b['name'] for b in branches]}
+    print('  分支列表序列化')
+    print(f'    json 标准库    : {measure(lambda: json.dumps(payload, ensure_ascii=False).encode("utf-8")):8.2f} ms')
+    if http_cache.orjson is not None:
+        print(f'    orjson         : {measure(lambda: http_cache.dumps(payload)):8.2f} ms')
+    else:
+        print('    orjson         : 未安装')
+
+
+if __name__ == '__main__':
+    main()
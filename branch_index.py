@@ -0,0 +1,96 @@
+"""
+GitLab 分支名搜索索引
+在缓存的分支列表上构建一次：按名称排序的数组（前缀二分查找）+ 按 '/'、'-'、'_'、'.' 切分出的分段前缀数组。
+查询结果按「整名前缀 > 分段前缀」分组，组内按最近提交时间倒序
+"""
+import bisect
+import heapq
+import re
+from datetime import datetime
+
+# 分段边界：release/2026.10 可由 "2026" 或 "10" 命中
+_SEGMENT_SEP = re.compile(r'[/\-_.]')
+
+
+def _commit_ts(value):
+    """GitLab committed_date（ISO 8601）转时间戳，无法解析时为 0"""
+    if not value:
+        return 0.0
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return 0.0
+
+
+class BranchIndex:
+    """branches 为 [{'name', 'committed_date'}, ...]；查询不区分大小写"""
+
+    __slots__ = ('branches', '_keys', '_key_ids', '_segments', '_segment_ids', '_by_recency', '_recency_rank')
+
+    def __init__(self, branches):
+        self.branches = branches
+        # 按最近提交时间倒序的分支下标及每个分支的名次（0 为最新）
+        self._by_recency = sorted(range(len(branches)),
+                                  key=lambda i: _commit_ts(branches[i].get('committed_date')), reverse=True)
+        self._recency_rank = [0] * len(branches)
+        for rank, i in enumerate(self._by_recency):
+            self._recency_rank[i] = rank
+
+        names = sorted((b['name'].lower(), i) for i, b in enumerate(branches))
+        self._keys = [k for k, _ in names]
+        self._key_ids = [i for _, i in names]
+
+        segments = []
+        for i, b in enumerate(branches):
+            lower = b['name'].lower()
+            for m in _SEGMENT_SEP.finditer(lower):
+                if m.end() < len(lower):
+                    segments.append((lower[m.end():], i))
+        segments.sort()
+        self._segments = [k for k, _ in segments]
+        self._segment_ids = [i for _, i in segments]
+
+    def __len__(self):
+        return len(self.branches)
+
+    @staticmethod
+    def _prefix_range(keys, prefix):
+        lo = bisect.bisect_left(keys, prefix)
+        hi = bisect.bisect_left(keys, prefix + '\uffff', lo)
+        return lo, hi
+
+    def _most_recent(self, ids, limit):
+        """集合 ids 中最近提交的 limit 个，新到旧"""
+        if limit <= 0 or not ids:
+            return []
+        if len(ids) * 8 < len(self.branches):
+            return heapq.nsmallest(limit, ids, key=self._recency_rank.__getitem__)
+        # 命中面很广时按新到旧顺序扫描，取满即停
+        out = []
+        for i in self._by_recency:
+            if i in ids:
+                out.append(i)
+                if len(out) == limit:
+                    break
+        return out
+
+    def search(self, q, limit=20):
+        """返回 (匹配的分支名列表（最多 limit 个）, 匹配总数)。q 为空时返回最近提交的分支"""
+        q = (q or '').strip().lower()
+        if not q:
+            return [self.branches[i]['name'] for i in self._by_recency[:limit]], len(self.branches)
+
+        lo, hi = self._prefix_range(self._keys, q)
+        # 与搜索词完全相同的分支排最前
+        exact = []
+        while lo < hi and self._keys[lo] == q:
+            exact.append(self._key_ids[lo])
+            lo += 1
+        prefix_ids = set(self._key_ids[lo:hi])
+        slo, shi = self._prefix_range(self._segments, q)
+        segment_ids = set(self._segment_ids[slo:shi]).difference(exact, prefix_ids)
+
+        out = exact[:limit]
+        out += self._most_recent(prefix_ids, limit - len(out))
+        out += self._most_recent(segment_ids, limit - len(out))
+        return [self.branches[i]['name'] for i in out], len(exact) + len(prefix_ids) + len(segment_ids)
@@ -0,0 +1,161 @@
+"""
+Jenkins 构建事件（推送）
+接收 Jenkins Notification 插件 / 通用 Webhook 推送的构建开始、结束事件，
+按 (job_path, build_number) 记录并唤醒正在等待该构建结果的发版计划，轮询仅作为兜底
+"""
+import logging
+import threading
+import time
+from urllib.parse import urlparse
+
+logger = logging.getLogger(__name__)
+
+# 视为构建结束的阶段（Notification 插件：QUEUED / STARTED / COMPLETED / FINALIZED）
+FINISHED_PHASES = ('COMPLETED', 'FINALIZED')
+
+
+def _job_path_from_url(url):
+    """Jenkins 任务/构建 URL（如 job/a/job/b/ 或 http://host/job/a/job/b/12/）转为本应用的 job_path（a/job/b）"""
+    path = urlparse(url).path if '://' in url else url
+    parts = [p for p in path.strip('/').split('/') if p]
+    # 去掉末尾的构建号
+    if parts and parts[-1].isdigit() and len(parts) >= 2 and parts[-2] != 'job':
+        parts = parts[:-1]
+    if 'job' not in parts:
+        return None
+    parts = parts[parts.index('job') + 1:]
+    return '/'.join(parts) or None
+
+
+def parse_jenkins_event(payload):
+    """解析推送事件，返回 {job_path, build_number, phase, result, queue_id}；无法识别返回 None。
+    支持 Notification 插件格式（name/url/build{number,phase,status,queue_id}）与通用格式
+    （job_path|job_name, build_number|number, phase|event, result|status）"""
+    if not isinstance(payload, dict):
+        return None
+    build = payload.get('build')
+    if isinstance(build, dict):
+        job_path = _job_path_from_url(payload.get('url') or '') or _job_path_from_url(build.get('url') or '')
+        if not job_path and build.get('full_url'):
+            job_path = _job_path_from_url(build['full_url'])
+        number = build.get('number')
+        phase = build.get('phase')
+        result = build.get('status')
+        queue_id = build.get('queue_id')
+    else:
+        job_path = payload.get('job_path') or payload.get('job_name') or payload.get('job')
+        number = payload.get('build_number', payload.get('number'))
+        phase = payload.get('phase') or payload.get('event')
+        result = payload.get('result') or payload.get('status')
+        queue_id = payload.get('queue_id')
+    try:
+        number = int(number)
+    except (TypeError, ValueError):
+        return None
+    if not job_path:
+        return None
+    phase = (phase or '').strip().upper()
+    result = (result or '').strip().upper() or None
+    if not phase:
+        phase = 'COMPLETED' if result else 'STARTED'
+    return {
+        'job_path': job_path.strip().strip('/'),
+        'build_number': number,
+        'phase': phase,
+        'result': result,
+        'queue_id': int(queue_id) if str(queue_id or '').isdigit() else None,
+    }
+
+
+class BuildEventHub:
+    """构建事件中转：记录最近收到的构建事件，等待方通过 wait_for 被即时唤醒"""
+
+    def __init__(self, retention_seconds=3600, max_entries=5000):
+        self._cond = threading.Condition()
+        self._builds = {}  # (job_path, build_number) -> {'phase', 'result', 'received_at'}
+        self._queue = {}  # queue_id -> (job_path, build_number)
+        self._watching = {}  # (job_path, build_number) -> 等待方计数
+        self._retention = retention_seconds
+        self._max_entries = max_entries
+        self.received = 0
+        self.last_received_at = None
+
+    def publish(self, event):
+        """记录一条已解析的事件并唤醒等待方。返回该构建当前是否有计划在等待"""
+        key = (event['job_path'], event['build_number'])
+        now = time.time()
+        with self._cond:
+            entry = self._builds.get(key) or {}
+            # 已结束的构建不被迟到的 STARTED 事件覆盖
+            if entry.get('phase') not in FINISHED_PHASES or event['phase'] in FINISHED_PHASES:
+                entry = {'phase': event['phase'], 'result': event['result'] or entry.get('result'), 'received_at': now}
+            self._builds[key] = entry
+            if event.get('queue_id') is not None:
+                self._queue[event['queue_id']] = key
+            self.received += 1
+            self.last_received_at = now
+            self._prune(now)
+            self._cond.notify_all()
+            return key in self._watching
+
+    def _prune(self, now):
+        if len(self._builds) <= self._max_entries:
+            return
+        expired = [k for k, v in self._builds.items()
+                   if now - v['received_at'] > self._retention and k not in self._watching]
+        for k in expired:
+            self._builds.pop(k, None)
+        self._queue = {q: k for q, k in self._queue.items() if k in self._builds}
+
+    def get_result(self, job_path, build_number):
+        """构建已推送结束事件时返回 result（SUCCESS/FAILURE/ABORTED/...），否则返回 None"""
+        with self._cond:
+            entry = self._builds.get((job_path, build_number))
+        if entry and entry['phase'] in FINISHED_PHASES:
+            return entry['result'] or 'UNKNOWN'
+        return None
+
+    def build_number_for_queue(self, queue_id):
+        """由 queue item id 查已开始构建的 build number（需事件中携带 queue_id）"""
+        with self._cond:
+            key = self._queue.get(queue_id)
+        return key[1] if key else None
+
+    def watch(self, keys):
+        with self._cond:
+            for key in keys:
+                self._watching[key] = self._watching.get(key, 0) + 1
+
+    def unwatch(self, keys):
+        with self._cond:
+            for key in keys:
+                n = self._watching.get(key, 0) - 1
+                if n > 0:
+                    self._watching[key] = n
+                else:
+                    self._watching.pop(key, None)
+
+    def wait_for(self, keys, timeout):
+        """等待 keys 中任一构建收到结束事件，收到返回 True，超时返回 False"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                if any(self._builds.get(k, {}).get('phase') in FINISHED_PHASES for k in keys):
+                    return True
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+
+    def wait_for_queue(self, queue_id, timeout):
+        """等待 queue item 开始构建，返回 build number 或 None（超时）"""
+        deadline = time.time() + timeout
+        with self._cond:
+            while True:
+                key = self._queue.get(queue_id)
+                if key:
+                    return key[1]
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
@@ -0,0 +1,108 @@
+"""
+进程内缓存
+带过期时间（TTL）的简单键值缓存，线程安全，供 Jenkins / GitLab 客户端复用
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    """同一 key 正在进行中的加载，后来的调用方等待其结果"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class TTLCache:
+    """按 key 缓存值，超过 ttl 秒视为过期；支持按 key 或整体失效。
+    get_or_load 对同一 key 的并发未命中只加载一次，加载失败时回退到过期的旧值。
+    max_entries 不为空时按最近使用淘汰（key 来自用户输入时避免过期条目无限累积）"""
+
+    def __init__(self, ttl, max_entries=None):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (value, stored_at)，最近使用的在末尾
+        self._flights = {}  # key -> _Flight
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """返回未过期的缓存值，不存在或已过期返回 None"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                self._data.move_to_end(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        if time.time() - stored_at >= self.ttl:
+            return None
+        return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.time())
+            self._data.move_to_end(key)
+            if self.max_entries is not None:
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+
+    def get_or_load(self, key, loader):
+        """命中未过期缓存直接返回；否则调用 loader() 加载并缓存。
+        并发未命中时只有一个调用方执行 loader，其余等待同一结果；loader 失败且有过期旧值时返回旧值"""
+        value = self.get(key)
+        if value is not None:
+            return value
+        with self._lock:
+            flight = self._flights.get(key)
+            owner = flight is None
+            if owner:
+                flight = self._flights[key] = _Flight()
+        if not owner:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = loader()
+            self.set(key, flight.value)
+            return flight.value
+        except Exception as e:
+            with self._lock:
+                stale = self._data.get(key)
+            if stale is not None:
+                logger.warning(f"缓存加载失败，使用过期数据: key={key!r}, 错误: {e}")
+                flight.value = stale[0]
+                return flight.value
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def invalidate(self, key=None):
+        """失效单个 key；key 为 None 时清空全部。返回被清除的条目数"""
+        with self._lock:
+            if key is None:
+                n = len(self._data)
+                self._data.clear()
+                return n
+            return 1 if self._data.pop(key, None) is not None else 0
+
+    def invalidate_where(self, predicate):
+        """失效所有 predicate(key) 为真的条目，返回被清除的条目数"""
+        with self._lock:
+            keys = [k for k in self._data if predicate(k)]
+            for k in keys:
+                del self._data[k]
+            return len(keys)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
@@ -0,0 +1,90 @@
+"""
+多 worker 之间的缓存失效同步
+配置写接口在写入配置的同一事务里追加一条失效记录（cache_invalidations），并立即失效本进程的缓存；
+其他进程在处理请求前（至多每 CACHE_SYNC_INTERVAL 秒一次）读取新记录，执行同样的失效。
+记录保留 24 小时：更早的记录对应的缓存早已按 TTL 过期
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+
+from config import Config
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+FOLDER_CONFIG = 'folder_config'
+GITLAB_CONFIG = 'gitlab_config'
+GITLAB_PROJECTS = 'gitlab_projects'
+GITLAB_ALL = 'gitlab_all'
+JENKINS_CONTROLLER = 'jenkins_controller'
+JENKINS_PARAMS = 'jenkins_params'
+
+_RETENTION_HOURS = 24
+
+
+def _origin():
+    # gunicorn 的 worker 由 fork 产生，每次取当前 pid
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def record_invalidation(conn, scope, payload=None):
+    """追加一条失效记录（不提交，由调用方与配置变更一起提交）"""
+    conn.execute(
+        'INSERT INTO cache_invalidations (scope, payload, origin, created_ms) VALUES (?, ?, ?, ?)',
+        (scope, json.dumps(payload, ensure_ascii=False) if payload is not None else None, _origin(),
+         int(time.time() * 1000))
+    )
+
+
+def prune_cache_invalidations():
+    """删除超过保留时长的记录，返回删除条数"""
+    cutoff = int((time.time() - _RETENTION_HOURS * 3600) * 1000)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM cache_invalidations WHERE created_ms < ?', (cutoff,))
+        conn.commit()
+        return cursor.rowcount
+
+
+class CacheInvalidationSync:
+    """apply(scope, payload) 失效本进程的缓存；sync() 执行其他进程写入的新记录"""
+
+    def __init__(self, apply, interval=None):
+        self.apply = apply
+        self.interval = Config.CACHE_SYNC_INTERVAL if interval is None else interval
+        self.last_id = None
+        self._checked = 0
+        self._lock = threading.Lock()
+
+    def sync(self):
+        # 同一时刻只需一个线程读取，其余线程直接使用当前缓存
+        if time.time() - self._checked < self.interval or not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._checked = time.time()
+            with get_db() as conn:
+                if self.last_id is None:
+                    # 进程启动时缓存为空，从当前最新记录开始
+                    self.last_id = conn.execute('SELECT MAX(id) FROM cache_invalidations').fetchone()[0] or 0
+                    return
+                rows = conn.execute(
+                    'SELECT id, scope, payload, origin FROM cache_invalidations WHERE id > ? ORDER BY id',
+                    (self.last_id,)
+                ).fetchall()
+            origin = _origin()
+            for row in rows:
+                self.last_id = row['id']
+                if row['origin'] == origin:
+                    continue
+                try:
+                    self.apply(row['scope'], json.loads(row['payload']) if row['payload'] else {})
+                except Exception as e:
+                    logger.warning(f"同步缓存失效失败: {row['scope']} {row['payload']}: {e}")
+        except Exception as e:
+            logger.warning(f"读取缓存失效记录失败: {e}")
+        finally:
+            self._lock.release()
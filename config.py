@@ -9,14 +9,46 @@ class Config:
     JENKINS_URL = os.getenv('JENKINS_URL', 'http://localhost:8080')
     JENKINS_API_TOKEN = os.getenv('JENKINS_API_TOKEN', '')
     JENKINS_USERNAME = os.getenv('JENKINS_USERNAME', '')
+    # 单个 Jenkins 控制器的最大并发请求数（连接池大小）
+    JENKINS_MAX_CONCURRENCY = int(os.getenv('JENKINS_MAX_CONCURRENCY', '8'))
+    # 任务参数定义缓存时间（秒）及批量获取时的并发数
+    JOB_PARAMS_CACHE_TTL = int(os.getenv('JOB_PARAMS_CACHE_TTL', '300'))
+    JOB_PARAMS_FETCH_WORKERS = int(os.getenv('JOB_PARAMS_FETCH_WORKERS', '8'))
+    # 文件夹配置（参数配置/分支来源/任务覆盖）快照的缓存时间（秒）；经本服务接口修改时立即失效
+    FOLDER_CONFIG_CACHE_TTL = int(os.getenv('FOLDER_CONFIG_CACHE_TTL', '300'))
+    # 多 worker 部署时，各进程读取其他进程写入的缓存失效记录的最短间隔（秒）
+    CACHE_SYNC_INTERVAL = float(os.getenv('CACHE_SYNC_INTERVAL', '1'))
     
     # 飞书配置（默认使用指定 webhook，可通过环境变量覆盖）
     FEISHU_WEBHOOK_URL = os.getenv('FEISHU_WEBHOOK_URL', 'https://open.feishu.cn/open-apis/bot/v2/hook/2f0c4e4e-763c-4dbc-90cc-5c8f91231dbd')
     # 发版计划列表/详情页基础 URL，用于飞书卡片「查看计划」链接（留空则仅文案，不生成可点击链接）
     APP_BASE_URL = os.getenv('APP_BASE_URL', '').rstrip('/')
+    # 飞书通知发件箱：后台投递线程的轮询间隔（秒）、同一 webhook 两次发送的最小间隔（秒）、
+    # 失败重试的初始退避（秒，逐次翻倍，最长 10 分钟）与最多尝试次数、被限流且未给出 Retry-After 时的暂停时间（秒）
+    FEISHU_OUTBOX_POLL_INTERVAL = float(os.getenv('FEISHU_OUTBOX_POLL_INTERVAL', '1'))
+    FEISHU_MIN_SEND_INTERVAL = float(os.getenv('FEISHU_MIN_SEND_INTERVAL', '0.25'))
+    FEISHU_OUTBOX_RETRY_BASE = float(os.getenv('FEISHU_OUTBOX_RETRY_BASE', '5'))
+    FEISHU_OUTBOX_MAX_ATTEMPTS = int(os.getenv('FEISHU_OUTBOX_MAX_ATTEMPTS', '8'))
+    FEISHU_RATE_LIMIT_BACKOFF = float(os.getenv('FEISHU_RATE_LIMIT_BACKOFF', '10'))
+    # 发版开始/结束通知延迟 FEISHU_COALESCE_WINDOW 秒投递，期间同一 webhook 的多条合并为一张汇总卡片（0 表示不合并）；
+    # 卡片详情与汇总最多展示的行数
+    FEISHU_COALESCE_WINDOW = float(os.getenv('FEISHU_COALESCE_WINDOW', '10'))
+    FEISHU_MAX_DETAIL_LINES = int(os.getenv('FEISHU_MAX_DETAIL_LINES', '30'))
+    
+    # GitLab 列表接口翻页时并发拉取的页数
+    GITLAB_PAGE_WORKERS = int(os.getenv('GITLAB_PAGE_WORKERS', '4'))
+    # 单个 GitLab 配置的最大并发请求数（连接池大小）
+    GITLAB_MAX_CONCURRENCY = int(os.getenv('GITLAB_MAX_CONCURRENCY', '8'))
+    # GitLab 分支/项目列表缓存时间（秒）；push webhook（/api/gitlab/hooks）校验用的 Secret token
+    GITLAB_CACHE_TTL = int(os.getenv('GITLAB_CACHE_TTL', '300'))
+    GITLAB_WEBHOOK_TOKEN = os.getenv('GITLAB_WEBHOOK_TOKEN', '')
     
     # 数据库配置
     DATABASE_PATH = os.getenv('DATABASE_PATH', '/data/release_plans.db')
+    # SQLite 连接参数：等待写锁的超时（毫秒）、内存映射读取大小（字节）、每个连接缓存的预编译语句数
+    DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+    DB_CACHED_STATEMENTS = int(os.getenv('DB_CACHED_STATEMENTS', '256'))
     
     # 时区配置（统一使用东八区）
     TZ = os.getenv('TZ', 'Asia/Shanghai')
@@ -24,8 +56,43 @@ class Config:
     # 轮询配置
     POLL_INTERVAL = int(os.getenv('POLL_INTERVAL', '20'))  # 秒
     POLL_TIMEOUT = int(os.getenv('POLL_TIMEOUT', '1800'))  # 秒，30分钟
+    # Jenkins 构建事件推送（/api/jenkins/events）：开启且配置 token 后接口才接收推送；
+    # 推送只用于唤醒轮询（结果仍向 Jenkins 确认），轮询降为低频兜底
+    JENKINS_EVENTS_ENABLED = os.getenv('JENKINS_EVENTS_ENABLED', '').lower() in ('1', 'true', 'yes')
+    JENKINS_EVENTS_TOKEN = os.getenv('JENKINS_EVENTS_TOKEN', '')
+    EVENT_SAFETY_POLL_INTERVAL = int(os.getenv('EVENT_SAFETY_POLL_INTERVAL', '120'))  # 秒
+    
+    # 构建日志实时查看：增量拉取间隔（秒）、单个构建日志缓冲上限（字节）、最多缓存的构建数
+    LOG_STREAM_INTERVAL = float(os.getenv('LOG_STREAM_INTERVAL', '2'))
+    LOG_STREAM_BUFFER_BYTES = int(os.getenv('LOG_STREAM_BUFFER_BYTES', str(2 * 1024 * 1024)))
+    LOG_STREAM_MAX_BUILDS = int(os.getenv('LOG_STREAM_MAX_BUILDS', '20'))
+    # 计划状态实时推送（/api/plans/stream）：读取新事件的间隔（秒）、事件保留时长（小时，用于断线续传）
+    PLAN_EVENTS_POLL_INTERVAL = float(os.getenv('PLAN_EVENTS_POLL_INTERVAL', '1'))
+    PLAN_EVENTS_RETENTION_HOURS = int(os.getenv('PLAN_EVENTS_RETENTION_HOURS', '24'))
+    # 任务树、计划列表、分支、字典等读接口的响应超过该字节数时按 Accept-Encoding 压缩
+    RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+    
+    # 历史计划归档：已结束且计划时间超过 RETENTION_DAYS 天的计划移入归档表（默认 0，不归档）；
+    # 每隔 RETENTION_INTERVAL 秒执行一次，每批 RETENTION_BATCH_SIZE 个计划一个事务，
+    # 每次至多 RETENTION_MAX_BATCHES 批，未归档完的在下一轮扫描后继续，不阻塞调度扫描
+    RETENTION_DAYS = int(os.getenv('RETENTION_DAYS', '0'))
+    RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '3600'))
+    RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', '100'))
+    RETENTION_MAX_BATCHES = int(os.getenv('RETENTION_MAX_BATCHES', '5'))
     
     # 调度器配置
     SCHEDULER_INTERVAL = int(os.getenv('SCHEDULER_INTERVAL', '60'))  # 秒，每分钟扫描一次
     # 执行中超过该分钟数且全部未触发时发送飞书提醒
     STUCK_REMINDER_MINUTES = int(os.getenv('STUCK_REMINDER_MINUTES', '15'))
+    # 是否在 Web 进程内运行调度器与通知投递（单进程部署）；设为 false 时另行运行 python -m scheduler，
+    # Web 可多 worker 部署，两者通过数据库中的命令表通信
+    EMBEDDED_SCHEDULER = os.getenv('EMBEDDED_SCHEDULER', 'true').lower() in ('1', 'true', 'yes')
+    # 调度服务领取 Web 命令的轮询间隔（秒）与心跳上报间隔（秒）
+    SCHEDULER_COMMAND_POLL_INTERVAL = float(os.getenv('SCHEDULER_COMMAND_POLL_INTERVAL', '1'))
+    SCHEDULER_HEARTBEAT_INTERVAL = int(os.getenv('SCHEDULER_HEARTBEAT_INTERVAL', '10'))
+    # 同时执行的计划数上限（定时到点与立即执行共用），超出的排队等待
+    PLAN_EXECUTION_WORKERS = int(os.getenv('PLAN_EXECUTION_WORKERS', '4'))
+    # 调度器停止时等待执行中的计划中断退出的最长时间（秒）
+    PLAN_EXECUTION_SHUTDOWN_TIMEOUT = int(os.getenv('PLAN_EXECUTION_SHUTDOWN_TIMEOUT', '30'))
+    # 启动时只续跑开始执行不超过该秒数的 running 计划（默认同 POLL_TIMEOUT），更早的留给卡住提醒人工处理
+    PLAN_RESUME_WINDOW = int(os.getenv('PLAN_RESUME_WINDOW', str(POLL_TIMEOUT)))
@@ -3,20 +3,57 @@
 使用 SQLite 存储发版计划
 """
 import os
+import json
+import logging
 import sqlite3
+import threading
 from contextlib import contextmanager
+from datetime import datetime
+import pytz
 from config import Config
+from job_stats import week_key
+
+try:
+    import fcntl
+except ImportError:  # Windows 本地开发：单进程运行，不加迁移锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
 
 _db_path = Config.DATABASE_PATH
 
 # 确保数据库目录存在
 os.makedirs(os.path.dirname(_db_path) if os.path.dirname(_db_path) else '.', exist_ok=True)
 
+# 每个线程复用自己的连接：_local.conns[i] 为嵌套深度 i 使用的连接，_local.depth 为当前嵌套深度
+_local = threading.local()
+
+
+def _connect():
+    """新建连接并设置会话级 PRAGMA（WAL 下读写互不阻塞，synchronous=NORMAL 提交时不再每次 fsync）"""
+    conn = sqlite3.connect(_db_path, check_same_thread=False, cached_statements=Config.DB_CACHED_STATEMENTS)
+    conn.row_factory = sqlite3.Row
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA busy_timeout={int(Config.DB_BUSY_TIMEOUT_MS)}')
+    conn.execute(f'PRAGMA mmap_size={int(Config.DB_MMAP_SIZE)}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+
 @contextmanager
 def get_db():
-    """获取数据库连接"""
-    conn = sqlite3.connect(_db_path, check_same_thread=False)
-    conn.row_factory = sqlite3.Row
+    """获取数据库连接。连接按线程复用（不再每次 connect/close），预编译语句随连接缓存；
+    块内嵌套调用 get_db 时使用同线程的另一条连接，事务边界与以前每次新建连接时一致"""
+    conns = getattr(_local, 'conns', None)
+    if conns is None:
+        conns = _local.conns = []
+        _local.depth = 0
+    depth = _local.depth
+    if depth == len(conns):
+        conns.append(_connect())
+    conn = conns[depth]
+    _local.depth = depth + 1
     try:
         yield conn
         conn.commit()
@@ -24,140 +61,485 @@ def get_db():
         conn.rollback()
         raise
     finally:
-        conn.close()
+        _local.depth = depth
 
-def init_db():
-    """初始化数据库表"""
-    with get_db() as conn:
-        cursor = conn.cursor()
-        
-        # 创建发版计划表
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS release_plans (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                scheduled_at TEXT NOT NULL,
-                created_at TEXT NOT NULL,
-                status TEXT NOT NULL DEFAULT 'pending',
-                default_branch TEXT,
-                feishu_webhook TEXT
-            )
-        ''')
-        
-        # 创建计划项表
+
+def epoch_ms(value):
+    """计划时间（datetime 或 ISO 字符串）转为毫秒时间戳；不带时区的按东八区处理"""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = pytz.timezone('Asia/Shanghai').localize(value)
+    return int(value.timestamp() * 1000)
+
+
+def _add_column(conn, table, column, decl):
+    """列不存在时添加（幂等）"""
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        conn.execute(f'ALTER TABLE {table} ADD COLUMN {column} {decl}')
+
+
+def _batched_ids(conn, sql, batch_size):
+    """按 id 分批遍历 sql（形如 SELECT ... WHERE id > ? ... ORDER BY id LIMIT ?，首列为 id）的结果，
+    每批由调用方处理并提交，大表迁移时不会长时间持有写锁"""
+    last_id = 0
+    while True:
+        rows = conn.execute(sql, (last_id, batch_size)).fetchall()
+        if not rows:
+            return
+        yield rows
+        conn.commit()
+        last_id = rows[-1][0]
+
+
+def _m001_base_tables(conn):
+    """基础表（历史版本中已存在的表按原结构创建，列的后续变化由之后的迁移补齐）"""
+    cursor = conn.cursor()
+    # 创建发版计划表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS release_plans (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scheduled_at TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            default_branch TEXT,
+            feishu_webhook TEXT
+        )
+    ''')
+    # 创建计划项表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS release_plan_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_id INTEGER NOT NULL,
+            jenkins_job_name TEXT NOT NULL,
+            branch TEXT,
+            operation TEXT,
+            pod_num TEXT,
+            triggered INTEGER DEFAULT 0,
+            build_number INTEGER,
+            success INTEGER,
+            failure_reason TEXT,
+            FOREIGN KEY (plan_id) REFERENCES release_plans(id) ON DELETE CASCADE
+        )
+    ''')
+    # 旧表：文件夹代码仓库类型（后续迁移到 folder_configs）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS folder_repo_config (
+            folder_path TEXT PRIMARY KEY,
+            repo_type TEXT NOT NULL
+        )
+    ''')
+    # GitLab 连接配置
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS gitlab_configs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            base_url TEXT NOT NULL,
+            token TEXT NOT NULL,
+            ssl_verify INTEGER DEFAULT 1
+        )
+    ''')
+    # 配置字典（通用下拉数据源）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS config_dictionaries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            description TEXT,
+            items TEXT NOT NULL
+        )
+    ''')
+    # Jenkins 自定义参数配置（由 GitLab 配置衍生，param_definitions 为 JSON）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS jenkins_param_configs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            gitlab_config_id INTEGER,
+            param_definitions TEXT NOT NULL,
+            FOREIGN KEY (gitlab_config_id) REFERENCES gitlab_configs(id)
+        )
+    ''')
+    # 文件夹挂载配置（替代 folder_repo_config）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS folder_configs (
+            folder_path TEXT PRIMARY KEY,
+            jenkins_param_config_id INTEGER NOT NULL,
+            gitlab_config_id INTEGER,
+            gitlab_project_id INTEGER,
+            FOREIGN KEY (jenkins_param_config_id) REFERENCES jenkins_param_configs(id),
+            FOREIGN KEY (gitlab_config_id) REFERENCES gitlab_configs(id)
+        )
+    ''')
+    # 任务级 GitLab 项目覆盖
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS job_gitlab_override (
+            jenkins_job_path TEXT PRIMARY KEY,
+            gitlab_config_id INTEGER NOT NULL,
+            gitlab_project_id INTEGER NOT NULL,
+            FOREIGN KEY (gitlab_config_id) REFERENCES gitlab_configs(id)
+        )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_plan_status ON release_plans(status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_plan_scheduled ON release_plans(scheduled_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_item_plan_id ON release_plan_items(plan_id)')
+
+
+def _m002_plan_columns(conn):
+    """自定义构建参数、执行开始时间/卡住提醒、串行/并行发版方式"""
+    _add_column(conn, 'release_plan_items', 'build_params', 'TEXT')
+    _add_column(conn, 'release_plans', 'run_started_at', 'TEXT')
+    _add_column(conn, 'release_plans', 'stuck_reminder_sent', 'INTEGER DEFAULT 0')
+    _add_column(conn, 'release_plans', 'execution_mode', "TEXT DEFAULT 'serial'")
+
+
+def _m003_folder_configs_from_repo_type(conn):
+    """folder_repo_config 迁移到 folder_configs：无参数配置时先创建默认 Jenkins 参数配置"""
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM folder_configs')
+    if cursor.fetchone()[0] > 0:
+        return
+    cursor.execute('SELECT COUNT(*) FROM jenkins_param_configs')
+    if cursor.fetchone()[0] == 0:
+        default_params = json.dumps([
+            {"param_name": "BRANCH_TAG", "param_type": "dropdown", "source": "gitlab_branches", "allow_empty": False, "label": "分支"},
+            {"param_name": "请选择操作", "param_type": "dropdown", "source": None, "options": ["拉取代码-编译", "拉取代码-编译-单元测试", "重启服务", "停止服务", "扩容服务", "回滚服务"], "allow_empty": False, "label": "操作"},
+            {"param_name": "pod_num", "param_type": "number", "allow_empty": True, "label": "Pod 数量"}
+        ])
+        cursor.execute('INSERT INTO jenkins_param_configs (id, name, gitlab_config_id, param_definitions) VALUES (1, ?, NULL, ?)', ('GitLab 默认', default_params))
+    cursor.execute('SELECT folder_path, repo_type FROM folder_repo_config')
+    for row in cursor.fetchall():
+        cursor.execute('INSERT OR IGNORE INTO folder_configs (folder_path, jenkins_param_config_id, gitlab_config_id, gitlab_project_id) VALUES (?, 1, NULL, NULL)', (row[0],))
+
+
+def _m004_jenkins_controllers(conn):
+    """额外的 Jenkins 控制器（默认控制器来自环境变量 JENKINS_URL）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS jenkins_controllers (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            base_url TEXT NOT NULL,
+            username TEXT,
+            api_token TEXT,
+            max_concurrency INTEGER DEFAULT 8
+        )
+    ''')
+
+
+def _m005_plan_item_counts(conn, batch_size=1000):
+    """计划项计数列（由触发器维护），列表页不必再 JOIN 全部计划项；按 id 分批回填"""
+    cursor = conn.cursor()
+    _add_column(conn, 'release_plans', 'item_count', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'release_plans', 'success_count', 'INTEGER NOT NULL DEFAULT 0')
+    _add_column(conn, 'release_plans', 'fail_count', 'INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_item_insert_counts AFTER INSERT ON release_plan_items
+        BEGIN
+            UPDATE release_plans SET item_count = item_count + 1,
+                success_count = success_count + (NEW.success IS 1), fail_count = fail_count + (NEW.success IS 0)
+            WHERE id = NEW.plan_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_item_delete_counts AFTER DELETE ON release_plan_items
+        BEGIN
+            UPDATE release_plans SET item_count = item_count - 1,
+                success_count = success_count - (OLD.success IS 1), fail_count = fail_count - (OLD.success IS 0)
+            WHERE id = OLD.plan_id;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_item_success_counts AFTER UPDATE OF success ON release_plan_items
+        WHEN NEW.success IS NOT OLD.success
+        BEGIN
+            UPDATE release_plans SET
+                success_count = success_count + (NEW.success IS 1) - (OLD.success IS 1),
+                fail_count = fail_count + (NEW.success IS 0) - (OLD.success IS 0)
+            WHERE id = NEW.plan_id;
+        END
+    ''')
+    conn.commit()
+    # 回填按当前计划项重新计数，中途中断后重跑结果相同
+    for rows in _batched_ids(conn, 'SELECT id FROM release_plans WHERE id > ? ORDER BY id LIMIT ?', batch_size):
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS release_plan_items (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                plan_id INTEGER NOT NULL,
-                jenkins_job_name TEXT NOT NULL,
-                branch TEXT,
-                operation TEXT,
-                pod_num TEXT,
-                build_params TEXT,
-                triggered INTEGER DEFAULT 0,
-                build_number INTEGER,
-                success INTEGER,
-                failure_reason TEXT,
-                FOREIGN KEY (plan_id) REFERENCES release_plans(id) ON DELETE CASCADE
+            UPDATE release_plans SET
+                item_count = (SELECT COUNT(*) FROM release_plan_items i WHERE i.plan_id = release_plans.id),
+                success_count = (SELECT COUNT(*) FROM release_plan_items i WHERE i.plan_id = release_plans.id AND i.success = 1),
+                fail_count = (SELECT COUNT(*) FROM release_plan_items i WHERE i.plan_id = release_plans.id AND i.success = 0)
+            WHERE id BETWEEN ? AND ?
+        ''', (rows[0][0], rows[-1][0]))
+    # 普通索引隐含 rowid，按 execution_mode / 任务过滤后可直接按 id 倒序分页
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_plan_mode ON release_plans(execution_mode)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_item_job_plan ON release_plan_items(jenkins_job_name, plan_id)')
+
+
+def _m006_scheduled_epoch(conn, batch_size=1000):
+    """计划时间的毫秒时间戳：调度扫描按整数比较，不受 ISO 字符串时区/格式差异影响；按 id 分批回填"""
+    _add_column(conn, 'release_plans', 'scheduled_epoch_ms', 'INTEGER')
+    conn.commit()
+    sql = 'SELECT id, scheduled_at FROM release_plans WHERE id > ? AND scheduled_epoch_ms IS NULL ORDER BY id LIMIT ?'
+    for rows in _batched_ids(conn, sql, batch_size):
+        updates = []
+        for row in rows:
+            try:
+                updates.append((epoch_ms(row['scheduled_at']), row['id']))
+            except (ValueError, TypeError):
+                pass  # 无法解析的历史数据保持为空，不参与定时扫描
+        conn.executemany('UPDATE release_plans SET scheduled_epoch_ms=? WHERE id=?', updates)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_scheduled_epoch ON release_plans(scheduled_epoch_ms)')
+    # 只索引待执行计划：到期扫描是该小索引上的一次范围查找
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_plan_due ON release_plans(scheduled_epoch_ms) WHERE status = 'pending'")
+
+
+def _m007_plan_archive(conn):
+    """历史计划归档表：一行汇总 + 压缩后的计划项（见 archive.py）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS release_plan_archive (
+            id INTEGER PRIMARY KEY,
+            scheduled_at TEXT NOT NULL,
+            scheduled_epoch_ms INTEGER,
+            created_at TEXT NOT NULL,
+            status TEXT NOT NULL,
+            default_branch TEXT,
+            execution_mode TEXT,
+            run_started_at TEXT,
+            item_count INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            fail_count INTEGER NOT NULL DEFAULT 0,
+            job_paths TEXT,
+            items_blob BLOB,
+            archived_at TEXT NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_status ON release_plan_archive(status)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_archive_scheduled_epoch ON release_plan_archive(scheduled_epoch_ms)')
+
+
+def _m008_job_stats(conn, batch_size=1000):
+    """按任务汇总的发版统计（见 job_stats.py）：period 为 'all' 或 ISO 周，h0..h9 为耗时直方图分桶。
+    历史计划项只回填成功/失败次数（没有记录耗时），按计划时间归入对应的周"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS job_stats (
+            job_path TEXT NOT NULL,
+            period TEXT NOT NULL,
+            total INTEGER NOT NULL DEFAULT 0,
+            success_count INTEGER NOT NULL DEFAULT 0,
+            fail_count INTEGER NOT NULL DEFAULT 0,
+            duration_count INTEGER NOT NULL DEFAULT 0,
+            duration_sum_ms INTEGER NOT NULL DEFAULT 0,
+            duration_max_ms INTEGER NOT NULL DEFAULT 0,
+            h0 INTEGER NOT NULL DEFAULT 0, h1 INTEGER NOT NULL DEFAULT 0, h2 INTEGER NOT NULL DEFAULT 0,
+            h3 INTEGER NOT NULL DEFAULT 0, h4 INTEGER NOT NULL DEFAULT 0, h5 INTEGER NOT NULL DEFAULT 0,
+            h6 INTEGER NOT NULL DEFAULT 0, h7 INTEGER NOT NULL DEFAULT 0, h8 INTEGER NOT NULL DEFAULT 0,
+            h9 INTEGER NOT NULL DEFAULT 0,
+            updated_at TEXT,
+            PRIMARY KEY (job_path, period)
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_job_stats_period ON job_stats(period)')
+    if conn.execute('SELECT 1 FROM job_stats LIMIT 1').fetchone():
+        return
+    tz = pytz.timezone('Asia/Shanghai')
+    counts = {}  # (job_path, period) -> [success, fail]
+    sql = '''
+        SELECT i.id, i.jenkins_job_name, i.success, p.scheduled_epoch_ms
+        FROM release_plan_items i JOIN release_plans p ON p.id = i.plan_id
+        WHERE i.id > ? AND i.success IS NOT NULL ORDER BY i.id LIMIT ?
+    '''
+    for rows in _batched_ids(conn, sql, batch_size):
+        for row in rows:
+            periods = ['all']
+            if row['scheduled_epoch_ms']:
+                periods.append(week_key(datetime.fromtimestamp(row['scheduled_epoch_ms'] / 1000, tz)))
+            for period in periods:
+                c = counts.setdefault((row['jenkins_job_name'], period), [0, 0])
+                c[0 if row['success'] else 1] += 1
+    conn.executemany(
+        'INSERT INTO job_stats (job_path, period, total, success_count, fail_count) VALUES (?, ?, ?, ?, ?)',
+        [(job_path, period, ok + fail, ok, fail) for (job_path, period), (ok, fail) in counts.items()]
+    )
+
+
+def _m009_notification_outbox(conn):
+    """飞书通知发件箱（见 notification_outbox.py）：与状态变更同一事务写入，后台线程投递"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            webhook_url TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            kind TEXT,
+            plan_id INTEGER,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_ms INTEGER NOT NULL,
+            created_ms INTEGER NOT NULL,
+            sent_ms INTEGER,
+            last_error TEXT
+        )
+    ''')
+    # 投递线程只扫描待投递的少量行
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_due ON notification_outbox(next_attempt_ms) WHERE status = 'pending'")
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_outbox_status_sent ON notification_outbox(status, sent_ms)')
+
+
+def _m010_outbox_summary(conn):
+    """发件箱通知的一行摘要（JSON），同一 webhook 短时间内的多条通知据此合并为汇总卡片"""
+    _add_column(conn, 'notification_outbox', 'summary', 'TEXT')
+
+
+def _m011_plan_events(conn):
+    """计划/计划项状态变更事件（见 plan_events.py）：由触发器在变更的同一事务里追加，
+    无论调度器、接口还是其他进程写库都会记录；事件只记变化的对象，推送时再读取当前状态"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS plan_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            plan_id INTEGER NOT NULL,
+            item_id INTEGER,
+            created_ms INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_plan_events_created ON plan_events(created_ms)')
+    now_ms = "CAST((julianday('now') - 2440587.5) * 86400000 AS INTEGER)"
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_plan_event_insert AFTER INSERT ON release_plans
+        BEGIN
+            INSERT INTO plan_events (plan_id, item_id, created_ms) VALUES (NEW.id, NULL, {now_ms});
+        END
+    ''')
+    # item_count 只在创建计划时随计划项逐条变化，不单独记事件（创建事件提交时计划项已写完）
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_plan_event_update AFTER UPDATE OF status, success_count, fail_count ON release_plans
+        WHEN NEW.status IS NOT OLD.status OR NEW.success_count IS NOT OLD.success_count
+             OR NEW.fail_count IS NOT OLD.fail_count
+        BEGIN
+            INSERT INTO plan_events (plan_id, item_id, created_ms) VALUES (NEW.id, NULL, {now_ms});
+        END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_item_event_update
+        AFTER UPDATE OF triggered, build_number, success, failure_reason ON release_plan_items
+        WHEN NEW.triggered IS NOT OLD.triggered OR NEW.build_number IS NOT OLD.build_number
+             OR NEW.success IS NOT OLD.success OR NEW.failure_reason IS NOT OLD.failure_reason
+        BEGIN
+            INSERT INTO plan_events (plan_id, item_id, created_ms) VALUES (NEW.plan_id, NEW.id, {now_ms});
+        END
+    ''')
+
+
+def _m012_scheduler_ipc(conn):
+    """Web 进程发给调度进程的命令（立即执行计划、转发 Jenkins 构建事件）与后台服务心跳（见 scheduler_ipc.py）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scheduler_commands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT,
+            created_ms INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS service_heartbeats (
+            name TEXT PRIMARY KEY,
+            host TEXT,
+            pid INTEGER,
+            started_ms INTEGER,
+            heartbeat_ms INTEGER NOT NULL,
+            state TEXT
+        )
+    ''')
+
+
+def _m013_cache_invalidations(conn):
+    """配置写接口的缓存失效记录，多 worker 部署时各进程据此同步失效本地缓存（见 cache_sync.py）"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS cache_invalidations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scope TEXT NOT NULL,
+            payload TEXT,
+            origin TEXT,
+            created_ms INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_cache_invalidations_created ON cache_invalidations(created_ms)')
+
+
+# 按版本号顺序执行的迁移；每个迁移都必须可重复执行（中途失败后重启会从该版本重跑）。
+# 新的表结构变化只能追加到末尾，不能修改已发布的迁移
+MIGRATIONS = [
+    (1, '基础表', _m001_base_tables),
+    (2, '计划/计划项补充列', _m002_plan_columns),
+    (3, 'folder_repo_config 迁移到 folder_configs', _m003_folder_configs_from_repo_type),
+    (4, 'Jenkins 多控制器', _m004_jenkins_controllers),
+    (5, '计划项计数列', _m005_plan_item_counts),
+    (6, '计划时间毫秒时间戳', _m006_scheduled_epoch),
+    (7, '历史计划归档表', _m007_plan_archive),
+    (8, '任务发版统计', _m008_job_stats),
+    (9, '飞书通知发件箱', _m009_notification_outbox),
+    (10, '发件箱通知摘要', _m010_outbox_summary),
+    (11, '计划状态变更事件', _m011_plan_events),
+    (12, '调度进程命令与心跳', _m012_scheduler_ipc),
+    (13, '缓存失效同步', _m013_cache_invalidations),
+]
+
+
+def _schema_version(conn):
+    try:
+        return conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] or 0
+    except sqlite3.OperationalError:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TEXT NOT NULL
             )
         ''')
+        return 0
+
+
+@contextmanager
+def _migration_lock():
+    """跨进程的迁移锁（数据库同目录下的 .migrate.lock 文件）。Web 与调度进程（或多个 worker）同时启动时
+    只有一个执行迁移；迁移中途会分批提交，不能只靠 SQLite 事务互斥"""
+    if fcntl is None:
+        yield
+        return
+    with open(_db_path + '.migrate.lock', 'a') as f:
         try:
-            cursor.execute('ALTER TABLE release_plan_items ADD COLUMN build_params TEXT')
-        except sqlite3.OperationalError:
-            pass
-        try:
-            cursor.execute('ALTER TABLE release_plans ADD COLUMN run_started_at TEXT')
-        except sqlite3.OperationalError:
-            pass
-        try:
-            cursor.execute('ALTER TABLE release_plans ADD COLUMN stuck_reminder_sent INTEGER DEFAULT 0')
-        except sqlite3.OperationalError:
-            pass
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logger.info("其他进程正在执行数据库迁移，等待完成")
+            fcntl.flock(f, fcntl.LOCK_EX)
         try:
-            cursor.execute("ALTER TABLE release_plans ADD COLUMN execution_mode TEXT DEFAULT 'serial'")
-        except sqlite3.OperationalError:
-            pass
-        # 创建索引
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_plan_status ON release_plans(status)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_plan_scheduled ON release_plans(scheduled_at)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_item_plan_id ON release_plan_items(plan_id)')
-
-        # 旧表：文件夹代码仓库类型（后续迁移到 folder_configs）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS folder_repo_config (
-                folder_path TEXT PRIMARY KEY,
-                repo_type TEXT NOT NULL
-            )
-        ''')
-        # GitLab 连接配置
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS gitlab_configs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                base_url TEXT NOT NULL,
-                token TEXT NOT NULL,
-                ssl_verify INTEGER DEFAULT 1
-            )
-        ''')
-        # 配置字典（通用下拉数据源）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS config_dictionaries (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                description TEXT,
-                items TEXT NOT NULL
-            )
-        ''')
-        # Jenkins 自定义参数配置（由 GitLab 配置衍生，param_definitions 为 JSON）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS jenkins_param_configs (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                name TEXT NOT NULL,
-                gitlab_config_id INTEGER,
-                param_definitions TEXT NOT NULL,
-                FOREIGN KEY (gitlab_config_id) REFERENCES gitlab_configs(id)
-            )
-        ''')
-        # 文件夹挂载配置（替代 folder_repo_config）
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS folder_configs (
-                folder_path TEXT PRIMARY KEY,
-                jenkins_param_config_id INTEGER NOT NULL,
-                gitlab_config_id INTEGER,
-                gitlab_project_id INTEGER,
-                FOREIGN KEY (jenkins_param_config_id) REFERENCES jenkins_param_configs(id),
-                FOREIGN KEY (gitlab_config_id) REFERENCES gitlab_configs(id)
-            )
-        ''')
-        # 任务级 GitLab 项目覆盖
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS job_gitlab_override (
-                jenkins_job_path TEXT PRIMARY KEY,
-                gitlab_config_id INTEGER NOT NULL,
-                gitlab_project_id INTEGER NOT NULL,
-                FOREIGN KEY (gitlab_config_id) REFERENCES gitlab_configs(id)
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def init_db():
+    """初始化/升级数据库：读取 schema_version，只执行尚未应用的迁移（已是最新版本时只有一次查询）。
+    需要迁移时先取得迁移锁，并在锁内重新读取版本，跳过其他进程已完成的迁移"""
+    with get_db() as conn:
+        if _schema_version(conn) >= MIGRATIONS[-1][0]:
+            return
+    with _migration_lock(), get_db() as conn:
+        current = _schema_version(conn)
+        for version, name, migrate in MIGRATIONS:
+            if version <= current:
+                continue
+            logger.info(f"数据库迁移 #{version}: {name}")
+            migrate(conn)
+            conn.execute(
+                'INSERT OR REPLACE INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                (version, name, datetime.now(pytz.timezone('Asia/Shanghai')).isoformat())
             )
-        ''')
-        # 迁移：若存在 folder_repo_config 且尚无 folder_configs，则创建默认 Jenkins 参数配置并迁移
-        cursor.execute('SELECT COUNT(*) FROM folder_configs')
-        if cursor.fetchone()[0] == 0:
-            cursor.execute('SELECT COUNT(*) FROM jenkins_param_configs')
-            if cursor.fetchone()[0] == 0:
-                import json
-                default_params = json.dumps([
-                    {"param_name": "BRANCH_TAG", "param_type": "dropdown", "source": "gitlab_branches", "allow_empty": False, "label": "分支"},
-                    {"param_name": "请选择操作", "param_type": "dropdown", "source": None, "options": ["拉取代码-编译", "拉取代码-编译-单元测试", "重启服务", "停止服务", "扩容服务", "回滚服务"], "allow_empty": False, "label": "操作"},
-                    {"param_name": "pod_num", "param_type": "number", "allow_empty": True, "label": "Pod 数量"}
-                ])
-                cursor.execute('INSERT INTO jenkins_param_configs (id, name, gitlab_config_id, param_definitions) VALUES (1, ?, NULL, ?)', ('GitLab 默认', default_params))
-            cursor.execute('SELECT folder_path, repo_type FROM folder_repo_config')
-            for row in cursor.fetchall():
-                cursor.execute('INSERT OR IGNORE INTO folder_configs (folder_path, jenkins_param_config_id, gitlab_config_id, gitlab_project_id) VALUES (?, 1, NULL, NULL)', (row[0],))
+            conn.commit()
+
 
 # SQLAlchemy 风格的会话管理（简化版）
 class DBSession:
+    __slots__ = ('conn', '_pending')
+
     def __init__(self):
-        self.conn = sqlite3.connect(_db_path, check_same_thread=False)
-        self.conn.row_factory = sqlite3.Row
+        self.conn = _connect()
+        self._pending = []
     
     def query(self, model_class):
         """模拟 SQLAlchemy query"""
@@ -165,16 +547,13 @@ class DBSession:
     
     def add(self, obj):
         """添加对象到会话"""
-        if not hasattr(self, '_pending'):
-            self._pending = []
         self._pending.append(obj)
     
     def flush(self):
         """刷新会话"""
-        if hasattr(self, '_pending'):
-            for obj in self._pending:
-                obj.save(self.conn)
-            self._pending = []
+        for obj in self._pending:
+            obj.save(self.conn)
+        self._pending = []
     
     def commit(self):
         """提交事务"""
@@ -183,8 +562,7 @@ class DBSession:
     
     def rollback(self):
         """回滚事务"""
-        if hasattr(self, '_pending'):
-            self._pending = []
+        self._pending = []
         self.conn.rollback()
     
     def remove(self):
@@ -192,6 +570,9 @@ class DBSession:
         self.conn.close()
 
 class Query:
+    """链式查询；过滤与排序字段由模型的白名单校验，limit 以参数下推到 SQL"""
+    __slots__ = ('conn', 'model_class', '_filters', '_order_by', '_limit')
+
     def __init__(self, conn, model_class):
         self.conn = conn
         self.model_class = model_class
@@ -205,7 +586,7 @@ class Query:
         return self
     
     def order_by(self, order_expr):
-        """排序"""
+        """排序，如 'created_at'、'-created_at'、'created_at.desc()'"""
         self._order_by = order_expr
         return self
     
@@ -215,8 +596,8 @@ class Query:
         return self
     
     def first(self):
-        """获取第一条"""
-        results = self.all()
+        """获取第一条（LIMIT 1）"""
+        results = self.model_class.query_all(self.conn, self._filters, self._order_by, 1)
         return results[0] if results else None
     
     def all(self):
@@ -0,0 +1,123 @@
+"""
+计划执行池
+定时到点的计划与「立即执行」的计划都提交到同一个固定大小的线程池：同时执行的计划数有上限，
+同一计划在排队或执行中时不会重复提交；可查询执行中/排队中的计划，停止时等待执行中的计划在超时内结束
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutionPool:
+    """execute_fn(plan_id, resume) 在工作线程中执行计划"""
+
+    def __init__(self, execute_fn, max_workers):
+        self.execute_fn = execute_fn
+        self.max_workers = max(int(max_workers), 1)
+        self._queue = deque()  # (plan_id, resume, submitted_at)
+        self._running = {}  # plan_id -> 开始执行时间
+        self._cond = threading.Condition()
+        self._threads = []
+        self._accepting = False
+        self.completed = 0
+        self.failed = 0
+
+    def start(self):
+        with self._cond:
+            if self._accepting:
+                return
+            self._accepting = True
+            self._threads = [threading.Thread(target=self._worker, name=f'plan-exec-{i}', daemon=True)
+                             for i in range(self.max_workers)]
+        for t in self._threads:
+            t.start()
+        logger.info(f"计划执行池已启动，最多同时执行 {self.max_workers} 个计划")
+
+    def submit(self, plan_id, resume=False):
+        """提交计划，返回 {'plan_id', 'state', 'position'}：state 为 running（执行中）/ starting（有空闲线程，马上开始）/
+        queued（position 为排队序号，从 1 开始）/ rejected（执行池已停止）。已在池中的计划不重复提交，返回其当前状态"""
+        with self._cond:
+            current = self._describe(plan_id)
+            if current is not None:
+                return current
+            if not self._accepting:
+                return {'plan_id': plan_id, 'state': 'rejected', 'position': None}
+            self._queue.append((plan_id, resume, time.time()))
+            self._cond.notify()
+            result = self._describe(plan_id)
+        if result['state'] == 'queued':
+            logger.info(f"计划 #{plan_id} 已进入执行队列，排第 {result['position']} 位")
+        return result
+
+    def position(self, plan_id):
+        """计划当前的执行状态，格式同 submit；不在池中时返回 None"""
+        with self._cond:
+            return self._describe(plan_id)
+
+    def _describe(self, plan_id):
+        if plan_id in self._running:
+            return {'plan_id': plan_id, 'state': 'running', 'position': 0}
+        free = self.max_workers - len(self._running)
+        for i, (queued_id, _, _) in enumerate(self._queue):
+            if queued_id == plan_id:
+                if i < free:
+                    return {'plan_id': plan_id, 'state': 'starting', 'position': 0}
+                return {'plan_id': plan_id, 'state': 'queued', 'position': i - free + 1}
+        return None
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                while self._accepting and not self._queue:
+                    self._cond.wait()
+                if not self._accepting:
+                    return
+                plan_id, resume, _ = self._queue.popleft()
+                self._running[plan_id] = time.time()
+            try:
+                self.execute_fn(plan_id, resume)
+                ok = True
+            except Exception as e:
+                ok = False
+                logger.error(f"执行计划 #{plan_id} 失败: {e}", exc_info=True)
+            with self._cond:
+                self._running.pop(plan_id, None)
+                if ok:
+                    self.completed += 1
+                else:
+                    self.failed += 1
+                self._cond.notify_all()
+
+    def stop(self, timeout):
+        """不再接收和开始新计划（排队中的计划仍为待执行状态，由下次启动后的扫描执行），
+        等待执行中的计划在 timeout 秒内结束，返回仍未结束的计划 id"""
+        with self._cond:
+            self._accepting = False
+            dropped = [plan_id for plan_id, _, _ in self._queue]
+            self._queue.clear()
+            self._cond.notify_all()
+            deadline = time.time() + timeout
+            while self._running and time.time() < deadline:
+                self._cond.wait(deadline - time.time())
+            remaining = list(self._running)
+        if dropped:
+            logger.info(f"执行池停止，排队中的计划未开始执行: #{', #'.join(str(p) for p in dropped)}")
+        if remaining:
+            logger.warning(f"执行池停止时仍有计划未结束: #{', #'.join(str(p) for p in remaining)}")
+        logger.info("计划执行池已停止")
+        return remaining
+
+    def status(self):
+        now = time.time()
+        with self._cond:
+            return {
+                'max_workers': self.max_workers,
+                'accepting': self._accepting,
+                'running': [{'plan_id': p, 'seconds': round(now - started, 1)} for p, started in self._running.items()],
+                'queued': [{'plan_id': p, 'wait_seconds': round(now - submitted, 1)} for p, _, submitted in self._queue],
+                'completed': self.completed,
+                'failed': self.failed
+            }
@@ -1,9 +1,11 @@
 """
 飞书通知（文本 + 交互卡片）
+消息写入发件箱（notification_outbox），由 OutboxSender 后台投递
 """
-import requests
 import logging
 from config import Config
+from database import get_db
+from notification_outbox import enqueue
 
 logger = logging.getLogger(__name__)
 
@@ -44,52 +46,62 @@ def _card_body(header_title, header_color, sections_md, plan_id=None):
     }
 
 
+def _details_section(plan_id, details_lines):
+    """详情列表，超过 FEISHU_MAX_DETAIL_LINES 行时只保留前面部分并附上汇总与计划链接"""
+    if not details_lines:
+        return ""
+    limit = max(Config.FEISHU_MAX_DETAIL_LINES, 1)
+    if len(details_lines) <= limit:
+        return "**详情**：\n" + "\n".join(details_lines)
+    url = _plan_url(plan_id)
+    more = f"…… 其余 {len(details_lines) - limit} 项未展示，" + (f"[查看完整结果]({url})" if url else "完整结果请在发版计划列表中查看")
+    return "**详情**：\n" + "\n".join(details_lines[:limit] + [more])
+
+
+def digest_payload(summaries):
+    """多条发版通知合并成的汇总卡片请求体。summaries 为 [{'plan_id', 'title', 'text'}, ...]（按发生顺序）"""
+    limit = max(Config.FEISHU_MAX_DETAIL_LINES, 1)
+    failed = any(s['title'] == '发版失败' for s in summaries)
+    lines = [f"- **#{s['plan_id']} {s['title']}**：{s['text']}" for s in summaries[:limit]]
+    if len(summaries) > limit:
+        lines.append(f"…… 其余 {len(summaries) - limit} 条未展示")
+    sections = [f"短时间内共有 {len(summaries)} 条发版通知，已合并发送：", "\n".join(lines)]
+    base = (Config.APP_BASE_URL or '').strip()
+    if base:
+        sections.append(f"[查看发版计划列表]({base.rstrip('/')}/plans)")
+    card = _card_body("发版汇总", "red" if failed else "blue", sections)
+    return {"msg_type": "interactive", "card": card}
+
+
 class FeishuNotifier:
     """飞书通知器（支持文本与交互卡片）"""
 
     def __init__(self):
         self.webhook_url = Config.FEISHU_WEBHOOK_URL
 
-    def send(self, message, webhook_url=None):
-        """发送飞书文本消息"""
+    def _enqueue(self, payload, webhook_url, conn, kind, plan_id, summary=None):
+        """写入发件箱。传入 conn 时与调用方的状态变更同一事务（由调用方提交），否则单独提交。
+        带 summary 的通知可与同一 webhook 短时间内的其他通知合并为汇总卡片"""
         url = webhook_url or self.webhook_url
         if not url:
             logger.warning("未配置飞书 Webhook URL，跳过通知")
-            return
-        try:
-            payload = {
-                "msg_type": "text",
-                "content": {"text": message}
-            }
-            response = requests.post(url, json=payload, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            if result.get('code') != 0:
-                logger.error("飞书通知失败: %s", result.get('msg'))
-            else:
-                logger.info("飞书通知发送成功")
-        except Exception as e:
-            logger.error("发送飞书通知异常: %s", e, exc_info=True)
-
-    def send_card(self, card, webhook_url=None):
+            return None
+        if conn is not None:
+            return enqueue(conn, payload, url, kind, plan_id, summary)
+        with get_db() as own_conn:
+            outbox_id = enqueue(own_conn, payload, url, kind, plan_id, summary)
+            own_conn.commit()
+        return outbox_id
+
+    def send(self, message, webhook_url=None, conn=None):
+        """发送飞书文本消息"""
+        return self._enqueue({"msg_type": "text", "content": {"text": message}}, webhook_url, conn, 'text', None)
+
+    def send_card(self, card, webhook_url=None, conn=None, kind='card', plan_id=None, summary=None):
         """发送飞书交互卡片。card 为 card 对象（不含 msg_type）。"""
-        url = webhook_url or self.webhook_url
-        if not url:
-            logger.warning("未配置飞书 Webhook URL，跳过卡片通知")
-            return
-        try:
-            payload = {"msg_type": "interactive", "card": card}
-            response = requests.post(url, json=payload, timeout=10)
-            response.raise_for_status()
-            result = response.json()
-            if result.get('code') != 0:
-                logger.error("飞书卡片通知失败: %s", result.get('msg'))
-            else:
-                logger.info("飞书卡片通知发送成功")
-        except Exception as e:
-            logger.error("发送飞书卡片异常: %s", e, exc_info=True)
-
-    def card_release_start(self, plan_id, scheduled_at_str, task_count):
+        return self._enqueue({"msg_type": "interactive", "card": card}, webhook_url, conn, kind, plan_id, summary)
+
+    def card_release_start(self, plan_id, scheduled_at_str, task_count, conn=None):
         """发版开始"""
         card = _card_body(
             "发版开始",
@@ -102,9 +114,10 @@ class FeishuNotifier:
             ],
             plan_id=plan_id
         )
-        self.send_card(card)
+        summary = {'plan_id': plan_id, 'title': '发版开始', 'text': f"计划时间 {scheduled_at_str}，{task_count} 个任务"}
+        return self.send_card(card, conn=conn, kind='release_start', plan_id=plan_id, summary=summary)
 
-    def card_release_complete(self, plan_id, scheduled_at_str, success_count, fail_count, total_count, details_lines):
+    def card_release_complete(self, plan_id, scheduled_at_str, success_count, fail_count, total_count, details_lines, conn=None):
         """发版结束（成功或部分成功）"""
         card = _card_body(
             "发版结束",
@@ -113,13 +126,15 @@ class FeishuNotifier:
                 f"**计划 ID**：#{plan_id}",
                 f"**计划时间**：{scheduled_at_str}",
                 f"**结果**：共 {total_count} 个任务，成功 **{success_count}** 个，失败 **{fail_count}** 个。",
-                "**详情**：\n" + "\n".join(details_lines) if details_lines else ""
+                _details_section(plan_id, details_lines)
             ],
             plan_id=plan_id
         )
-        self.send_card(card)
+        summary = {'plan_id': plan_id, 'title': '发版结束',
+                   'text': f"共 {total_count} 个任务，成功 {success_count} 个，失败 {fail_count} 个"}
+        return self.send_card(card, conn=conn, kind='release_complete', plan_id=plan_id, summary=summary)
 
-    def card_release_failed(self, plan_id, scheduled_at_str, total_count, details_lines):
+    def card_release_failed(self, plan_id, scheduled_at_str, total_count, details_lines, conn=None):
         """发版失败（全部失败）"""
         card = _card_body(
             "发版失败",
@@ -128,13 +143,14 @@ class FeishuNotifier:
                 f"**计划 ID**：#{plan_id}",
                 f"**计划时间**：{scheduled_at_str}",
                 f"**结果**：共 {total_count} 个任务，全部失败。",
-                "**详情**：\n" + "\n".join(details_lines) if details_lines else ""
+                _details_section(plan_id, details_lines)
             ],
             plan_id=plan_id
         )
-        self.send_card(card)
+        summary = {'plan_id': plan_id, 'title': '发版失败', 'text': f"共 {total_count} 个任务，全部失败"}
+        return self.send_card(card, conn=conn, kind='release_failed', plan_id=plan_id, summary=summary)
 
-    def card_release_stuck(self, plan_id, scheduled_at_str, running_minutes, task_count):
+    def card_release_stuck(self, plan_id, scheduled_at_str, running_minutes, task_count, conn=None):
         """长期执行中且任务未触发，提醒并建议人工处理"""
         card = _card_body(
             "发版异常提醒",
@@ -148,4 +164,4 @@ class FeishuNotifier:
             ],
             plan_id=plan_id
         )
-        self.send_card(card)
+        return self.send_card(card, conn=conn, kind='release_stuck', plan_id=plan_id)
@@ -0,0 +1,115 @@
+"""
+文件夹配置的就近解析
+把 folder_configs（参数配置、分支来源）、folder_repo_config（旧 repo_type）与 job_gitlab_override 一次性载入按路径分段的前缀树，
+解析任务时沿任务路径走一遍即可得到各项的就近配置，不再按每一级父文件夹查库。
+配置写接口调用后失效，另有 TTL 兜底（例如直接改库）
+"""
+import json
+import logging
+
+from cache import TTLCache
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+
+class _Node:
+    __slots__ = ('children', 'param', 'gitlab', 'repo_type')
+
+    def __init__(self):
+        self.children = {}
+        self.param = None  # (param_config_id, param_definitions)
+        self.gitlab = None  # (gitlab_config_id, gitlab_project_id)
+        self.repo_type = None
+
+
+class FolderConfigIndex:
+    """某一时刻的配置快照，只读；param_definitions 为共享对象，调用方不要修改"""
+
+    def __init__(self, folder_rows, repo_type_rows, override_rows):
+        self._root = _Node()
+        self._overrides = {}
+        for folder_path, param_config_id, param_definitions, gitlab_config_id, gitlab_project_id in folder_rows:
+            node = self._node(folder_path)
+            if param_config_id is not None:
+                try:
+                    node.param = (param_config_id, json.loads(param_definitions) if param_definitions else [])
+                except (ValueError, TypeError):
+                    logger.warning(f"文件夹 {folder_path} 的参数配置 #{param_config_id} param_definitions 不是合法 JSON，已忽略")
+            if gitlab_config_id is not None and gitlab_project_id is not None:
+                node.gitlab = (gitlab_config_id, gitlab_project_id)
+        for folder_path, repo_type in repo_type_rows:
+            if repo_type:
+                self._node(folder_path).repo_type = repo_type
+        for job_path, gitlab_config_id, gitlab_project_id in override_rows:
+            if gitlab_config_id is not None and gitlab_project_id is not None:
+                self._overrides[job_path] = (gitlab_config_id, gitlab_project_id)
+
+    @classmethod
+    def load(cls, conn):
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT f.folder_path, j.id, j.param_definitions, f.gitlab_config_id, f.gitlab_project_id '
+            'FROM folder_configs f LEFT JOIN jenkins_param_configs j ON f.jenkins_param_config_id=j.id'
+        )
+        folder_rows = cursor.fetchall()
+        cursor.execute('SELECT folder_path, repo_type FROM folder_repo_config')
+        repo_type_rows = cursor.fetchall()
+        cursor.execute('SELECT jenkins_job_path, gitlab_config_id, gitlab_project_id FROM job_gitlab_override')
+        override_rows = cursor.fetchall()
+        return cls(folder_rows, repo_type_rows, override_rows)
+
+    def _node(self, folder_path):
+        node = self._root
+        for part in folder_path.split('/'):
+            node = node.children.setdefault(part, _Node())
+        return node
+
+    def resolve(self, job_path):
+        """返回 {param_config_id, param_definitions, gitlab_config_id, gitlab_project_id, repo_type}。
+        父文件夹为任务路径去掉末尾 2、4、6… 段（Jenkins 的 a/job/b/job/c 形式），各项取最近的一级；
+        分支来源先看任务级覆盖"""
+        parts = job_path.strip().split('/')
+        param = gitlab = repo_type = None
+        node = self._root
+        # 沿路径往下走，越深越近，后命中的覆盖先命中的
+        for depth, part in enumerate(parts[:-2], 1):
+            node = node.children.get(part)
+            if node is None:
+                break
+            if (len(parts) - depth) % 2:
+                continue
+            param = node.param or param
+            gitlab = node.gitlab or gitlab
+            repo_type = node.repo_type or repo_type
+        gitlab = self._overrides.get(job_path) or gitlab
+        return {
+            'param_config_id': param[0] if param else None,
+            'param_definitions': param[1] if param else None,
+            'gitlab_config_id': gitlab[0] if gitlab else None,
+            'gitlab_project_id': gitlab[1] if gitlab else None,
+            'repo_type': repo_type
+        }
+
+
+class FolderConfigResolver:
+    """持有当前 FolderConfigIndex，过期或失效后下次解析时重新载入（并发只载入一次）"""
+
+    _KEY = 'index'
+
+    def __init__(self, ttl):
+        self._cache = TTLCache(ttl)
+
+    def index(self):
+        def load():
+            with get_db() as conn:
+                return FolderConfigIndex.load(conn)
+        return self._cache.get_or_load(self._KEY, load)
+
+    def resolve(self, job_paths):
+        """批量解析，返回 job_path -> 解析结果（见 FolderConfigIndex.resolve）"""
+        index = self.index()
+        return {path: index.resolve(path) for path in dict.fromkeys(job_paths)}
+
+    def invalidate(self):
+        self._cache.invalidate()
@@ -0,0 +1,62 @@
+"""
+GitLab 分支/项目列表的进程内共享缓存
+按 (config_id, project_id) 缓存分支（连同搜索索引）、按 (config_id, search) 缓存项目列表；
+并发未命中只请求一次 GitLab，GitLab 不可用时返回过期数据，push webhook 到达时按项目失效
+"""
+import logging
+
+from branch_index import BranchIndex
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# 项目列表按用户输入的搜索词缓存，最多保留的条数（LRU）
+_MAX_PROJECT_SEARCHES = 256
+
+
+class GitLabCache:
+    """client_factory(config_id) 返回该配置的 GitLabClient，配置不存在时抛 ValueError"""
+
+    def __init__(self, client_factory, ttl):
+        self._client_factory = client_factory
+        self.branches = TTLCache(ttl)
+        self.projects = TTLCache(ttl, max_entries=_MAX_PROJECT_SEARCHES)
+
+    @staticmethod
+    def _branch_key(config_id, project_id):
+        # project_id 可能来自数据库（int）或查询参数（str），统一为字符串
+        return (int(config_id), str(project_id))
+
+    def get_branch_index(self, config_id, project_id):
+        """返回项目分支的 BranchIndex，每次缓存填充时构建一次"""
+        def load():
+            index = BranchIndex(list(self._client_factory(config_id).iter_branches(project_id)))
+            logger.info(f"已缓存 GitLab 分支: config={config_id}, project={project_id}, 共 {len(index)} 个")
+            return index
+        return self.branches.get_or_load(self._branch_key(config_id, project_id), load)
+
+    def get_branches(self, config_id, project_id):
+        """返回项目全部分支 [{'name', 'committed_date'}, ...]（共享对象，调用方不要修改）"""
+        return self.get_branch_index(config_id, project_id).branches
+
+    def get_projects(self, config_id, search=None):
+        key = (int(config_id), search or '')
+        return self.projects.get_or_load(key, lambda: self._client_factory(config_id).get_projects(search=search))
+
+    def invalidate_project(self, project_refs, config_id=None):
+        """失效指定项目的分支缓存。project_refs 为项目 id 或 path_with_namespace 的集合；
+        config_id 为空时失效所有 GitLab 配置下的同名项目。返回清除条数"""
+        refs = {str(p) for p in project_refs if p is not None and p != ''}
+        if not refs:
+            return 0
+        return self.branches.invalidate_where(
+            lambda key: key[1] in refs and (config_id is None or key[0] == int(config_id)))
+
+    def invalidate_config(self, config_id):
+        """GitLab 配置修改或删除后失效该配置下的全部缓存"""
+        config_id = int(config_id)
+        n = self.branches.invalidate_where(lambda key: key[0] == config_id)
+        return n + self.projects.invalidate_where(lambda key: key[0] == config_id)
+
+    def invalidate(self):
+        return self.branches.invalidate() + self.projects.invalidate()
@@ -4,12 +4,23 @@ GitLab API 客户端
 """
 import json
 import logging
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+from collections import deque
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, quote
+from config import Config
+from database import get_db
 
 logger = logging.getLogger(__name__)
 
 
+class GitLabConfigNotFound(ValueError):
+    """GitLab 配置不存在（与 GitLab 返回的异常响应区分，接口据此返回 404）"""
+
+
 def _parse_json_response(response, url, log_prefix="GitLab"):
     """安全解析 JSON，若响应为空或非 JSON 则记录并抛出包含响应信息的异常。"""
     text = (response.text or "").strip()
@@ -39,7 +50,9 @@ def _parse_json_response(response, url, log_prefix="GitLab"):
 
 
 class GitLabClient:
-    def __init__(self, base_url, token, ssl_verify=True):
+    """GitLab API 客户端（一个实例对应一个 GitLab 配置，持有长连接会话与并发限制）"""
+
+    def __init__(self, base_url, token, ssl_verify=True, max_concurrency=None):
         self.base_url = base_url.rstrip('/')
         if not self.base_url.endswith('/api/v4'):
             self.api_base = self.base_url + '/api/v4'
@@ -47,6 +60,13 @@ class GitLabClient:
             self.api_base = self.base_url
         self.token = token
         self.ssl_verify = bool(ssl_verify)
+        max_concurrency = max_concurrency or Config.GITLAB_MAX_CONCURRENCY
+        # keep-alive 复用连接（省去每次请求的 TCP/TLS 握手）+ 并发上限
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._limiter = threading.BoundedSemaphore(max_concurrency)
 
     def _headers(self):
         return {'PRIVATE-TOKEN': self.token}
@@ -58,7 +78,8 @@ class GitLabClient:
         kwargs.setdefault('verify', self.ssl_verify)
         kwargs.setdefault('allow_redirects', False)
         try:
-            r = requests.request(method, url, **kwargs)
+            with self._limiter:
+                r = self._session.request(method, url, **kwargs)
             if r.is_redirect and ('sign_in' in (r.headers.get('Location') or '') or 'login' in (r.headers.get('Location') or '').lower()):
                 logger.warning(f"GitLab 重定向到登录页: {url} -> {r.headers.get('Location')}")
                 raise ValueError(
@@ -72,22 +93,90 @@ class GitLabClient:
             logger.error(f"GitLab API 请求失败: {method} {url}: {e}")
             raise
 
-    def get_projects(self, per_page=100, search=None):
-        """获取项目列表。返回 [{"id", "name", "path_with_namespace", ...}, ...]"""
-        params = {'per_page': per_page}
+    def _get_page(self, path, params, page, log_prefix):
+        r = self._request('GET', path, params=dict(params, page=page))
+        data = _parse_json_response(r, r.url, log_prefix)
+        return r, (data if isinstance(data, list) else [])
+
+    def _iter_pages(self, path, params, log_prefix, max_workers=None):
+        """分页遍历列表接口，逐条 yield。首页响应带 X-Total-Pages 时其余页按 max_workers 并发拉取（按页序输出）；
+        GitLab 对超大结果集不返回总页数，此时按 X-Next-Page 顺序翻页"""
+        r, items = self._get_page(path, params, 1, log_prefix)
+        yield from items
+        total_pages = r.headers.get('X-Total-Pages')
+        if total_pages and total_pages.isdigit():
+            pages = iter(range(2, int(total_pages) + 1))
+            workers = max_workers or Config.GITLAB_PAGE_WORKERS
+            pool = ThreadPoolExecutor(max_workers=workers)
+            try:
+                # 保持最多 workers 个页面在途，按页序产出，调用方提前停止时不再请求后续页
+                pending = deque(pool.submit(self._get_page, path, params, p, log_prefix) for p in islice(pages, workers))
+                while pending:
+                    _, items = pending.popleft().result()
+                    next_page = next(pages, None)
+                    if next_page is not None:
+                        pending.append(pool.submit(self._get_page, path, params, next_page, log_prefix))
+                    yield from items
+            finally:
+                pool.shutdown(wait=False, cancel_futures=True)
+            return
+        next_page = r.headers.get('X-Next-Page')
+        while next_page and next_page.isdigit():
+            r, items = self._get_page(path, params, int(next_page), log_prefix)
+            yield from items
+            next_page = r.headers.get('X-Next-Page')
+
+    def iter_projects(self, per_page=100, search=None):
+        """逐条产出全部项目（自动翻页）。元素为 GitLab simple 项目对象：{"id", "name", "path_with_namespace", ...}"""
+        params = {'per_page': per_page, 'simple': 'true'}
         if search:
             params['search'] = search
-        r = self._request('GET', '/projects', params=params)
-        data = _parse_json_response(r, r.url, "GitLab projects")
-        if not isinstance(data, list):
-            return []
-        return data
+        yield from self._iter_pages('/projects', params, "GitLab projects")
 
-    def get_branches(self, project_id, per_page=100):
-        """获取项目分支列表。project_id 可为数字或 URL 编码的 path。返回 [{"name", ...}, ...]"""
+    def get_projects(self, per_page=100, search=None):
+        """获取项目列表（全部分页）。返回 [{"id", "name", "path_with_namespace", ...}, ...]"""
+        return list(self.iter_projects(per_page, search))
+
+    def iter_branches(self, project_id, per_page=100):
+        """逐条产出项目全部分支（自动翻页）：{"name", "committed_date"}"""
         pid = quote(str(project_id), safe='') if isinstance(project_id, str) and '/' in project_id else project_id
-        r = self._request('GET', f'/projects/{pid}/repository/branches', params={'per_page': per_page})
-        data = _parse_json_response(r, r.url, "GitLab branches")
-        if not isinstance(data, list):
-            return []
-        return [{'name': b.get('name', '')} for b in data]
+        for b in self._iter_pages(f'/projects/{pid}/repository/branches', {'per_page': per_page}, "GitLab branches"):
+            commit = b.get('commit') or {}
+            yield {'name': b.get('name', ''), 'committed_date': commit.get('committed_date')}
+
+    def get_branches(self, project_id, per_page=100):
+        """获取项目分支列表（全部分页）。project_id 可为数字或 URL 编码的 path。返回 [{"name", "committed_date"}, ...]"""
+        return list(self.iter_branches(project_id, per_page))
+
+
+class GitLabClientRegistry:
+    """按 GitLab 配置 id 复用长连接客户端，首次使用时从 gitlab_configs 表加载；配置修改或删除后需 invalidate"""
+
+    def __init__(self):
+        self._clients = {}
+        self._lock = threading.Lock()
+
+    def get(self, config_id):
+        """返回配置对应的客户端；配置不存在抛 GitLabConfigNotFound"""
+        config_id = int(config_id)
+        with self._lock:
+            client = self._clients.get(config_id)
+        if client is not None:
+            return client
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT base_url, token, ssl_verify FROM gitlab_configs WHERE id=?', (config_id,))
+            row = cursor.fetchone()
+        if not row:
+            raise GitLabConfigNotFound('GitLab 配置不存在')
+        client = GitLabClient(row['base_url'], row['token'] or '', bool(row['ssl_verify']))
+        with self._lock:
+            return self._clients.setdefault(config_id, client)
+
+    def invalidate(self, config_id=None):
+        """配置修改/删除后丢弃对应客户端；config_id 为空时全部丢弃"""
+        with self._lock:
+            if config_id is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(int(config_id), None)
@@ -0,0 +1,90 @@
+"""
+读接口的条件请求与压缩
+响应带弱 ETag（数据版本号或内容哈希），客户端带 If-None-Match 且未变化时直接返回 304；
+较大的响应按 Accept-Encoding 用 brotli（已安装时）或 gzip 压缩，同一内容的压缩结果缓存复用。
+已安装 orjson 时用它序列化 JSON，否则退回标准库
+"""
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from flask import Response, request
+
+from config import Config
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 最多缓存的压缩结果数（按 ETag + 编码，LRU）
+_MAX_COMPRESSED = 32
+
+
+def dumps(obj):
+    """序列化为紧凑的 UTF-8 JSON 字节"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class _CompressedCache:
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, body, etag, encoding):
+        key = (etag, encoding)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                return data
+        if encoding == 'br':
+            data = brotli.compress(body, quality=5)
+        else:
+            data = gzip.compress(body, compresslevel=6, mtime=0)
+        with self._lock:
+            self._entries[key] = data
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return data
+
+
+_compressed = _CompressedCache(_MAX_COMPRESSED)
+
+
+def _negotiate_encoding():
+    accept = request.accept_encodings
+    if brotli is not None and accept['br']:
+        return 'br'
+    if accept['gzip']:
+        return 'gzip'
+    return None
+
+
+def json_response(payload, etag=None):
+    """返回带 ETag 的 JSON 响应。payload 为 dict/list 或已序列化的字节；
+    etag 为数据版本号，为空时取响应体的 SHA-1。If-None-Match 命中时返回 304（不带响应体）"""
+    body = payload if isinstance(payload, bytes) else dumps(payload)
+    etag = etag or hashlib.sha1(body).hexdigest()
+    if request.if_none_match.contains_weak(etag):
+        response = Response(status=304)
+    else:
+        encoding = _negotiate_encoding() if len(body) >= Config.RESPONSE_COMPRESS_MIN_BYTES else None
+        response = Response(_compressed.get(body, etag, encoding) if encoding else body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    response.set_etag(etag, weak=True)
+    # 浏览器可缓存，但每次使用前都要带 If-None-Match 验证
+    response.headers['Cache-Control'] = 'no-cache'
+    response.vary.add('Accept-Encoding')
+    return response
@@ -2,25 +2,63 @@
 Jenkins 客户端
 用于与 Jenkins API 交互
 """
+import hashlib
+import json
 import requests
 import logging
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import urljoin, quote
+from requests.adapters import HTTPAdapter
 from config import Config
+from cache import TTLCache
+from database import get_db
+from job_tree import JobTree, FOLDER, JOB
 
 logger = logging.getLogger(__name__)
 
+
+def split_job_ref(job_ref):
+    """拆分带 Jenkins 控制器前缀的任务路径：'2:folder/job/name' -> (2, 'folder/job/name')；
+    无前缀的路径属于默认控制器（环境变量 JENKINS_URL），返回 (None, path)。
+    Jenkins 任务名不允许包含冒号，因此前缀不会与任务名冲突"""
+    head, sep, rest = (job_ref or '').partition(':')
+    if sep and head.isdigit():
+        return int(head), rest
+    return None, job_ref
+
+
+def qualify_job_path(controller_id, job_path):
+    """split_job_ref 的逆操作"""
+    return f'{controller_id}:{job_path}' if controller_id is not None else job_path
+
+
 class JenkinsClient:
-    """Jenkins API 客户端"""
+    """Jenkins API 客户端（一个实例对应一个 Jenkins 控制器，持有独立的连接池、缓存与并发限制）"""
     
-    def __init__(self):
-        self.base_url = Config.JENKINS_URL.rstrip('/')
-        self.username = Config.JENKINS_USERNAME
-        self.api_token = Config.JENKINS_API_TOKEN
+    def __init__(self, event_hub=None, base_url=None, username=None, api_token=None,
+                 controller_id=None, max_concurrency=None):
+        self.base_url = (base_url or Config.JENKINS_URL).rstrip('/')
+        self.username = Config.JENKINS_USERNAME if username is None else username
+        self.api_token = Config.JENKINS_API_TOKEN if api_token is None else api_token
+        # 控制器 id（默认控制器为 None），任务树中的 path 会带上对应前缀
+        self.controller_id = controller_id
+        max_concurrency = max_concurrency or Config.JENKINS_MAX_CONCURRENCY
+        # 长连接复用 + 并发上限，避免对单个 Jenkins 控制器请求过载
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+        self._limiter = threading.BoundedSemaphore(max_concurrency)
         self._jobs_cache = None
         self._cache_time = None
         self._cache_ttl = 60  # 缓存1分钟
         self._crumb = None  # (crumb_request_field, crumb_value)，用于带认证时的 CSRF
+        # 任务参数定义缓存：job_path -> get_job_parameters_and_status 结果
+        self._params_cache = TTLCache(Config.JOB_PARAMS_CACHE_TTL)
+        # 构建事件中转（BuildEventHub），收到推送时可省去 queue 轮询
+        self.event_hub = event_hub
     
     def _get_auth(self):
         """获取认证信息"""
@@ -39,7 +77,7 @@ class JenkinsClient:
             return {}
         try:
             url = urljoin(self.base_url, '/crumbIssuer/api/json')
-            r = requests.get(url, auth=auth, timeout=10)
+            r = self._session.get(url, auth=auth, timeout=10)
             if r.status_code == 200:
                 data = r.json()
                 self._crumb = (data.get('crumbRequestField', 'Jenkins-Crumb'), data.get('crumb', ''))
@@ -67,7 +105,8 @@ class JenkinsClient:
             kwargs['headers'] = headers
         
         try:
-            response = requests.request(method, url, auth=auth, timeout=30, **kwargs)
+            with self._limiter:
+                response = self._session.request(method, url, auth=auth, timeout=30, **kwargs)
             # 若 403 且带了认证，尝试刷新 Crumb 后重试一次
             if response.status_code == 403 and auth and self._crumb is not None:
                 self._crumb = None
@@ -75,22 +114,26 @@ class JenkinsClient:
                 if crumb_headers:
                     kwargs['headers'] = kwargs.get('headers', {})
                     kwargs['headers'].update(crumb_headers)
-                    response = requests.request(method, url, auth=auth, timeout=30, **kwargs)
+                    with self._limiter:
+                        response = self._session.request(method, url, auth=auth, timeout=30, **kwargs)
             response.raise_for_status()
             return response
         except requests.exceptions.RequestException as e:
             logger.error(f"Jenkins API 请求失败: {method} {url}, 错误: {e}")
             raise
     
-    def get_jobs(self, use_cache=True):
-        """获取 Jenkins 任务树（支持 folder，树状结构）"""
+    def get_job_tree(self, use_cache=True):
+        """获取 Jenkins 任务树（支持 folder），返回紧凑的 JobTree"""
         # 检查缓存
-        if use_cache and self._jobs_cache and self._cache_time:
+        if use_cache and self._jobs_cache is not None and self._cache_time:
             if time.time() - self._cache_time < self._cache_ttl:
                 return self._jobs_cache
         
         try:
-            tree = self._fetch_jobs_tree('')
+            tree = JobTree(qualify_job_path(self.controller_id, ''), self.base_url)
+            self._fetch_jobs_tree('', tree, -1)
+            # 内容未变化时沿用已序列化的 JSON
+            tree.adopt_cache(self._jobs_cache)
             # 更新缓存
             self._jobs_cache = tree
             self._cache_time = time.time()
@@ -102,43 +145,35 @@ class JenkinsClient:
                 return self._jobs_cache
             raise
     
-    def _fetch_jobs_tree(self, path_prefix):
-        """递归获取任务树，返回当前层节点列表；节点为 folder 时含 children，否则为 job 叶子"""
-        endpoint = '/api/json?tree=jobs[name,url,_class]'
+    def cached_job_tree(self):
+        """缓存未过期时返回任务树，否则返回 None（不请求 Jenkins）"""
+        if self._jobs_cache is not None and self._cache_time and time.time() - self._cache_time < self._cache_ttl:
+            return self._jobs_cache
+        return None
+    
+    def get_jobs(self, use_cache=True):
+        """获取 Jenkins 任务树（嵌套结构，folder 含 children）"""
+        return self.get_job_tree(use_cache).to_nested()
+    
+    def _fetch_jobs_tree(self, path_prefix, tree, parent):
+        """递归获取任务树，按先序追加到 tree；parent 为当前层父节点下标（顶层为 -1）"""
+        endpoint = '/api/json?tree=jobs[name,_class]'
         if path_prefix:
-            endpoint = f'/job/{path_prefix}/api/json?tree=jobs[name,url,_class]'
+            endpoint = f'/job/{path_prefix}/api/json?tree=jobs[name,_class]'
         
         response = self._request('GET', endpoint)
         data = response.json()
-        nodes = []
         
         for job in data.get('jobs', []):
             job_class = job.get('_class', '')
             job_name = job.get('name', '')
-            job_url = job.get('url', '')
-            
-            if path_prefix:
-                job_path = f"{path_prefix}/job/{job_name}"
-            else:
-                job_path = job_name
             
             if 'Folder' in job_class:
-                children = self._fetch_jobs_tree(job_path)
-                nodes.append({
-                    'name': job_name,
-                    'path': job_path,
-                    'type': 'folder',
-                    'children': children
-                })
+                index = tree.add(parent, job_name, FOLDER)
+                job_path = f"{path_prefix}/job/{job_name}" if path_prefix else job_name
+                self._fetch_jobs_tree(job_path, tree, index)
             else:
-                nodes.append({
-                    'name': job_name,
-                    'path': job_path,
-                    'url': job_url,
-                    'type': 'job'
-                })
-        
-        return nodes
+                tree.add(parent, job_name, JOB)
     
     def trigger_build(self, job_path, params=None):
         """触发 Jenkins 构建（buildWithParameters）。params 为 Jenkins 参数名到值的字典，支持 GitLab（BRANCH_TAG）与云效（如 GIT_BRANCH）等不同任务"""
@@ -180,8 +215,14 @@ class JenkinsClient:
             # queue item API: /queue/item/{id}/api/json
             # 需要等待 build 被分配到 executor
             max_retries = 30
+            queue_id = self._queue_id_from_url(queue_url)
             for i in range(max_retries):
-                time.sleep(1)
+                slice_start = time.time()
+                if self.event_hub is not None and queue_id is not None:
+                    # 已接入构建事件推送时，收到 STARTED 事件立即查询 queue；推送的构建号只作唤醒，以 queue 为准
+                    self.event_hub.wait_for_queue((self.controller_id, queue_id), timeout=1)
+                else:
+                    time.sleep(1)
                 try:
                     response = self._request('GET', queue_url.replace(self.base_url, '') + '/api/json')
                     data = response.json()
@@ -192,6 +233,8 @@ class JenkinsClient:
                         return None
                 except:
                     pass
+                # 事件与 queue 不一致时（如伪造的推送）仍保持每秒一次查询，不提前耗尽重试次数
+                time.sleep(max(0, 1 - (time.time() - slice_start)))
             
             logger.warning(f"无法从 queue 获取 build number，queue_url={queue_url}")
             return None
@@ -199,9 +242,17 @@ class JenkinsClient:
             logger.error(f"获取 build number 失败: {e}")
             return None
     
+    @staticmethod
+    def _queue_id_from_url(queue_url):
+        """从 queue item URL（如 http://host/queue/item/123/）解析 queue id"""
+        parts = [p for p in queue_url.rstrip('/').split('/') if p]
+        if len(parts) >= 2 and parts[-2] == 'item' and parts[-1].isdigit():
+            return int(parts[-1])
+        return None
+    
     def get_build_status(self, job_path, build_number):
         """获取构建状态"""
-        endpoint = f'/job/{job_path}/{build_number}/api/json?tree=building,result'
+        endpoint = f'/job/{job_path}/{build_number}/api/json?tree=building,result,duration'
         
         try:
             response = self._request('GET', endpoint)
@@ -212,14 +263,73 @@ class JenkinsClient:
             
             return {
                 'building': building,
-                'result': result  # SUCCESS, FAILURE, ABORTED, None(还在构建)
+                'result': result,  # SUCCESS, FAILURE, ABORTED, None(还在构建)
+                'duration': data.get('duration') or None  # 构建耗时（毫秒），构建中为 0
             }
         except Exception as e:
             logger.error(f"获取构建状态失败: job_path={job_path}, build_number={build_number}, 错误: {e}")
             raise
     
-    def get_job_parameters_and_status(self, job_path):
-        """获取任务参数定义（分支/操作/pod 默认值与选项）及最近构建状态，与「手动构建」一致"""
+    def get_progressive_log(self, job_path, build_number, start=0):
+        """增量获取构建控制台日志（logText/progressiveText）。
+        返回 (data, next_start, more_data)：data 为原始字节（多字节字符可能跨两次请求，由调用方解码），
+        next_start 取自 X-Text-Size，more_data 表示构建仍在输出日志"""
+        endpoint = f'/job/{job_path}/{build_number}/logText/progressiveText'
+        response = self._request('GET', endpoint, params={'start': start})
+        try:
+            next_start = int(response.headers.get('X-Text-Size', ''))
+        except ValueError:
+            next_start = start + len(response.content)
+        more_data = response.headers.get('X-More-Data', '').lower() == 'true'
+        return response.content, next_start, more_data
+    
+    def get_job_parameters_and_status(self, job_path, use_cache=False):
+        """获取任务参数定义（分支/操作/pod 默认值与选项）及最近构建状态，与「手动构建」一致。
+        use_cache=True 时优先返回缓存（最近构建状态可能滞后，至多 JOB_PARAMS_CACHE_TTL 秒）"""
+        if use_cache:
+            cached = self._params_cache.get(job_path)
+            if cached is not None:
+                return cached
+        data = self._fetch_job_parameters_and_status(job_path)
+        self._params_cache.set(job_path, data)
+        return data
+    
+    def get_jobs_parameters_batch(self, job_paths, max_workers=None):
+        """批量获取多个任务的参数定义：命中缓存的直接返回，未命中的并发请求 Jenkins。
+        返回 (results, errors)：results 为 job_path -> 参数数据，errors 为 job_path -> 错误信息"""
+        results = {}
+        errors = {}
+        missing = []
+        for path in dict.fromkeys(job_paths):
+            cached = self._params_cache.get(path)
+            if cached is not None:
+                results[path] = cached
+            else:
+                missing.append(path)
+        if not missing:
+            return results, errors
+        
+        def fetch(path):
+            try:
+                return path, self.get_job_parameters_and_status(path), None
+            except Exception as e:
+                return path, None, str(e)
+        
+        workers = min(max_workers or Config.JOB_PARAMS_FETCH_WORKERS, len(missing))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for path, data, error in pool.map(fetch, missing):
+                if error is None:
+                    results[path] = data
+                else:
+                    errors[path] = error
+        return results, errors
+    
+    def invalidate_job_parameters(self, job_path=None):
+        """手动失效任务参数缓存；job_path 为空时清空全部。返回清除的条目数"""
+        return self._params_cache.invalidate(job_path)
+    
+    def _fetch_job_parameters_and_status(self, job_path):
+        """请求 Jenkins 获取任务参数定义及最近构建状态（不走缓存）"""
         # job_path 格式如 "myjob" 或 "folder/job/name"
         endpoint = f'/job/{job_path}/api/json?tree=lastBuild[number,result,building],property[parameterDefinitions[name,defaultParameterValue[value],choices]]'
         try:
@@ -259,3 +369,216 @@ class JenkinsClient:
                 parameters[name] = {'default': default_val, 'choices': choices}
         
         return {'status': status, 'parameters': parameters}
+
+
+class JenkinsClientRegistry:
+    """多 Jenkins 控制器路由：默认控制器来自环境变量，其余来自 jenkins_controllers 表。
+    对外提供与 JenkinsClient 相同的方法，job_path 可带控制器前缀（见 split_job_ref），按前缀路由到对应控制器的客户端"""
+    
+    def __init__(self, event_hub=None):
+        self.event_hub = event_hub
+        self.default = JenkinsClient(event_hub=event_hub)
+        self._clients = {}
+        self._lock = threading.Lock()
+        self._jobs_json = None  # (各控制器任务树指纹, JSON 字节, version)
+        self._controllers = None  # [(id, name)]，控制器增删改时由 invalidate 清空
+        self._controllers_gen = 0
+    
+    def get(self, controller_id):
+        """返回控制器对应的长连接客户端，首次使用时从数据库加载；控制器不存在抛 ValueError"""
+        if controller_id is None:
+            return self.default
+        with self._lock:
+            client = self._clients.get(controller_id)
+        if client is not None:
+            return client
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT id, base_url, username, api_token, max_concurrency FROM jenkins_controllers WHERE id=?',
+                (controller_id,)
+            )
+            row = cursor.fetchone()
+        if not row:
+            raise ValueError(f"Jenkins 控制器 #{controller_id} 不存在")
+        client = JenkinsClient(
+            event_hub=self.event_hub, base_url=row['base_url'], username=row['username'] or '',
+            api_token=row['api_token'] or '', controller_id=row['id'], max_concurrency=row['max_concurrency']
+        )
+        with self._lock:
+            return self._clients.setdefault(controller_id, client)
+    
+    def invalidate(self, controller_id=None):
+        """控制器新增/修改/删除后丢弃对应客户端（连同其缓存）与控制器列表；controller_id 为空时全部丢弃"""
+        with self._lock:
+            self._controllers = None
+            self._controllers_gen += 1
+            if controller_id is None:
+                self._clients.clear()
+            else:
+                self._clients.pop(controller_id, None)
+    
+    def resolve(self, job_ref):
+        """带前缀的 job_path -> (client, 控制器内 job_path)"""
+        controller_id, job_path = split_job_ref(job_ref)
+        return self.get(controller_id), job_path
+    
+    def list_controllers(self):
+        with self._lock:
+            controllers, gen = self._controllers, self._controllers_gen
+        if controllers is not None:
+            return controllers
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, name FROM jenkins_controllers ORDER BY id')
+            controllers = [(r['id'], r['name']) for r in cursor.fetchall()]
+        with self._lock:
+            # 查询期间控制器有变更时不缓存，下次重新读取
+            if self._controllers_gen == gen:
+                self._controllers = controllers
+        return controllers
+    
+    def _get_trees(self, use_cache=True):
+        """获取各控制器的任务树，返回 (默认控制器 JobTree 或 None, 默认控制器错误信息, [(控制器 id, 名称, JobTree 或 None, 错误信息)])。
+        缓存未过期的直接使用，只有需要请求 Jenkins 的控制器才并发拉取；
+        单个控制器失败不影响其他控制器；全部失败（或只有默认控制器）时抛出默认控制器的异常"""
+        controllers = self.list_controllers()
+        if not controllers:
+            return self.default.get_job_tree(use_cache), None, []
+        
+        def fetch(controller_id):
+            try:
+                return self.get(controller_id).get_job_tree(use_cache), None
+            except Exception as e:
+                logger.error(f"获取 Jenkins 控制器 #{controller_id or '默认'} 任务列表失败: {e}")
+                return None, e
+        
+        results = {}
+        missing = []
+        for cid in [None] + [cid for cid, _ in controllers]:
+            tree = None
+            if use_cache:
+                try:
+                    tree = self.get(cid).cached_job_tree()
+                except ValueError:
+                    pass
+            if tree is not None:
+                results[cid] = (tree, None)
+            else:
+                missing.append(cid)
+        if len(missing) == 1:
+            results[missing[0]] = fetch(missing[0])
+        elif missing:
+            with ThreadPoolExecutor(max_workers=len(missing)) as pool:
+                results.update(zip(missing, pool.map(fetch, missing)))
+        default_tree, default_error = results[None]
+        others = []
+        for cid, name in controllers:
+            tree, error = results[cid]
+            others.append((cid, name, tree, str(error) if error else None))
+        if default_error is not None and all(tree is None for _, _, tree, _ in others):
+            raise default_error
+        return default_tree, str(default_error) if default_error else None, others
+
+    @staticmethod
+    def _default_error_node(error):
+        """默认控制器失败时在顶层显示的占位节点（与其他控制器失败时的 error 一致）"""
+        return {'name': 'Jenkins（默认控制器）', 'path': '', 'type': 'folder', 'controller_id': None,
+                'error': error, 'children': []}
+    
+    def get_jobs(self, use_cache=True):
+        """默认控制器的任务树在顶层（与单控制器时一致），其他控制器各自作为一个顶层节点"""
+        default_tree, default_error, others = self._get_trees(use_cache)
+        tree = default_tree.to_nested() if default_tree is not None else [self._default_error_node(default_error)]
+        for cid, name, sub_tree, error in others:
+            node = {'name': name, 'path': qualify_job_path(cid, ''), 'type': 'folder', 'controller_id': cid,
+                    'children': sub_tree.to_nested() if sub_tree is not None else []}
+            if error:
+                node['error'] = error
+            tree.append(node)
+        return tree
+    
+    def get_jobs_json(self, use_cache=True):
+        """与 get_jobs 相同结构的 JSON 字节：由各控制器缓存的 JSON 拼接，任务树未变化时直接复用上次结果。
+        返回 (json_bytes, version)，version 可用作 ETag"""
+        default_tree, default_error, others = self._get_trees(use_cache)
+        key = (default_tree.fingerprint if default_tree is not None else default_error,
+               tuple((cid, name, t.fingerprint if t is not None else None, e) for cid, name, t, e in others))
+        with self._lock:
+            cached = self._jobs_json
+        if cached is not None and cached[0] == key:
+            return cached[1], cached[2]
+        if not others:
+            body = default_tree.json_bytes()
+        else:
+            if default_tree is None:
+                parts = [json.dumps(self._default_error_node(default_error), ensure_ascii=False,
+                                    separators=(',', ':')).encode('utf-8')]
+            else:
+                parts = [default_tree.json_bytes()[1:-1]] if len(default_tree) else []
+            for cid, name, sub_tree, error in others:
+                head = {'name': name, 'path': qualify_job_path(cid, ''), 'type': 'folder', 'controller_id': cid}
+                if error:
+                    head['error'] = error
+                head_json = json.dumps(head, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+                children = sub_tree.json_bytes() if sub_tree is not None else b'[]'
+                parts.append(head_json[:-1] + b',"children":' + children + b'}')
+            body = b'[' + b','.join(parts) + b']'
+        version = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        with self._lock:
+            self._jobs_json = (key, body, version)
+        return body, version
+    
+    def get_job_paths(self, use_cache=True):
+        """全部控制器的 job path 集合（带控制器前缀）"""
+        default_tree, _, others = self._get_trees(use_cache)
+        paths = default_tree.job_paths() if default_tree is not None else set()
+        for _, _, sub_tree, _ in others:
+            if sub_tree is not None:
+                paths |= sub_tree.job_paths()
+        return paths
+    
+    def trigger_build(self, job_ref, params=None):
+        client, job_path = self.resolve(job_ref)
+        return client.trigger_build(job_path, params)
+    
+    def get_build_status(self, job_ref, build_number):
+        client, job_path = self.resolve(job_ref)
+        return client.get_build_status(job_path, build_number)
+    
+    def get_progressive_log(self, job_ref, build_number, start=0):
+        client, job_path = self.resolve(job_ref)
+        return client.get_progressive_log(job_path, build_number, start)
+    
+    def get_job_parameters_and_status(self, job_ref, use_cache=False):
+        client, job_path = self.resolve(job_ref)
+        return client.get_job_parameters_and_status(job_path, use_cache)
+    
+    def get_jobs_parameters_batch(self, job_refs, max_workers=None):
+        """按控制器分组，各控制器的批量请求并发执行；返回值的 key 仍为带前缀的 job_path"""
+        groups = {}
+        for ref in dict.fromkeys(job_refs):
+            controller_id, job_path = split_job_ref(ref)
+            groups.setdefault(controller_id, []).append(job_path)
+        results, errors = {}, {}
+        
+        def fetch(controller_id):
+            paths = groups[controller_id]
+            try:
+                return controller_id, self.get(controller_id).get_jobs_parameters_batch(paths, max_workers)
+            except Exception as e:
+                return controller_id, ({}, {p: str(e) for p in paths})
+        
+        with ThreadPoolExecutor(max_workers=max(len(groups), 1)) as pool:
+            for controller_id, (res, errs) in pool.map(fetch, list(groups)):
+                results.update({qualify_job_path(controller_id, p): v for p, v in res.items()})
+                errors.update({qualify_job_path(controller_id, p): v for p, v in errs.items()})
+        return results, errors
+    
+    def invalidate_job_parameters(self, job_ref=None):
+        if job_ref is None:
+            with self._lock:
+                clients = [self.default] + list(self._clients.values())
+            return sum(c.invalidate_job_parameters() for c in clients)
+        client, job_path = self.resolve(job_ref)
+        return client.invalidate_job_parameters(job_path)
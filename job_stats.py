@@ -0,0 +1,160 @@
+"""
+任务发版统计
+每个计划项结束时在同一事务里累加到 job_stats：按任务分「全部」与 ISO 周两个粒度，
+记录成功/失败次数与构建耗时的固定分桶直方图；查询时直接读汇总行，不扫描历史计划项
+"""
+from datetime import datetime
+
+import pytz
+
+ALL_TIME = 'all'
+
+# 耗时直方图分桶上界（秒），最后一个桶为「超过 1 小时」
+DURATION_BUCKETS = (30, 60, 120, 300, 600, 900, 1200, 1800, 3600)
+_BUCKET_COLUMNS = tuple(f'h{i}' for i in range(len(DURATION_BUCKETS) + 1))
+
+_tz_shanghai = pytz.timezone('Asia/Shanghai')
+
+
+def week_key(when=None):
+    """ISO 周，如 2026-W42（东八区）"""
+    when = when or datetime.now(_tz_shanghai)
+    year, week, _ = when.isocalendar()
+    return f'{year}-W{week:02d}'
+
+
+def _bucket_index(duration_ms):
+    seconds = duration_ms / 1000
+    for i, upper in enumerate(DURATION_BUCKETS):
+        if seconds <= upper:
+            return i
+    return len(DURATION_BUCKETS)
+
+
+def record_job_result(conn, job_path, success, duration_ms=None, finished_at=None):
+    """累加一次任务结果（不提交，由调用方与计划项状态一起提交）。
+    duration_ms 为空（未触发成功、轮询超时等）时只计次数不计耗时"""
+    finished_at = finished_at or datetime.now(_tz_shanghai)
+    ok = 1 if success else 0
+    if duration_ms is not None:
+        duration_ms = max(int(duration_ms), 0)
+        bucket = _BUCKET_COLUMNS[_bucket_index(duration_ms)]
+        timed = 1
+    else:
+        duration_ms = 0
+        bucket = None
+        timed = 0
+    bucket_update = f', {bucket} = {bucket} + 1' if bucket else ''
+    bucket_insert = [1 if c == bucket else 0 for c in _BUCKET_COLUMNS]
+    sql = f'''
+        INSERT INTO job_stats (job_path, period, total, success_count, fail_count,
+                               duration_count, duration_sum_ms, duration_max_ms, {', '.join(_BUCKET_COLUMNS)}, updated_at)
+        VALUES (?, ?, 1, ?, ?, ?, ?, ?, {', '.join('?' * len(_BUCKET_COLUMNS))}, ?)
+        ON CONFLICT(job_path, period) DO UPDATE SET
+            total = total + 1,
+            success_count = success_count + excluded.success_count,
+            fail_count = fail_count + excluded.fail_count,
+            duration_count = duration_count + excluded.duration_count,
+            duration_sum_ms = duration_sum_ms + excluded.duration_sum_ms,
+            duration_max_ms = MAX(duration_max_ms, excluded.duration_max_ms),
+            updated_at = excluded.updated_at{bucket_update}
+    '''
+    updated_at = finished_at.isoformat()
+    conn.cursor().executemany(sql, [
+        (job_path, period, ok, 1 - ok, timed, duration_ms, duration_ms, *bucket_insert, updated_at)
+        for period in (ALL_TIME, week_key(finished_at))
+    ])
+
+
+def _percentile(histogram, count, q):
+    """按直方图估算分位数（秒），桶内线性插值；落在最后一个桶时返回其下界"""
+    if not count:
+        return None
+    target = q * count
+    seen = 0
+    lower = 0
+    for i, n in enumerate(histogram):
+        if n and seen + n >= target:
+            if i == len(DURATION_BUCKETS):
+                return float(lower)
+            return round(lower + (DURATION_BUCKETS[i] - lower) * (target - seen) / n, 1)
+        seen += n
+        if i < len(DURATION_BUCKETS):
+            lower = DURATION_BUCKETS[i]
+    return float(lower)
+
+
+def stats_dict(row):
+    """job_stats 行转为接口格式（耗时单位：秒）"""
+    histogram = [row[c] for c in _BUCKET_COLUMNS]
+    total = row['total']
+    timed = row['duration_count']
+    max_duration = round(row['duration_max_ms'] / 1000, 1) if timed else None
+
+    def percentile(q):
+        # 桶内插值的估计值不超过实际最大耗时
+        value = _percentile(histogram, timed, q)
+        return min(value, max_duration) if value is not None else None
+
+    return {
+        'job_path': row['job_path'],
+        'period': row['period'],
+        'total': total,
+        'success_count': row['success_count'],
+        'fail_count': row['fail_count'],
+        'success_rate': round(row['success_count'] / total, 4) if total else None,
+        'duration_count': timed,
+        'avg_duration': round(row['duration_sum_ms'] / timed / 1000, 1) if timed else None,
+        'max_duration': max_duration,
+        'p50_duration': percentile(0.5),
+        'p90_duration': percentile(0.9),
+        'histogram': [{'le': upper, 'count': n} for upper, n in zip(DURATION_BUCKETS + (None,), histogram)],
+        'updated_at': row['updated_at']
+    }
+
+
+def _percentile_sql(q):
+    """与 _percentile 相同的分位数估算（秒，保留 1 位小数，不超过最大耗时）的 SQL 表达式，供 ORDER BY 使用"""
+    target = f'({q} * duration_count)'
+    cases = []
+    seen = '0'
+    lower = 0
+    for i, upper in enumerate(DURATION_BUCKETS):
+        column = _BUCKET_COLUMNS[i]
+        cases.append(f'WHEN {seen} + {column} >= {target} '
+                     f'THEN ROUND({lower} + {upper - lower} * ({target} - ({seen})) / {column}, 1)')
+        seen = f'{seen} + {column}'
+        lower = upper
+    return (f'CASE WHEN duration_count = 0 THEN NULL ELSE MIN(CASE {" ".join(cases)} ELSE {float(lower)} END, '
+            f'ROUND(duration_max_ms / 1000.0, 1)) END')
+
+
+# 排序字段 -> (SQL 表达式, 方向)：成功率低的排前面，其余指标大的排前面
+SORT_KEYS = {
+    'total': ('total', 'DESC'),
+    'fail_count': ('fail_count', 'DESC'),
+    'success_rate': ('success_count * 1.0 / NULLIF(total, 0)', 'ASC'),
+    'avg_duration': ('duration_sum_ms * 1.0 / NULLIF(duration_count, 0)', 'DESC'),
+    'p90_duration': (_percentile_sql(0.9), 'DESC'),
+}
+
+
+def query_job_stats(conn, job_paths=None, period=ALL_TIME, sort='total', limit=50):
+    """按 sort（见 SORT_KEYS）排序读取汇总统计的前 limit 条，返回 (stats_dict 列表, 符合条件的任务总数)。
+    job_paths 为空时查询该周期内全部任务；筛选、排序与 LIMIT 都在 SQL 中完成"""
+    expr, direction = SORT_KEYS[sort]
+    where = 'period = ?'
+    params = [period]
+    if job_paths:
+        job_paths = list(dict.fromkeys(job_paths))
+        where += f" AND job_path IN ({','.join('?' * len(job_paths))})"
+        params += job_paths
+    cursor = conn.cursor()
+    cursor.execute(f'SELECT COUNT(*) FROM job_stats WHERE {where}', params)
+    total = cursor.fetchone()[0]
+    # 缺少该指标（没有耗时记录）的排最后
+    cursor.execute(
+        f'SELECT * FROM job_stats WHERE {where} ORDER BY ({expr}) IS NULL, {expr} {direction}, job_path LIMIT ?',
+        params + [limit]
+    )
+    return [stats_dict(row) for row in cursor.fetchall()], total
@@ -0,0 +1,110 @@
+"""
+Jenkins 任务树的紧凑内存表示
+节点按先序存放在平铺数组中：父节点下标、名称（驻留字符串）、类型；完整 path 与 url 按需计算。
+序列化后的 JSON 字节按内容指纹缓存，任务树未变化时直接复用
+"""
+import hashlib
+import json
+import sys
+from array import array
+from urllib.parse import quote
+
+FOLDER = 0
+JOB = 1
+
+
+class JobTree:
+    """平铺数组形式的任务树。节点 i 的父节点为 parents[i]（顶层为 -1），父节点总在子节点之前"""
+
+    __slots__ = ('parents', 'names', 'kinds', 'path_prefix', 'base_url', '_json', '_fingerprint')
+
+    def __init__(self, path_prefix='', base_url=''):
+        self.parents = array('i')
+        self.names = []
+        self.kinds = bytearray()
+        # 控制器前缀（如 '2:'），拼在每个节点 path 之前
+        self.path_prefix = path_prefix
+        self.base_url = base_url.rstrip('/')
+        self._json = None
+        self._fingerprint = None
+
+    def add(self, parent, name, kind):
+        """追加一个节点，返回其下标"""
+        self.parents.append(parent)
+        self.names.append(sys.intern(name))
+        self.kinds.append(kind)
+        return len(self.names) - 1
+
+    def __len__(self):
+        return len(self.names)
+
+    def segments(self, i):
+        """节点 i 从顶层到自身的名称序列"""
+        out = []
+        while i >= 0:
+            out.append(self.names[i])
+            i = self.parents[i]
+        out.reverse()
+        return out
+
+    def path(self, i):
+        """节点 i 的 job_path（如 folder/job/name，带控制器前缀）"""
+        return self.path_prefix + '/job/'.join(self.segments(i))
+
+    def url(self, i):
+        return self.base_url + '/job/' + '/job/'.join(quote(s) for s in self.segments(i)) + '/'
+
+    def _all_paths(self):
+        """一次遍历算出全部节点 path（利用父节点在前，复用父节点结果）"""
+        paths = []
+        for i, name in enumerate(self.names):
+            parent = self.parents[i]
+            paths.append(name if parent < 0 else paths[parent] + '/job/' + name)
+        return paths
+
+    def job_paths(self):
+        """全部 job 叶子节点的 path 集合"""
+        paths = self._all_paths()
+        return {self.path_prefix + paths[i] for i in range(len(self)) if self.kinds[i] == JOB}
+
+    def to_nested(self):
+        """转为接口使用的嵌套结构：folder 含 children，job 含 url"""
+        paths = self._all_paths()
+        url_paths = []  # URL 编码后的 path，同样复用父节点结果
+        nodes = []
+        roots = []
+        for i, name in enumerate(self.names):
+            parent = self.parents[i]
+            url_paths.append(quote(name) if parent < 0 else url_paths[parent] + '/job/' + quote(name))
+            if self.kinds[i] == FOLDER:
+                node = {'name': name, 'path': self.path_prefix + paths[i], 'type': 'folder', 'children': []}
+            else:
+                node = {'name': name, 'path': self.path_prefix + paths[i],
+                        'url': self.base_url + '/job/' + url_paths[i] + '/', 'type': 'job'}
+            nodes.append(node)
+            (roots if parent < 0 else nodes[parent]['children']).append(node)
+        return roots
+
+    @property
+    def fingerprint(self):
+        """内容指纹，任务树结构或名称变化时改变"""
+        if self._fingerprint is None:
+            h = hashlib.sha1(self.path_prefix.encode('utf-8'))
+            h.update(self.parents.tobytes())
+            h.update(bytes(self.kinds))
+            h.update('\0'.join(self.names).encode('utf-8'))
+            self._fingerprint = h.hexdigest()
+        return self._fingerprint
+
+    def json_bytes(self):
+        """to_nested() 的 JSON 字节，首次调用时序列化并缓存"""
+        if self._json is None:
+            self._json = json.dumps(self.to_nested(), ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        return self._json
+
+    def adopt_cache(self, previous):
+        """新拉取的任务树与旧树内容相同时沿用旧树已序列化的 JSON，返回是否相同"""
+        if previous is not None and previous.fingerprint == self.fingerprint:
+            self._json = previous._json
+            return True
+        return False
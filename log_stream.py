@@ -0,0 +1,166 @@
+"""
+构建控制台日志增量推送
+按 X-Text-Size 偏移量增量拉取 Jenkins logText/progressiveText，每个构建只保留一个上游拉取线程，
+所有查看者共享；日志以原始字节保存在有上限的内存环形缓冲中，重复查看无需重新下载，
+发送给每个连接时再按 UTF-8 增量解码（跨段的多字节字符不会被截断）
+"""
+import codecs
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from config import Config
+from sse import sse_event
+
+logger = logging.getLogger(__name__)
+
+
+class LogTail:
+    """单个构建的日志跟踪：后台线程增量拉取，chunks 为 (起始偏移, 结束偏移, 原始字节) 的环形缓冲"""
+
+    def __init__(self, jenkins_client, job_path, build_number, max_bytes, interval, idle_seconds):
+        self.jenkins_client = jenkins_client
+        self.job_path = job_path
+        self.build_number = build_number
+        self.max_bytes = max_bytes
+        self.interval = interval
+        self.idle_seconds = idle_seconds
+        self.chunks = deque()
+        self.buffered_bytes = 0
+        self.offset = 0  # 下一次向 Jenkins 请求的起始字节偏移
+        self.finished = False
+        self.error = None
+        self.viewers = 0
+        self.last_viewed = time.time()
+        self.cond = threading.Condition()
+        self.thread = None
+
+    @property
+    def base_offset(self):
+        """缓冲中最早一段日志的起始偏移（更早的部分已被环形缓冲淘汰）"""
+        return self.chunks[0][0] if self.chunks else self.offset
+
+    def ensure_running(self):
+        with self.cond:
+            if self.finished or (self.thread and self.thread.is_alive()):
+                return
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                idle = self.viewers == 0 and time.time() - self.last_viewed > self.idle_seconds
+            if idle:
+                logger.debug(f"日志跟踪空闲退出: {self.job_path} #{self.build_number}")
+                return
+            try:
+                data, next_offset, more = self.jenkins_client.get_progressive_log(
+                    self.job_path, self.build_number, self.offset
+                )
+            except Exception as e:
+                logger.warning(f"拉取构建日志失败: {self.job_path} #{self.build_number}: {e}")
+                with self.cond:
+                    self.error = str(e)
+                    self.cond.notify_all()
+                time.sleep(self.interval)
+                continue
+            with self.cond:
+                self.error = None
+                if next_offset > self.offset and data:
+                    self._append(self.offset, next_offset, data)
+                self.offset = max(self.offset, next_offset)
+                if not more:
+                    self.finished = True
+                self.cond.notify_all()
+                if self.finished:
+                    return
+            time.sleep(self.interval)
+
+    def _append(self, start, end, data):
+        self.chunks.append((start, end, data))
+        self.buffered_bytes += end - start
+        while self.buffered_bytes > self.max_bytes and len(self.chunks) > 1:
+            s, e, _ = self.chunks.popleft()
+            self.buffered_bytes -= e - s
+
+    def read_from(self, offset):
+        """返回 offset 之后缓冲中的日志段列表；调用方需持有 cond"""
+        return [c for c in self.chunks if c[1] > offset]
+
+
+class LogStreamRegistry:
+    """按 (job_path, build_number) 共享 LogTail；已结束构建的日志按 LRU 保留最近若干个"""
+
+    def __init__(self, jenkins_client, max_builds=None, max_bytes=None, interval=None, idle_seconds=30):
+        self.jenkins_client = jenkins_client
+        self.max_builds = max_builds or Config.LOG_STREAM_MAX_BUILDS
+        self.max_bytes = max_bytes or Config.LOG_STREAM_BUFFER_BYTES
+        self.interval = interval or Config.LOG_STREAM_INTERVAL
+        self.idle_seconds = idle_seconds
+        self._tails = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_path, build_number):
+        key = (job_path, build_number)
+        with self._lock:
+            tail = self._tails.get(key)
+            if tail is None:
+                tail = LogTail(self.jenkins_client, job_path, build_number,
+                               self.max_bytes, self.interval, self.idle_seconds)
+                self._tails[key] = tail
+            self._tails.move_to_end(key)
+            # 超出上限时淘汰最久未访问且无人查看的构建
+            for k in list(self._tails):
+                if len(self._tails) <= self.max_builds:
+                    break
+                if self._tails[k].viewers == 0 and k != key:
+                    del self._tails[k]
+        return tail
+
+    def stream(self, job_path, build_number, start_offset=0, heartbeat=15):
+        """生成 SSE 消息：event log（id 为已发送到的字节偏移，可用 Last-Event-ID 续传），构建结束发送 event end。
+        id 只落在完整字符之后，未凑齐的多字节字符留到下一段一起发送"""
+        tail = self.get(job_path, build_number)
+        with tail.cond:
+            tail.viewers += 1
+            tail.last_viewed = time.time()
+        tail.ensure_running()
+        offset = start_offset
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        try:
+            while True:
+                with tail.cond:
+                    chunks = tail.read_from(offset)
+                    if not chunks and not tail.finished:
+                        tail.cond.wait(heartbeat)
+                        chunks = tail.read_from(offset)
+                    finished = tail.finished
+                    base = tail.base_offset
+                    error = tail.error
+                if chunks and offset < base:
+                    yield sse_event('truncated', {'skipped_bytes': base - offset})
+                    # 淘汰的部分可能截断了一个多字节字符，从缓冲起点重新解码
+                    decoder.reset()
+                for start, end, data in chunks:
+                    if start < offset:
+                        # 续传时跳过已发送部分（按字节偏移截取）
+                        data = data[offset - start:]
+                    text = decoder.decode(data)
+                    offset = end
+                    if text:
+                        pending = len(decoder.getstate()[0])
+                        yield sse_event('log', {'text': text}, event_id=end - pending)
+                if finished and not tail.read_from(offset):
+                    text = decoder.decode(b'', final=True)
+                    if text:
+                        yield sse_event('log', {'text': text}, event_id=offset)
+                    yield sse_event('end', {'offset': offset})
+                    return
+                if not chunks:
+                    yield sse_event('error', {'error': error}) if error else ': keep-alive\n\n'
+        finally:
+            with tail.cond:
+                tail.viewers -= 1
+                tail.last_viewed = time.time()
@@ -2,131 +2,205 @@
 数据模型
 """
 from datetime import datetime
-import pytz
-from database import get_db
+from database import epoch_ms
+
+# IN (...) 每批的参数个数，避免超出 SQLite 变量个数上限
+_IN_CHUNK = 500
+
+
+def _build_where(filters, columns):
+    """filter_by 条件（多个 dict 取 AND）转为 WHERE 子句与参数；列名必须在白名单内"""
+    conditions = []
+    params = []
+    for filter_dict in filters or []:
+        for key, value in filter_dict.items():
+            if key not in columns:
+                raise ValueError(f"不支持的过滤字段: {key}")
+            if value is None:
+                conditions.append(f'{key} IS NULL')
+            else:
+                conditions.append(f'{key}=?')
+                params.append(value)
+    return (' WHERE ' + ' AND '.join(conditions) if conditions else ''), params
+
+
+def _build_order_by(order_by, columns):
+    """排序表达式转为 ORDER BY 子句，列名必须在白名单内。
+    支持 'created_at'、'-created_at'、'created_at desc' 以及旧写法 'created_at.desc()'"""
+    if not order_by:
+        return ''
+    expr = str(order_by).strip()
+    direction = 'ASC'
+    if expr.startswith('-'):
+        expr, direction = expr[1:], 'DESC'
+    lowered = expr.lower()
+    for suffix, d in (('.desc()', 'DESC'), ('.asc()', 'ASC'), (' desc', 'DESC'), (' asc', 'ASC')):
+        if lowered.endswith(suffix):
+            expr, direction = expr[:-len(suffix)].strip(), d
+            break
+    if expr not in columns:
+        raise ValueError(f"不支持的排序字段: {expr}")
+    # 同值时按 id 兜底，保证分页顺序稳定
+    return f' ORDER BY {expr} {direction}' + ('' if expr == 'id' else f', id {direction}')
+
+
+def _to_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
 
 class ReleasePlan:
     """发版计划"""
-    def __init__(self, scheduled_at=None, created_at=None, status='pending', 
-                 default_branch=None, feishu_webhook=None, id=None):
+
+    __slots__ = ('id', 'scheduled_at', 'created_at', 'status', 'default_branch', 'feishu_webhook',
+                 'execution_mode', 'item_count', 'success_count', 'fail_count', 'items')
+
+    # 可用于 filter_by / order_by 的列
+    COLUMNS = frozenset(('id', 'scheduled_at', 'scheduled_epoch_ms', 'created_at', 'status', 'default_branch',
+                         'feishu_webhook', 'execution_mode', 'run_started_at'))
+    ORDER_COLUMNS = frozenset(('id', 'scheduled_at', 'scheduled_epoch_ms', 'created_at', 'status'))
+
+    def __init__(self, scheduled_at=None, created_at=None, status='pending',
+                 default_branch=None, feishu_webhook=None, id=None, execution_mode='serial',
+                 item_count=0, success_count=0, fail_count=0):
         self.id = id
         self.scheduled_at = scheduled_at
         self.created_at = created_at
         self.status = status
         self.default_branch = default_branch
         self.feishu_webhook = feishu_webhook
+        self.execution_mode = execution_mode
+        self.item_count = item_count
+        self.success_count = success_count
+        self.fail_count = fail_count
         self.items = []
-    
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            id=row['id'],
+            scheduled_at=_to_datetime(row['scheduled_at']),
+            created_at=_to_datetime(row['created_at']),
+            status=row['status'],
+            default_branch=row['default_branch'] or None,
+            feishu_webhook=row['feishu_webhook'] or None,
+            execution_mode=row['execution_mode'] or 'serial',
+            item_count=row['item_count'],
+            success_count=row['success_count'],
+            fail_count=row['fail_count']
+        )
+
     def save(self, conn):
         """保存到数据库"""
         cursor = conn.cursor()
-        tz_shanghai = pytz.timezone('Asia/Shanghai')
-        
+
         if self.id is None:
             # 插入
             cursor.execute('''
-                INSERT INTO release_plans (scheduled_at, created_at, status, default_branch, feishu_webhook)
-                VALUES (?, ?, ?, ?, ?)
+                INSERT INTO release_plans (scheduled_at, scheduled_epoch_ms, created_at, status, default_branch, feishu_webhook, execution_mode)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
             ''', (
                 self.scheduled_at.isoformat() if isinstance(self.scheduled_at, datetime) else self.scheduled_at,
+                epoch_ms(self.scheduled_at),
                 self.created_at.isoformat() if isinstance(self.created_at, datetime) else self.created_at,
                 self.status,
                 self.default_branch or '',
-                self.feishu_webhook or ''
+                self.feishu_webhook or '',
+                self.execution_mode or 'serial'
             ))
             self.id = cursor.lastrowid
         else:
             # 更新
             cursor.execute('''
                 UPDATE release_plans
-                SET scheduled_at=?, status=?, default_branch=?, feishu_webhook=?
+                SET scheduled_at=?, scheduled_epoch_ms=?, status=?, default_branch=?, feishu_webhook=?, execution_mode=?
                 WHERE id=?
             ''', (
                 self.scheduled_at.isoformat() if isinstance(self.scheduled_at, datetime) else self.scheduled_at,
+                epoch_ms(self.scheduled_at),
                 self.status,
                 self.default_branch or '',
                 self.feishu_webhook or '',
+                self.execution_mode or 'serial',
                 self.id
             ))
-    
+
     @classmethod
-    def query_all(cls, conn, filters=None, order_by=None, limit=None):
-        """查询所有"""
-        cursor = conn.cursor()
-        query = 'SELECT * FROM release_plans'
-        params = []
-        
-        if filters:
-            conditions = []
-            for filter_dict in filters:
-                for key, value in filter_dict.items():
-                    conditions.append(f'{key}=?')
-                    params.append(value)
-            if conditions:
-                query += ' WHERE ' + ' AND '.join(conditions)
-        
-        if order_by:
-            # 简化处理，假设是 "created_at.desc()" 这样的格式
-            if 'desc' in str(order_by).lower():
-                query += ' ORDER BY created_at DESC'
-            elif 'asc' in str(order_by).lower():
-                query += ' ORDER BY created_at ASC'
-        
+    def query_all(cls, conn, filters=None, order_by=None, limit=None, with_items=True):
+        """查询计划；with_items 为真时用一次批量 IN 查询加载全部计划的 items（查询次数与计划数无关）"""
+        where, params = _build_where(filters, cls.COLUMNS)
+        query = 'SELECT * FROM release_plans' + where + _build_order_by(order_by, cls.ORDER_COLUMNS)
         if limit:
-            query += f' LIMIT {limit}'
-        
+            query += ' LIMIT ?'
+            params.append(int(limit))
+
+        cursor = conn.cursor()
         cursor.execute(query, params)
-        rows = cursor.fetchall()
-        
-        tz_shanghai = pytz.timezone('Asia/Shanghai')
-        results = []
-        for row in rows:
-            plan = cls(
-                id=row['id'],
-                scheduled_at=datetime.fromisoformat(row['scheduled_at']),
-                created_at=datetime.fromisoformat(row['created_at']),
-                status=row['status'],
-                default_branch=row['default_branch'] or None,
-                feishu_webhook=row['feishu_webhook'] or None
-            )
-            # 加载关联的 items
-            plan.items = ReleasePlanItem.query_by_plan_id(conn, plan.id)
-            results.append(plan)
-        
+        results = [cls.from_row(row) for row in cursor.fetchall()]
+
+        if with_items and results:
+            items_by_plan = ReleasePlanItem.query_by_plan_ids(conn, [plan.id for plan in results])
+            for plan in results:
+                plan.items = items_by_plan.get(plan.id, [])
         return results
 
+
 class ReleasePlanItem:
     """计划项"""
-    def __init__(self, plan_id=None, jenkins_job_name=None, branch=None, 
-                 operation=None, pod_num=None, triggered=False, 
-                 build_number=None, success=None, failure_reason=None, id=None):
+
+    __slots__ = ('id', 'plan_id', 'jenkins_job_name', 'branch', 'operation', 'pod_num', 'build_params',
+                 'triggered', 'build_number', 'success', 'failure_reason')
+
+    COLUMNS = frozenset(('id', 'plan_id', 'jenkins_job_name', 'branch', 'triggered', 'build_number', 'success'))
+    ORDER_COLUMNS = frozenset(('id', 'plan_id'))
+
+    def __init__(self, plan_id=None, jenkins_job_name=None, branch=None,
+                 operation=None, pod_num=None, triggered=False,
+                 build_number=None, success=None, failure_reason=None, id=None, build_params=None):
         self.id = id
         self.plan_id = plan_id
         self.jenkins_job_name = jenkins_job_name
         self.branch = branch
         self.operation = operation
         self.pod_num = pod_num
+        self.build_params = build_params
         self.triggered = bool(triggered)
         self.build_number = build_number
         self.success = success
         self.failure_reason = failure_reason
-    
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            id=row['id'],
+            plan_id=row['plan_id'],
+            jenkins_job_name=row['jenkins_job_name'],
+            branch=row['branch'] or None,
+            operation=row['operation'] or None,
+            pod_num=row['pod_num'] or None,
+            build_params=row['build_params'],
+            triggered=bool(row['triggered']),
+            build_number=row['build_number'],
+            success=bool(row['success']) if row['success'] is not None else None,
+            failure_reason=row['failure_reason'] or None
+        )
+
     def save(self, conn):
         """保存到数据库"""
         cursor = conn.cursor()
-        
+
         if self.id is None:
             # 插入
             cursor.execute('''
-                INSERT INTO release_plan_items 
-                (plan_id, jenkins_job_name, branch, operation, pod_num, triggered, build_number, success, failure_reason)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                INSERT INTO release_plan_items
+                (plan_id, jenkins_job_name, branch, operation, pod_num, build_params, triggered, build_number, success, failure_reason)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             ''', (
                 self.plan_id,
                 self.jenkins_job_name,
                 self.branch or '',
                 self.operation or '',
                 self.pod_num or '',
+                self.build_params,
                 1 if self.triggered else 0,
                 self.build_number,
                 1 if self.success else (0 if self.success is False else None),
@@ -146,28 +220,35 @@ class ReleasePlanItem:
                 self.failure_reason or '',
                 self.id
             ))
-    
+
     @classmethod
     def query_by_plan_id(cls, conn, plan_id):
         """根据 plan_id 查询所有 items"""
+        return cls.query_by_plan_ids(conn, [plan_id]).get(plan_id, [])
+
+    @classmethod
+    def query_by_plan_ids(cls, conn, plan_ids):
+        """批量查询多个计划的 items，返回 plan_id -> [item, ...]（按 id 升序）"""
+        plan_ids = list(dict.fromkeys(plan_ids))
         cursor = conn.cursor()
-        cursor.execute('SELECT * FROM release_plan_items WHERE plan_id=?', (plan_id,))
-        rows = cursor.fetchall()
-        
-        results = []
-        for row in rows:
-            item = cls(
-                id=row['id'],
-                plan_id=row['plan_id'],
-                jenkins_job_name=row['jenkins_job_name'],
-                branch=row['branch'] or None,
-                operation=row['operation'] or None,
-                pod_num=row['pod_num'] or None,
-                triggered=bool(row['triggered']),
-                build_number=row['build_number'],
-                success=bool(row['success']) if row['success'] is not None else None,
-                failure_reason=row['failure_reason'] or None
+        results = {}
+        for i in range(0, len(plan_ids), _IN_CHUNK):
+            chunk = plan_ids[i:i + _IN_CHUNK]
+            cursor.execute(
+                f"SELECT * FROM release_plan_items WHERE plan_id IN ({','.join('?' * len(chunk))}) ORDER BY plan_id, id",
+                chunk
             )
-            results.append(item)
-        
+            for row in cursor.fetchall():
+                results.setdefault(row['plan_id'], []).append(cls.from_row(row))
         return results
+
+    @classmethod
+    def query_all(cls, conn, filters=None, order_by=None, limit=None):
+        where, params = _build_where(filters, cls.COLUMNS)
+        query = 'SELECT * FROM release_plan_items' + where + _build_order_by(order_by, cls.ORDER_COLUMNS)
+        if limit:
+            query += ' LIMIT ?'
+            params.append(int(limit))
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        return [cls.from_row(row) for row in cursor.fetchall()]
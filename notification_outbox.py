@@ -0,0 +1,272 @@
+"""
+飞书通知发件箱
+通知与对应的状态变更在同一事务里写入 notification_outbox，由后台线程异步投递：
+失败按指数退避重试，飞书限流时按 webhook 暂停；发版流程不再等待飞书接口。
+带摘要的通知延迟一个合并窗口投递，窗口内同一 webhook 的多条合并为一张汇总卡片
+"""
+import json
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from config import Config
+from database import get_db
+
+logger = logging.getLogger(__name__)
+
+# 飞书自定义机器人限流错误码（频率超限）
+_FEISHU_RATE_LIMIT_CODES = frozenset((11232,))
+# 已投递记录保留时间
+_SENT_RETENTION_MS = 7 * 86400 * 1000
+# 一张汇总卡片最多合并的通知条数
+_MAX_DIGEST_ROWS = 100
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def enqueue(conn, payload, webhook_url, kind, plan_id=None, summary=None):
+    """写入一条待投递通知（不提交，由调用方与状态变更一起提交）。payload 为飞书 webhook 请求体；
+    summary 为可合并通知的摘要 {'plan_id', 'title', 'text'}，带摘要的通知在合并窗口结束后才投递"""
+    now = _now_ms()
+    next_attempt = now + int(Config.FEISHU_COALESCE_WINDOW * 1000) if summary else now
+    cursor = conn.cursor()
+    cursor.execute('''
+        INSERT INTO notification_outbox (webhook_url, payload, kind, plan_id, summary, status, attempts, next_attempt_ms, created_ms)
+        VALUES (?, ?, ?, ?, ?, 'pending', 0, ?, ?)
+    ''', (webhook_url, json.dumps(payload, ensure_ascii=False), kind, plan_id,
+          json.dumps(summary, ensure_ascii=False) if summary else None, next_attempt, now))
+    return cursor.lastrowid
+
+
+class _RateLimited(Exception):
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class OutboxSender:
+    """后台投递线程。同一 webhook 两次请求至少间隔 FEISHU_MIN_SEND_INTERVAL 秒。
+    build_digest(summaries) 返回汇总卡片请求体，为空时不合并"""
+
+    def __init__(self, build_digest=None, batch_size=20):
+        self.build_digest = build_digest
+        self.batch_size = batch_size
+        self.running = False
+        self.thread = None
+        self._wake = threading.Event()
+        self._session = requests.Session()
+        self._next_send_at = {}  # webhook_url -> 允许下次发送的时间戳（秒）
+        self._last_prune = 0
+        self._lock = threading.Lock()
+        self.counters = {'sent': 0, 'retried': 0, 'rate_limited': 0, 'failed': 0, 'coalesced': 0}
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        logger.info("飞书通知投递线程已启动")
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        logger.info("飞书通知投递线程已停止")
+
+    def wake(self):
+        """有新通知提交后调用，立即开始投递而不等下一次轮询"""
+        self._wake.set()
+
+    def _run(self):
+        while self.running:
+            try:
+                delivered = self.deliver_due()
+            except Exception as e:
+                delivered = 0
+                logger.error(f"飞书通知投递出错: {e}", exc_info=True)
+            if _now_ms() - self._last_prune >= 3600 * 1000:
+                self._prune()
+            if not delivered:
+                self._wake.wait(Config.FEISHU_OUTBOX_POLL_INTERVAL)
+                self._wake.clear()
+
+    def deliver_due(self):
+        """按写入顺序投递一批已到期的通知，返回本批处理条数"""
+        now = _now_ms()
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, webhook_url, payload, summary, attempts FROM notification_outbox
+                WHERE status = 'pending' AND next_attempt_ms <= ?
+                ORDER BY id LIMIT ?
+            ''', (now, self.batch_size))
+            rows = cursor.fetchall()
+        delivered = 0
+        handled = set()
+        for row in rows:
+            if not self.running and self.thread is not None:
+                break
+            if row['id'] in handled:
+                continue
+            # 被限流暂停中的 webhook 先跳过，恢复后仍按写入顺序投递
+            if self._next_send_at.get(row['webhook_url'], 0) - time.time() > Config.FEISHU_MIN_SEND_INTERVAL:
+                continue
+            group = self._digest_group(row)
+            if len(group) > 1:
+                payload = self.build_digest([json.loads(r['summary']) for r in group])
+                logger.info(f"合并 {len(group)} 条飞书通知为汇总卡片: outbox #{', #'.join(str(r['id']) for r in group)}")
+            else:
+                payload = json.loads(row['payload'])
+            self._deliver(group, payload)
+            handled.update(r['id'] for r in group)
+            delivered += len(group)
+        return delivered
+
+    def _digest_group(self, row):
+        """与 row 合并投递的通知：同一 webhook 下已到期或一个合并窗口内将到期的可合并通知，按写入顺序。
+        row 不可合并或只有它一条时返回 [row]"""
+        if self.build_digest is None or not row['summary']:
+            return [row]
+        horizon = _now_ms() + int(Config.FEISHU_COALESCE_WINDOW * 1000)
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, webhook_url, payload, summary, attempts FROM notification_outbox
+                WHERE status = 'pending' AND webhook_url = ? AND summary IS NOT NULL AND next_attempt_ms <= ?
+                ORDER BY id LIMIT ?
+            ''', (row['webhook_url'], horizon, _MAX_DIGEST_ROWS))
+            group = cursor.fetchall()
+        return group if len(group) > 1 else [row]
+
+    def _deliver(self, rows, payload):
+        """发送一次请求，结果记到 rows（单条通知或被合并的一组）上"""
+        url = rows[0]['webhook_url']
+        ids = [r['id'] for r in rows]
+        label = ', #'.join(str(i) for i in ids)
+        wait = self._next_send_at.get(url, 0) - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        try:
+            self._post(url, payload)
+        except _RateLimited as e:
+            # 限流不计入重试次数：暂停该 webhook，到点后原样重发
+            with self._lock:
+                self.counters['rate_limited'] += 1
+            self._next_send_at[url] = time.time() + e.retry_after
+            self._update(ids, next_attempt_ms=_now_ms() + int(e.retry_after * 1000), last_error=str(e))
+            logger.warning(f"飞书通知被限流，{e.retry_after:.0f} 秒后重试: outbox #{label}")
+            return
+        except Exception as e:
+            attempts = max(r['attempts'] for r in rows) + 1
+            if attempts >= Config.FEISHU_OUTBOX_MAX_ATTEMPTS:
+                with self._lock:
+                    self.counters['failed'] += len(rows)
+                self._update(ids, status='failed', attempts=attempts, last_error=str(e))
+                logger.error(f"飞书通知投递失败，已放弃（共 {attempts} 次）: outbox #{label}, 错误: {e}")
+            else:
+                delay = min(Config.FEISHU_OUTBOX_RETRY_BASE * 2 ** (attempts - 1), 600) * random.uniform(0.8, 1.2)
+                with self._lock:
+                    self.counters['retried'] += len(rows)
+                self._update(ids, attempts=attempts, next_attempt_ms=_now_ms() + int(delay * 1000), last_error=str(e))
+                logger.warning(f"飞书通知投递失败，{delay:.0f} 秒后第 {attempts + 1} 次尝试: outbox #{label}, 错误: {e}")
+            return
+        finally:
+            self._next_send_at[url] = max(self._next_send_at.get(url, 0), time.time() + Config.FEISHU_MIN_SEND_INTERVAL)
+        with self._lock:
+            self.counters['sent'] += len(rows)
+            if len(rows) > 1:
+                self.counters['coalesced'] += len(rows)
+        self._update(ids, status='sent', attempts=max(r['attempts'] for r in rows) + 1, sent_ms=_now_ms(), last_error=None)
+        logger.info(f"飞书通知发送成功: outbox #{label}")
+
+    def _post(self, url, payload):
+        response = self._session.post(url, json=payload, timeout=10)
+        if response.status_code == 429:
+            raise _RateLimited('HTTP 429', self._retry_after(response))
+        response.raise_for_status()
+        result = response.json()
+        code = result.get('code', result.get('StatusCode', 0))
+        if code in _FEISHU_RATE_LIMIT_CODES:
+            raise _RateLimited(f"{code}: {result.get('msg')}", self._retry_after(response))
+        if code != 0:
+            raise RuntimeError(f"飞书返回错误 {code}: {result.get('msg')}")
+
+    @staticmethod
+    def _retry_after(response):
+        try:
+            return max(float(response.headers.get('Retry-After', '')), 1.0)
+        except ValueError:
+            return float(Config.FEISHU_RATE_LIMIT_BACKOFF)
+
+    def _update(self, outbox_ids, **fields):
+        assignments = ', '.join(f'{k}=?' for k in fields)
+        with get_db() as conn:
+            conn.cursor().execute(
+                f"UPDATE notification_outbox SET {assignments} WHERE id IN ({','.join('?' * len(outbox_ids))})",
+                (*fields.values(), *outbox_ids)
+            )
+            conn.commit()
+
+    def _prune(self):
+        self._last_prune = _now_ms()
+        try:
+            with get_db() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM notification_outbox WHERE status = 'sent' AND sent_ms < ?",
+                               (self._last_prune - _SENT_RETENTION_MS,))
+                conn.commit()
+                if cursor.rowcount:
+                    logger.info(f"已清理 {cursor.rowcount} 条已投递的飞书通知记录")
+        except Exception as e:
+            logger.warning(f"清理飞书通知记录失败: {e}")
+
+    def counters_snapshot(self):
+        with self._lock:
+            return dict(self.counters)
+
+    def metrics(self):
+        """outbox_stats() 加上本投递线程启动以来的计数"""
+        data = outbox_stats()
+        data['counters'] = self.counters_snapshot()
+        data['running'] = self.running
+        return data
+
+
+def outbox_stats():
+    """投递情况：待投递/失败条数、最早待投递通知的等待时长、最近一小时的投递延迟（秒）与最近的失败记录。
+    只读数据库，与投递线程在哪个进程无关"""
+    now = _now_ms()
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT status, COUNT(*) FROM notification_outbox GROUP BY status')
+        by_status = {row[0]: row[1] for row in cursor.fetchall()}
+        cursor.execute("SELECT MIN(created_ms) FROM notification_outbox WHERE status = 'pending'")
+        oldest = cursor.fetchone()[0]
+        cursor.execute("SELECT sent_ms - created_ms FROM notification_outbox WHERE status = 'sent' AND sent_ms >= ? "
+                       "ORDER BY 1", (now - 3600 * 1000,))
+        lags = [row[0] for row in cursor.fetchall()]
+        cursor.execute("SELECT id, kind, plan_id, attempts, last_error FROM notification_outbox "
+                       "WHERE status = 'failed' ORDER BY id DESC LIMIT 5")
+        recent_failures = [dict(row) for row in cursor.fetchall()]
+
+    def lag_percentile(q):
+        return round(lags[min(int(q * len(lags)), len(lags) - 1)] / 1000, 2) if lags else None
+
+    return {
+        'pending': by_status.get('pending', 0),
+        'failed': by_status.get('failed', 0),
+        'sent': by_status.get('sent', 0),
+        'oldest_pending_seconds': round((now - oldest) / 1000, 1) if oldest else None,
+        'sent_last_hour': len(lags),
+        'lag_p50_seconds': lag_percentile(0.5),
+        'lag_p95_seconds': lag_percentile(0.95),
+        'lag_max_seconds': round(lags[-1] / 1000, 2) if lags else None,
+        'recent_failures': recent_failures
+    }
@@ -0,0 +1,213 @@
+"""
+计划状态实时推送
+release_plans / release_plan_items 上的触发器把状态变化追加到 plan_events（与变更同一事务）。
+PlanEventFeed 用一个后台线程读取新事件，查出变化的计划/计划项的当前状态后分发给所有 SSE 连接，
+打开多少个页面都只有这一路查询；最近的消息保留在内存中，断线重连按事件 id 续传
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+from config import Config
+from database import get_db
+from sse import sse_event
+
+logger = logging.getLogger(__name__)
+
+PLAN_SUMMARY_COLUMNS = ('id', 'scheduled_at', 'created_at', 'status', 'default_branch', 'execution_mode',
+                        'item_count', 'success_count', 'fail_count')
+
+# 续传时最多补发的对象数，超过则让客户端重新加载列表
+_MAX_REPLAY = 500
+
+
+def plan_summary(row):
+    """计划行转为列表接口格式"""
+    return {
+        'id': row['id'],
+        'scheduled_at': row['scheduled_at'],
+        'created_at': row['created_at'],
+        'status': row['status'],
+        'default_branch': row['default_branch'],
+        'item_count': row['item_count'],
+        'success_count': row['success_count'],
+        'fail_count': row['fail_count'],
+        'execution_mode': row['execution_mode'] or 'serial'
+    }
+
+
+def item_state(row):
+    """计划项的执行状态（推送只带会变化的字段）"""
+    return {
+        'id': row['id'],
+        'plan_id': row['plan_id'],
+        'triggered': bool(row['triggered']),
+        'build_number': row['build_number'],
+        'success': bool(row['success']) if row['success'] is not None else None,
+        'failure_reason': row['failure_reason']
+    }
+
+
+def latest_event_id(conn):
+    return conn.execute('SELECT MAX(id) FROM plan_events').fetchone()[0] or 0
+
+
+def prune_plan_events(retention_hours):
+    """删除超过保留时长的事件，返回删除条数"""
+    cutoff = int((time.time() - retention_hours * 3600) * 1000)
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM plan_events WHERE created_ms < ?', (cutoff,))
+        conn.commit()
+        return cursor.rowcount
+
+
+def _resolve(conn, events):
+    """events 为 (事件 id, plan_id, item_id)，同一对象只保留最后一次；
+    返回按事件 id 排序的 (事件 id, 类型, 数据)，已不存在的对象跳过"""
+    latest = {}
+    for event_id, plan_id, item_id in events:
+        latest[(plan_id, item_id)] = event_id
+    plan_ids = [p for p, i in latest if i is None]
+    item_ids = [i for p, i in latest if i is not None]
+    cursor = conn.cursor()
+    plans = {}
+    if plan_ids:
+        cursor.execute(f"SELECT {', '.join(PLAN_SUMMARY_COLUMNS)} FROM release_plans "
+                       f"WHERE id IN ({','.join('?' * len(plan_ids))})", plan_ids)
+        plans = {row['id']: plan_summary(row) for row in cursor.fetchall()}
+    items = {}
+    if item_ids:
+        cursor.execute('SELECT id, plan_id, triggered, build_number, success, failure_reason FROM release_plan_items '
+                       f"WHERE id IN ({','.join('?' * len(item_ids))})", item_ids)
+        items = {row['id']: item_state(row) for row in cursor.fetchall()}
+    messages = []
+    for (plan_id, item_id), event_id in latest.items():
+        if item_id is None and plan_id in plans:
+            messages.append((event_id, 'plan', plans[plan_id]))
+        elif item_id is not None and item_id in items:
+            messages.append((event_id, 'item', items[item_id]))
+    messages.sort(key=lambda m: m[0])
+    return messages
+
+
+class PlanEventFeed:
+    """所有 SSE 连接共享的事件读取线程；没有连接一段时间后退出，下次有连接时从最新事件开始"""
+
+    def __init__(self, interval=None, buffer_size=1000, idle_seconds=30):
+        self.interval = interval or Config.PLAN_EVENTS_POLL_INTERVAL
+        self.buffer_size = buffer_size
+        self.idle_seconds = idle_seconds
+        self.messages = deque()  # (事件 id, 类型, 数据)
+        self.floor = 0  # 事件 id 大于 floor 的消息都在 messages 中
+        self.last_id = 0  # 已读取到的最大事件 id
+        self.viewers = 0
+        self.last_viewed = time.time()
+        self.cond = threading.Condition()
+        self.thread = None
+
+    def _ensure_running(self):
+        with self.cond:
+            if self.thread is not None:
+                return
+            with get_db() as conn:
+                head = latest_event_id(conn)
+            self.messages.clear()
+            self.floor = self.last_id = head
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                if self.viewers == 0 and time.time() - self.last_viewed > self.idle_seconds:
+                    self.thread = None
+                    logger.debug("计划状态推送空闲退出")
+                    return
+            try:
+                self.poll()
+            except Exception as e:
+                logger.warning(f"读取计划状态变更失败: {e}")
+            time.sleep(self.interval)
+
+    def poll(self):
+        """读取一批新事件并唤醒等待中的连接"""
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT id, plan_id, item_id FROM plan_events WHERE id > ? ORDER BY id LIMIT ?',
+                           (self.last_id, self.buffer_size))
+            events = [tuple(row) for row in cursor.fetchall()]
+            if not events:
+                return
+            messages = _resolve(conn, events)
+        with self.cond:
+            self.messages.extend(messages)
+            while len(self.messages) > self.buffer_size:
+                self.floor = self.messages.popleft()[0]
+            self.last_id = events[-1][0]
+            self.cond.notify_all()
+
+    def _replay(self, after_id, until_id):
+        """after_id 早于内存中的消息时从 plan_events 补发；事件已被清理或变化过多时返回 None"""
+        with get_db() as conn:
+            cursor = conn.cursor()
+            oldest = conn.execute('SELECT MIN(id) FROM plan_events').fetchone()[0]
+            if oldest is None or oldest > after_id + 1:
+                return None
+            cursor.execute('''
+                SELECT MAX(id), plan_id, item_id FROM plan_events WHERE id > ? AND id <= ?
+                GROUP BY plan_id, item_id ORDER BY 1 LIMIT ?
+            ''', (after_id, until_id, _MAX_REPLAY + 1))
+            events = [tuple(row) for row in cursor.fetchall()]
+            if len(events) > _MAX_REPLAY:
+                return None
+            return _resolve(conn, events)
+
+    def stream(self, after_id=None, heartbeat=15):
+        """生成 SSE 消息：event plan（计划汇总）/ item（计划项状态），id 为事件 id，可用 Last-Event-ID 续传；
+        无法续传时发送 event reset，客户端应重新加载列表。after_id 为空时从当前最新事件开始"""
+        with self.cond:
+            self.viewers += 1
+            self.last_viewed = time.time()
+            self._ensure_running()
+            cursor = self.last_id if after_id is None else after_id
+            floor = self.floor
+            head = self.last_id
+        try:
+            if cursor > head:
+                # 客户端的事件 id 比库里还新（例如换了数据库），只能重新加载
+                yield sse_event('reset', {}, event_id=head)
+                cursor = head
+            if cursor < floor:
+                replay = self._replay(cursor, floor)
+                if replay is None:
+                    yield sse_event('reset', {}, event_id=floor)
+                else:
+                    for event_id, event, data in replay:
+                        yield sse_event(event, data, event_id=event_id)
+                cursor = floor
+            while True:
+                with self.cond:
+                    pending = [m for m in self.messages if m[0] > cursor]
+                    if not pending and self.last_id <= cursor:
+                        self.cond.wait(heartbeat)
+                        pending = [m for m in self.messages if m[0] > cursor]
+                    if self.floor > cursor:
+                        # 连接消费太慢，内存中的消息已被淘汰
+                        cursor = self.floor
+                        pending = None
+                    else:
+                        cursor = max(cursor, self.last_id)
+                if pending is None:
+                    yield sse_event('reset', {}, event_id=cursor)
+                elif pending:
+                    for event_id, event, data in pending:
+                        yield sse_event(event, data, event_id=event_id)
+                else:
+                    yield ': keep-alive\n\n'
+        finally:
+            with self.cond:
+                self.viewers -= 1
+                self.last_viewed = time.time()
+
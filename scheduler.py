@@ -1,29 +1,52 @@
 """
 定时调度器
-每分钟扫描待执行的计划，到点触发并轮询结果
+每分钟扫描待执行的计划，到点触发并轮询结果。
+可作为独立进程运行（python -m scheduler），与 Web 进程通过数据库通信，也可内嵌在 Web 进程中。
+到点的计划与立即执行的计划都交给同一个有界执行池（ExecutionPool）
 """
 import json
+import signal
 import threading
 import time
 import logging
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
 import pytz
 from config import Config
-from database import get_db
+from database import epoch_ms, get_db, init_db
+from jenkins_client import JenkinsClientRegistry, split_job_ref
+from build_events import BuildEventHub
+from feishu_notifier import FeishuNotifier, digest_payload
+from notification_outbox import OutboxSender
+from scheduler_ipc import BUILD_EVENT, EXECUTE_PLAN, INVALIDATE_JENKINS, SCHEDULER_SERVICE, claim_commands, write_heartbeat
+from archive import archive_finished_plans
+from job_stats import record_job_result
+from plan_events import prune_plan_events
+from cache_sync import prune_cache_invalidations
+from execution_pool import ExecutionPool
 
 logger = logging.getLogger(__name__)
 
+
+class PlanInterrupted(Exception):
+    """调度器停止时中断执行中的计划；计划保持 running，下次启动后续跑"""
+
+
 class Scheduler:
     """定时调度器"""
     
-    def __init__(self, jenkins_client, feishu_notifier):
+    def __init__(self, jenkins_client, feishu_notifier, build_events=None):
         self.jenkins_client = jenkins_client
         self.feishu_notifier = feishu_notifier
+        # 构建事件中转（BuildEventHub）：收到 Jenkins 推送时立即唤醒轮询，轮询退化为兜底
+        self.build_events = build_events
         self.tz_shanghai = pytz.timezone('Asia/Shanghai')
         self.running = False
         self.thread = None
         self.poll_interval = Config.POLL_INTERVAL
         self.poll_timeout = Config.POLL_TIMEOUT
+        self._stopping = threading.Event()
+        self.pool = ExecutionPool(self._run_plan, Config.PLAN_EXECUTION_WORKERS)
     
     def start(self):
         """启动调度器"""
@@ -31,20 +54,63 @@ class Scheduler:
             return
         
         self.running = True
+        self._stopping.clear()
+        self.pool.start()
+        self._resume_running_plans()
         self.thread = threading.Thread(target=self._run, daemon=True)
         self.thread.start()
         logger.info("调度器已启动")
     
     def stop(self):
-        """停止调度器"""
+        """停止调度器：不再领取新计划，执行中的计划在当前等待处中断（保持 running，下次启动后续跑）"""
         self.running = False
+        self._stopping.set()
         if self.thread:
             self.thread.join(timeout=5)
+        self.pool.stop(Config.PLAN_EXECUTION_SHUTDOWN_TIMEOUT)
         logger.info("调度器已停止")
+
+    def _resume_running_plans(self):
+        """上次停止（或进程退出）时仍为 running、且在 PLAN_RESUME_WINDOW 内开始执行的计划重新提交：
+        已触发的构建继续轮询，未触发的照常触发。更早的计划不续跑（由卡住提醒人工处理）。只应有一个调度器在运行"""
+        # run_started_at 可能带不同的时区偏移（或不带），按毫秒时间戳比较而不是比较字符串
+        threshold_ms = int((time.time() - Config.PLAN_RESUME_WINDOW) * 1000)
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, run_started_at FROM release_plans
+                WHERE status = 'running' AND run_started_at IS NOT NULL ORDER BY id
+            ''')
+            rows = cursor.fetchall()
+        plan_ids, stale = [], []
+        for row in rows:
+            try:
+                recent = epoch_ms(row['run_started_at']) >= threshold_ms
+            except ValueError:
+                recent = False
+            (plan_ids if recent else stale).append(row['id'])
+        if stale:
+            logger.warning(f"以下执行中的计划开始于 {Config.PLAN_RESUME_WINDOW} 秒之前，不再续跑: "
+                           f"#{', #'.join(str(p) for p in stale)}")
+        for plan_id in plan_ids:
+            logger.info(f"计划 #{plan_id} 上次未执行完，继续执行")
+            self.pool.submit(plan_id, resume=True)
+
+    def _run_plan(self, plan_id, resume):
+        """执行池工作线程的入口"""
+        try:
+            self._execute_plan(plan_id, resume=resume)
+        except PlanInterrupted:
+            logger.info(f"计划 #{plan_id} 因调度器停止而中断，下次启动后继续")
+
+    def _check_stopping(self):
+        if self._stopping.is_set():
+            raise PlanInterrupted()
     
     def _run(self):
         """调度器主循环"""
         interval = Config.SCHEDULER_INTERVAL
+        last_archive = 0
         
         while self.running:
             try:
@@ -52,8 +118,25 @@ class Scheduler:
                 self._check_stuck_plans()
             except Exception as e:
                 logger.error(f"调度器执行出错: {e}", exc_info=True)
+            if time.time() - last_archive >= Config.RETENTION_INTERVAL:
+                last_archive = time.time()
+                if Config.RETENTION_DAYS > 0:
+                    try:
+                        max_batches = Config.RETENTION_MAX_BATCHES
+                        archived = archive_finished_plans(Config.RETENTION_DAYS, Config.RETENTION_BATCH_SIZE,
+                                                          max_batches=max_batches)
+                        if archived >= Config.RETENTION_BATCH_SIZE * max_batches:
+                            # 还有积压：下一轮扫描后继续归档，而不是等下一个归档间隔
+                            last_archive = 0
+                    except Exception as e:
+                        logger.error(f"归档历史计划失败: {e}", exc_info=True)
+                try:
+                    prune_plan_events(Config.PLAN_EVENTS_RETENTION_HOURS)
+                    prune_cache_invalidations()
+                except Exception as e:
+                    logger.error(f"清理计划状态事件/缓存失效记录失败: {e}", exc_info=True)
             
-            time.sleep(interval)
+            self._stopping.wait(interval)
     
     def _check_stuck_plans(self):
         """检测长期执行中且全部未触发的计划，发送飞书提醒（仅提醒一次）"""
@@ -87,14 +170,15 @@ class Scheduler:
                     scheduled_at = datetime.fromisoformat(row['scheduled_at'])
                     if scheduled_at.tzinfo is None:
                         scheduled_at = self.tz_shanghai.localize(scheduled_at)
-                    self.feishu_notifier.card_release_stuck(
-                        plan_id,
-                        scheduled_at.strftime('%Y-%m-%d %H:%M:%S'),
-                        running_minutes,
-                        len(item_rows)
-                    )
                     with get_db() as conn:
                         cursor = conn.cursor()
+                        self.feishu_notifier.card_release_stuck(
+                            plan_id,
+                            scheduled_at.strftime('%Y-%m-%d %H:%M:%S'),
+                            running_minutes,
+                            len(item_rows),
+                            conn=conn
+                        )
                         cursor.execute(
                             'UPDATE release_plans SET stuck_reminder_sent=1 WHERE id=?',
                             (plan_id,)
@@ -105,39 +189,34 @@ class Scheduler:
             logger.error(f"卡住计划检测失败: {e}", exc_info=True)
 
     def _scan_and_execute(self):
-        """扫描并执行待执行的计划"""
+        """扫描到期的待执行计划，提交到执行池"""
         with get_db() as conn:
             cursor = conn.cursor()
             
-            # 查询待执行的计划（东八区时间比较）
-            now_shanghai = datetime.now(self.tz_shanghai)
-            now_str = now_shanghai.isoformat()
+            # 查询到期的待执行计划（按毫秒时间戳比较，走 idx_plan_due 部分索引）
+            now_ms = int(time.time() * 1000)
             
             cursor.execute('''
-                SELECT * FROM release_plans
-                WHERE status = 'pending' AND scheduled_at <= ?
-            ''', (now_str,))
+                SELECT id FROM release_plans INDEXED BY idx_plan_due
+                WHERE status = 'pending' AND scheduled_epoch_ms <= ?
+                ORDER BY scheduled_epoch_ms
+            ''', (now_ms,))
             
             rows = cursor.fetchall()
-            
-            for row in rows:
-                plan_id = row['id']
-                try:
-                    self._execute_plan(plan_id)
-                except Exception as e:
-                    logger.error(f"执行计划 #{plan_id} 失败: {e}", exc_info=True)
+        
+        # 已在执行池中（排队或执行中）的计划不会重复提交
+        for row in rows:
+            self.pool.submit(row['id'])
     
     def execute_plan(self, plan_id):
-        """供外部调用的立即执行接口（如创建计划后立即发版）。与定时扫描共用同一执行逻辑。"""
-        try:
-            self._execute_plan(plan_id)
-        except Exception as e:
-            logger.error(f"立即执行计划 #{plan_id} 失败: {e}", exc_info=True)
-            raise
+        """供外部调用的立即执行接口（如创建计划后立即发版）：与定时扫描提交到同一执行池，
+        返回 {'plan_id', 'state', 'position'}（见 ExecutionPool.submit）"""
+        return self.pool.submit(plan_id)
     
-    def _execute_plan(self, plan_id):
-        """执行一个计划"""
-        logger.info(f"开始执行计划 #{plan_id}")
+    def _execute_plan(self, plan_id, resume=False):
+        """执行一个计划。resume 为真时续跑上次中断的 running 计划：已有结果的计划项保留，
+        已触发的继续轮询，中断前尚未触发的照常触发（停止时在触发前检查，不会重复触发）"""
+        logger.info(f"{'继续' if resume else '开始'}执行计划 #{plan_id}")
         
         # 加载计划
         with get_db() as conn:
@@ -151,202 +230,323 @@ class Scheduler:
             
             plan_row = dict(plan_row)
             
-            # 更新状态为 running 并记录开始时间（用于卡住检测与提醒）
-            now_str = datetime.now(self.tz_shanghai).isoformat()
-            cursor.execute(
-                'UPDATE release_plans SET status=?, run_started_at=? WHERE id=?',
-                ('running', now_str, plan_id)
-            )
-            conn.commit()
-            
-            # 加载计划项
-            cursor.execute('SELECT * FROM release_plan_items WHERE plan_id=?', (plan_id,))
-            item_rows = cursor.fetchall()
-        
-        # 发版开始：飞书卡片通知
-        try:
-            scheduled_at = datetime.fromisoformat(plan_row['scheduled_at'])
-            if scheduled_at.tzinfo is None:
-                scheduled_at = self.tz_shanghai.localize(scheduled_at)
-            self.feishu_notifier.card_release_start(
-                plan_id,
-                scheduled_at.strftime('%Y-%m-%d %H:%M:%S'),
-                len(item_rows)
-            )
-        except Exception as e:
-            logger.warning(f"发版开始通知发送失败: {e}")
+            if resume:
+                if plan_row['status'] != 'running':
+                    logger.info(f"计划 #{plan_id} 状态为 {plan_row['status']}，无需继续执行")
+                    return
+                cursor.execute('SELECT * FROM release_plan_items WHERE plan_id=?', (plan_id,))
+                item_rows = cursor.fetchall()
+            else:
+                item_rows = self._claim_plan(conn, plan_id, plan_row)
+                if item_rows is None:
+                    return
         
         execution_mode = (plan_row.get('execution_mode') or 'serial').strip().lower()
         if execution_mode != 'parallel':
             execution_mode = 'serial'
         logger.info(f"计划 #{plan_id} 发版方式: {execution_mode}")
         
-        items = []
-        for row in item_rows:
-            item_row = dict(row)
-            item_id = item_row['id']
-            jenkins_job_name = item_row['jenkins_job_name']
-            build_params_raw = item_row.get('build_params')
-            if build_params_raw:
-                try:
-                    params = json.loads(build_params_raw)
-                except (ValueError, TypeError):
-                    params = {}
-            else:
-                branch = item_row['branch'] or ''
-                operation = item_row['operation'] or ''
-                pod_num = item_row['pod_num'] or ''
-                params = {}
-                if branch:
-                    params['BRANCH_TAG'] = branch
-                elif plan_row.get('default_branch'):
-                    params['BRANCH_TAG'] = plan_row['default_branch']
-                if operation:
-                    params['请选择操作'] = operation
-                if pod_num:
-                    params['pod_num'] = pod_num
-            
-            triggered = False
-            build_number = None
-            failure_reason = None
-            
-            try:
-                build_number = self.jenkins_client.trigger_build(jenkins_job_name, params)
-                if build_number:
-                    triggered = True
-                    logger.info(f"计划 #{plan_id} - 任务 {jenkins_job_name} 触发成功，构建号: #{build_number}")
+        if execution_mode == 'serial':
+            items = []
+            for row in item_rows:
+                row = dict(row)
+                if row['success'] is not None:
+                    items.append(self._item_from_row(row))
+                    continue
+                if row['triggered'] and row['build_number']:
+                    item = self._item_from_row(row)
                 else:
-                    failure_reason = "触发构建失败：无法获取构建号"
-                    logger.error(f"计划 #{plan_id} - 任务 {jenkins_job_name} 触发失败")
-            except Exception as e:
-                failure_reason = f"触发构建失败：{str(e)}"
-                logger.error(f"计划 #{plan_id} - 任务 {jenkins_job_name} 触发异常: {e}", exc_info=True)
-            
-            with get_db() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    UPDATE release_plan_items
-                    SET triggered=?, build_number=?, failure_reason=?
-                    WHERE id=?
-                ''', (
-                    1 if triggered else 0,
-                    build_number,
-                    failure_reason or '',
-                    item_id
-                ))
-                conn.commit()
-            
-            item = {
-                'id': item_id,
-                'jenkins_job_name': jenkins_job_name,
-                'triggered': triggered,
-                'build_number': build_number,
-                'success': None,
-                'failure_reason': failure_reason
-            }
-            items.append(item)
-            
-            if execution_mode == 'serial':
+                    self._check_stopping()
+                    item = self._trigger_item(plan_id, plan_row, row)
+                items.append(item)
                 # 串行：当前任务触发成功后，轮询直到该任务构建结束再处理下一个
-                if triggered and build_number:
+                if item['triggered'] and item['build_number']:
                     self._poll_single_build(plan_id, item)
                 else:
                     item['success'] = False
-                    with get_db() as conn:
-                        cursor = conn.cursor()
-                        cursor.execute('UPDATE release_plan_items SET success=0 WHERE id=?', (item_id,))
-                        conn.commit()
-            # 并行：仅触发，不在此处轮询，后面统一 _poll_build_results
-        
-        if execution_mode == 'parallel':
-            self._poll_build_results(plan_id, items)
+                    self._save_item_result(item)
+        else:
+            items = self._run_parallel(plan_id, plan_row, [dict(row) for row in item_rows])
         
         # 更新计划状态并发送飞书通知
         self._update_plan_status(plan_id, items)
-        self._send_notification(plan_id)
+
+    def _claim_plan(self, conn, plan_id, plan_row):
+        """把计划从 pending 切换为 running 并写入发版开始通知，返回计划项；已被领取或已取消时返回 None"""
+        cursor = conn.cursor()
+        # 更新状态为 running 并记录开始时间（用于卡住检测与提醒）；
+        # 只从 pending 切换，定时扫描与立即执行（可能在不同进程）同时拿到同一计划时只有一方执行
+        now_str = datetime.now(self.tz_shanghai).isoformat()
+        cursor.execute(
+            "UPDATE release_plans SET status=?, run_started_at=? WHERE id=? AND status='pending'",
+            ('running', now_str, plan_id)
+        )
+        if cursor.rowcount == 0:
+            conn.rollback()
+            logger.info(f"计划 #{plan_id} 状态为 {plan_row['status']}，已在执行或已取消，跳过")
+            return None
+        
+        # 加载计划项
+        cursor.execute('SELECT * FROM release_plan_items WHERE plan_id=?', (plan_id,))
+        item_rows = cursor.fetchall()
+        
+        # 发版开始：飞书卡片与状态变更同一事务写入发件箱
+        try:
+            scheduled_at = datetime.fromisoformat(plan_row['scheduled_at'])
+            if scheduled_at.tzinfo is None:
+                scheduled_at = self.tz_shanghai.localize(scheduled_at)
+            self.feishu_notifier.card_release_start(
+                plan_id,
+                scheduled_at.strftime('%Y-%m-%d %H:%M:%S'),
+                len(item_rows),
+                conn=conn
+            )
+        except Exception as e:
+            logger.warning(f"发版开始通知写入失败: {e}")
+        conn.commit()
+        return item_rows
+
+    @staticmethod
+    def _item_from_row(item_row):
+        """已触发或已有结果的计划项（续跑时）转为轮询用的 item 字典"""
+        return {
+            'id': item_row['id'],
+            'jenkins_job_name': item_row['jenkins_job_name'],
+            'triggered': bool(item_row['triggered']),
+            'build_number': item_row['build_number'],
+            'triggered_at': None,
+            'success': bool(item_row['success']) if item_row['success'] is not None else None,
+            'failure_reason': item_row['failure_reason'] or None
+        }
     
-    def _poll_single_build(self, plan_id, item):
-        """轮询单个任务的构建结果，直到完成或超时（串行发版时使用）"""
-        item_id = item['id']
-        start_time = time.time()
-        while time.time() - start_time < self.poll_timeout:
+    def _trigger_item(self, plan_id, plan_row, item_row):
+        """触发单个计划项的构建并记录结果，返回轮询用的 item 字典"""
+        item_id = item_row['id']
+        jenkins_job_name = item_row['jenkins_job_name']
+        build_params_raw = item_row.get('build_params')
+        if build_params_raw:
             try:
-                status = self.jenkins_client.get_build_status(
-                    item['jenkins_job_name'],
-                    item['build_number']
-                )
-                if not status['building']:
-                    item['success'] = (status['result'] == 'SUCCESS')
-                    if not item['success']:
-                        item['failure_reason'] = f"构建失败：{status['result']}"
-                    logger.info(
-                        f"计划 #{plan_id} - 任务 {item['jenkins_job_name']} #{item['build_number']} "
-                        f"构建完成，结果: {'成功' if item['success'] else '失败'}"
-                    )
-                    with get_db() as conn:
-                        cursor = conn.cursor()
-                        cursor.execute('''
-                            UPDATE release_plan_items SET success=?, failure_reason=? WHERE id=?
-                        ''', (1 if item['success'] else 0, item.get('failure_reason', '') or '', item_id))
-                        conn.commit()
-                    return
-            except Exception as e:
-                logger.warning(f"计划 #{plan_id} - 任务 {item['jenkins_job_name']} 轮询状态失败: {e}")
-            time.sleep(self.poll_interval)
-        item['success'] = False
-        item['failure_reason'] = (item.get('failure_reason') or '') + '；轮询超时'
-        logger.warning(f"计划 #{plan_id} - 任务 {item['jenkins_job_name']} #{item['build_number']} 轮询超时")
+                params = json.loads(build_params_raw)
+            except (ValueError, TypeError):
+                params = {}
+        else:
+            branch = item_row['branch'] or ''
+            operation = item_row['operation'] or ''
+            pod_num = item_row['pod_num'] or ''
+            params = {}
+            if branch:
+                params['BRANCH_TAG'] = branch
+            elif plan_row.get('default_branch'):
+                params['BRANCH_TAG'] = plan_row['default_branch']
+            if operation:
+                params['请选择操作'] = operation
+            if pod_num:
+                params['pod_num'] = pod_num
+        
+        triggered = False
+        build_number = None
+        failure_reason = None
+        
+        try:
+            build_number = self.jenkins_client.trigger_build(jenkins_job_name, params)
+            if build_number:
+                triggered = True
+                logger.info(f"计划 #{plan_id} - 任务 {jenkins_job_name} 触发成功，构建号: #{build_number}")
+            else:
+                failure_reason = "触发构建失败：无法获取构建号"
+                logger.error(f"计划 #{plan_id} - 任务 {jenkins_job_name} 触发失败")
+        except Exception as e:
+            failure_reason = f"触发构建失败：{str(e)}"
+            logger.error(f"计划 #{plan_id} - 任务 {jenkins_job_name} 触发异常: {e}", exc_info=True)
+        
+        with get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                UPDATE release_plan_items
+                SET triggered=?, build_number=?, failure_reason=?
+                WHERE id=?
+            ''', (
+                1 if triggered else 0,
+                build_number,
+                failure_reason or '',
+                item_id
+            ))
+            conn.commit()
+        
+        return {
+            'id': item_id,
+            'jenkins_job_name': jenkins_job_name,
+            'triggered': triggered,
+            'build_number': build_number,
+            'triggered_at': time.time() if triggered else None,
+            'success': None,
+            'failure_reason': failure_reason
+        }
+    
+    def _run_parallel(self, plan_id, plan_row, item_rows):
+        """并行发版：按 Jenkins 控制器分组，各控制器并发「全部触发 + 统一轮询」，返回与 item_rows 同序的 items"""
+        groups = {}
+        for item_row in item_rows:
+            controller_id, _ = split_job_ref(item_row['jenkins_job_name'])
+            groups.setdefault(controller_id, []).append(item_row)
+        
+        def run_group(rows):
+            group_items = []
+            for r in rows:
+                if r['success'] is not None or (r['triggered'] and r['build_number']):
+                    group_items.append(self._item_from_row(r))
+                else:
+                    self._check_stopping()
+                    group_items.append(self._trigger_item(plan_id, plan_row, r))
+            self._poll_build_results(plan_id, group_items)
+            return group_items
+        
+        if len(groups) == 1:
+            results = [run_group(item_rows)]
+        else:
+            logger.info(f"计划 #{plan_id} 涉及 {len(groups)} 个 Jenkins 控制器，并发执行")
+            with ThreadPoolExecutor(max_workers=len(groups)) as pool:
+                results = list(pool.map(run_group, groups.values()))
+        by_id = {item['id']: item for group_items in results for item in group_items}
+        return [by_id[r['id']] for r in item_rows]
+    
+    def _save_item_result(self, item, duration_ms=None):
+        """写入计划项最终结果，并在同一事务里累加任务发版统计"""
         with get_db() as conn:
             cursor = conn.cursor()
-            cursor.execute('UPDATE release_plan_items SET success=0, failure_reason=? WHERE id=?',
-                           (item['failure_reason'], item_id))
+            cursor.execute('UPDATE release_plan_items SET success=?, failure_reason=? WHERE id=?',
+                           (1 if item['success'] else 0, item.get('failure_reason') or '', item['id']))
+            record_job_result(conn, item['jenkins_job_name'], item['success'], duration_ms)
             conn.commit()
 
-    def _poll_build_results(self, plan_id, items):
-        """轮询所有任务的构建结果（并行发版时使用）"""
-        logger.info(f"开始轮询计划 #{plan_id} 的构建结果（并行）")
-        start_time = time.time()
-        completed_item_ids = set()
-        while len(completed_item_ids) < len(items):
-            if time.time() - start_time > self.poll_timeout:
-                logger.warning(f"计划 #{plan_id} 轮询超时")
-                break
-            for item in items:
-                item_id = item['id']
-                if item_id in completed_item_ids:
-                    continue
-                if not item['triggered'] or not item['build_number']:
-                    item['success'] = False
-                    completed_item_ids.add(item_id)
-                    with get_db() as conn:
-                        cursor = conn.cursor()
-                        cursor.execute('UPDATE release_plan_items SET success=0 WHERE id=?', (item_id,))
-                        conn.commit()
-                    continue
+    @staticmethod
+    def _build_duration_ms(item, status):
+        """构建耗时：优先用 Jenkins 返回的 duration，没有时按触发到发现结束的时间估算"""
+        if status.get('duration'):
+            return status['duration']
+        if item.get('triggered_at'):
+            return int((time.time() - item['triggered_at']) * 1000)
+        return None
+
+    def _poll_wait_seconds(self):
+        """两次主动查询 Jenkins 的间隔：已开启构建事件推送时只需低频兜底"""
+        if self.build_events is not None and Config.JENKINS_EVENTS_ENABLED:
+            return max(self.poll_interval, Config.EVENT_SAFETY_POLL_INTERVAL)
+        return self.poll_interval
+
+    def _wait_for_builds(self, keys):
+        """等待构建结束事件或到下一次兜底轮询。被推送事件唤醒返回 True，超时返回 False；
+        调度器停止时抛出 PlanInterrupted"""
+        if self.build_events is None:
+            if self._stopping.wait(self.poll_interval):
+                raise PlanInterrupted()
+            return False
+        deadline = time.time() + self._poll_wait_seconds()
+        while True:
+            self._check_stopping()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            # 分段等待，停止时最多 1 秒内响应
+            if self.build_events.wait_for(keys, min(remaining, 1)):
+                return True
+
+    def _get_build_status(self, item, live):
+        """查询 Jenkins 上的构建状态。推送事件只用于唤醒：live=False 时只有收到该构建的结束事件才查询，否则返回 None；
+        构建结果始终以 Jenkins 为准"""
+        event_seen = (self.build_events is not None
+                      and self.build_events.get_result(item['jenkins_job_name'], item['build_number']) is not None)
+        if not live and not event_seen:
+            return None
+        status = self.jenkins_client.get_build_status(item['jenkins_job_name'], item['build_number'])
+        if event_seen:
+            # 已按结束事件查询过 Jenkins，之后不再因该事件唤醒（事件与 Jenkins 不一致时避免空转）
+            item['event_checked'] = True
+        return status
+
+    @staticmethod
+    def _wake_keys(items):
+        """可唤醒轮询的构建 key"""
+        return [(item['jenkins_job_name'], item['build_number']) for item in items
+                if item['build_number'] and not item.get('event_checked')]
+
+    def _poll_single_build(self, plan_id, item):
+        """轮询单个任务的构建结果，直到完成或超时（串行发版时使用）"""
+        key = (item['jenkins_job_name'], item['build_number'])
+        if self.build_events is not None:
+            self.build_events.watch([key])
+        try:
+            start_time = time.time()
+            live = True
+            while time.time() - start_time < self.poll_timeout:
                 try:
-                    status = self.jenkins_client.get_build_status(
-                        item['jenkins_job_name'],
-                        item['build_number']
-                    )
-                    if not status['building']:
+                    status = self._get_build_status(item, live)
+                    if status and not status['building']:
                         item['success'] = (status['result'] == 'SUCCESS')
                         if not item['success']:
                             item['failure_reason'] = f"构建失败：{status['result']}"
-                        completed_item_ids.add(item_id)
                         logger.info(
                             f"计划 #{plan_id} - 任务 {item['jenkins_job_name']} #{item['build_number']} "
                             f"构建完成，结果: {'成功' if item['success'] else '失败'}"
                         )
-                        with get_db() as conn:
-                            cursor = conn.cursor()
-                            cursor.execute('''
-                                UPDATE release_plan_items SET success=?, failure_reason=? WHERE id=?
-                            ''', (1 if item['success'] else 0, item.get('failure_reason', '') or '', item_id))
-                            conn.commit()
+                        self._save_item_result(item, self._build_duration_ms(item, status))
+                        return
                 except Exception as e:
                     logger.warning(f"计划 #{plan_id} - 任务 {item['jenkins_job_name']} 轮询状态失败: {e}")
-            if len(completed_item_ids) < len(items):
-                time.sleep(self.poll_interval)
+                live = not self._wait_for_builds(self._wake_keys([item]))
+        finally:
+            if self.build_events is not None:
+                self.build_events.unwatch([key])
+        item['success'] = False
+        item['failure_reason'] = (item.get('failure_reason') or '') + '；轮询超时'
+        logger.warning(f"计划 #{plan_id} - 任务 {item['jenkins_job_name']} #{item['build_number']} 轮询超时")
+        self._save_item_result(item)
+
+    def _poll_build_results(self, plan_id, items):
+        """轮询所有任务的构建结果（并行发版时使用）"""
+        logger.info(f"开始轮询计划 #{plan_id} 的构建结果（并行）")
+        start_time = time.time()
+        # 续跑时已有结果的计划项不再轮询
+        completed_item_ids = {item['id'] for item in items if item['success'] is not None}
+        keys = [(item['jenkins_job_name'], item['build_number']) for item in items
+                if item['build_number'] and item['id'] not in completed_item_ids]
+        if self.build_events is not None:
+            self.build_events.watch(keys)
+        try:
+            live = True
+            while len(completed_item_ids) < len(items):
+                if time.time() - start_time > self.poll_timeout:
+                    logger.warning(f"计划 #{plan_id} 轮询超时")
+                    break
+                for item in items:
+                    item_id = item['id']
+                    if item_id in completed_item_ids:
+                        continue
+                    if not item['triggered'] or not item['build_number']:
+                        item['success'] = False
+                        completed_item_ids.add(item_id)
+                        self._save_item_result(item)
+                        continue
+                    try:
+                        status = self._get_build_status(item, live)
+                        if status and not status['building']:
+                            item['success'] = (status['result'] == 'SUCCESS')
+                            if not item['success']:
+                                item['failure_reason'] = f"构建失败：{status['result']}"
+                            completed_item_ids.add(item_id)
+                            logger.info(
+                                f"计划 #{plan_id} - 任务 {item['jenkins_job_name']} #{item['build_number']} "
+                                f"构建完成，结果: {'成功' if item['success'] else '失败'}"
+                            )
+                            self._save_item_result(item, self._build_duration_ms(item, status))
+                    except Exception as e:
+                        logger.warning(f"计划 #{plan_id} - 任务 {item['jenkins_job_name']} 轮询状态失败: {e}")
+                if len(completed_item_ids) < len(items):
+                    pending = self._wake_keys([item for item in items if item['id'] not in completed_item_ids])
+                    live = not self._wait_for_builds(pending)
+        finally:
+            if self.build_events is not None:
+                self.build_events.unwatch(keys)
 
     def _update_plan_status(self, plan_id, items):
         """根据所有任务结果更新计划状态"""
@@ -361,18 +561,18 @@ class Scheduler:
         with get_db() as conn:
             cursor = conn.cursor()
             cursor.execute('UPDATE release_plans SET status=? WHERE id=?', (status, plan_id))
+            self._send_notification(plan_id, conn)
             conn.commit()
         logger.info(f"计划 #{plan_id} 执行完成，状态: {status}")
     
-    def _send_notification(self, plan_id):
-        """发送飞书卡片通知（发版结束 / 发版失败）"""
+    def _send_notification(self, plan_id, conn):
+        """发版结束 / 发版失败卡片写入发件箱（不提交，与计划状态变更同一事务）"""
         try:
-            with get_db() as conn:
-                cursor = conn.cursor()
-                cursor.execute('SELECT * FROM release_plans WHERE id=?', (plan_id,))
-                plan_row = cursor.fetchone()
-                cursor.execute('SELECT * FROM release_plan_items WHERE plan_id=?', (plan_id,))
-                item_rows = cursor.fetchall()
+            cursor = conn.cursor()
+            cursor.execute('SELECT * FROM release_plans WHERE id=?', (plan_id,))
+            plan_row = cursor.fetchone()
+            cursor.execute('SELECT * FROM release_plan_items WHERE plan_id=?', (plan_id,))
+            item_rows = cursor.fetchall()
             
             scheduled_at = datetime.fromisoformat(plan_row['scheduled_at'])
             if scheduled_at.tzinfo is None:
@@ -383,14 +583,18 @@ class Scheduler:
             fail_count = sum(1 for r in item_rows if r['success'] == 0)
             total_count = len(item_rows)
             
+            # 失败/异常的任务排在前面，详情过长被截断时优先保留
             details = []
+            succeeded = []
             for item_row in item_rows:
                 job_name = item_row['jenkins_job_name']
                 build_number = item_row['build_number']
                 success = item_row['success']
                 failure_reason = (item_row['failure_reason'] or '').strip()
+                if len(failure_reason) > 200:
+                    failure_reason = failure_reason[:200] + '…'
                 if success == 1:
-                    details.append(f"- {job_name} #{build_number} 成功")
+                    succeeded.append(f"- {job_name} #{build_number} 成功")
                 elif success == 0:
                     details.append(f"- {job_name} #{build_number or 'N/A'} 失败：{failure_reason}")
                 else:
@@ -398,15 +602,120 @@ class Scheduler:
                         details.append(f"- {job_name} #{build_number or 'N/A'} 状态未知")
                     else:
                         details.append(f"- {job_name} 触发失败：{failure_reason}")
+            details += succeeded
             
             if fail_count == total_count:
                 self.feishu_notifier.card_release_failed(
-                    plan_id, scheduled_at_str, total_count, details
+                    plan_id, scheduled_at_str, total_count, details, conn=conn
                 )
             else:
                 self.feishu_notifier.card_release_complete(
-                    plan_id, scheduled_at_str, success_count, fail_count, total_count, details
+                    plan_id, scheduled_at_str, success_count, fail_count, total_count, details, conn=conn
                 )
-            logger.info(f"计划 #{plan_id} 飞书通知已发送")
+            logger.info(f"计划 #{plan_id} 飞书通知已写入发件箱")
         except Exception as e:
-            logger.error(f"发送飞书通知失败: {e}", exc_info=True)
+            logger.error(f"写入飞书通知失败: {e}", exc_info=True)
+
+
+class SchedulerService:
+    """调度引擎的全部后台组件：定时调度器、飞书通知投递，以及处理 Web 进程写入的命令并上报心跳。
+    jenkins_clients / build_events 为空时自行创建（独立进程）；内嵌在 Web 进程时传入与 Web 共用的实例"""
+
+    def __init__(self, jenkins_clients=None, build_events=None):
+        self.build_events = build_events or BuildEventHub()
+        self.jenkins_clients = jenkins_clients or JenkinsClientRegistry(event_hub=self.build_events)
+        self.feishu_notifier = FeishuNotifier()
+        # 飞书通知由发件箱异步投递，短时间内的多条发版通知合并为汇总卡片
+        self.notification_sender = OutboxSender(build_digest=digest_payload)
+        self.scheduler = Scheduler(self.jenkins_clients, self.feishu_notifier, build_events=self.build_events)
+        self.running = False
+        self.thread = None
+        self.started_ms = None
+        self._wake = threading.Event()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.started_ms = int(time.time() * 1000)
+        self.scheduler.start()
+        self.notification_sender.start()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self.running = False
+        self._wake.set()
+        if self.thread:
+            self.thread.join(timeout=5)
+        self.scheduler.stop()
+        self.notification_sender.stop()
+
+    def _run(self):
+        last_heartbeat = 0
+        while self.running:
+            try:
+                for kind, payload in claim_commands():
+                    self.handle_command(kind, payload)
+                    if kind == EXECUTE_PLAN:
+                        # 立即上报，Web 端可尽快查到计划在执行池中的排队位置
+                        last_heartbeat = 0
+            except Exception as e:
+                logger.error(f"处理调度命令出错: {e}", exc_info=True)
+            if time.time() - last_heartbeat >= Config.SCHEDULER_HEARTBEAT_INTERVAL:
+                last_heartbeat = time.time()
+                try:
+                    write_heartbeat(SCHEDULER_SERVICE, self.started_ms, self.status())
+                except Exception as e:
+                    logger.warning(f"写入调度服务心跳失败: {e}")
+            self._wake.wait(Config.SCHEDULER_COMMAND_POLL_INTERVAL)
+            self._wake.clear()
+
+    def handle_command(self, kind, payload):
+        """处理一条命令；立即执行返回计划在执行池中的状态与排队位置，构建事件返回是否有计划在等待该构建"""
+        if kind == EXECUTE_PLAN:
+            return self.scheduler.execute_plan(payload['plan_id'])
+        elif kind == BUILD_EVENT:
+            if payload.get('queue_id') is not None:
+                payload['queue_id'] = tuple(payload['queue_id'])
+            return self.build_events.publish(payload)
+        elif kind == INVALIDATE_JENKINS:
+            self.jenkins_clients.invalidate(payload.get('controller_id'))
+        else:
+            logger.warning(f"未知的调度命令: {kind}")
+        return None
+
+    def status(self):
+        """心跳中上报的运行状态"""
+        return {
+            'scheduler_running': self.scheduler.running,
+            'outbox_running': self.notification_sender.running,
+            'outbox_counters': self.notification_sender.counters_snapshot(),
+            'build_events_received': self.build_events.received,
+            'execution': self.scheduler.pool.status()
+        }
+
+
+def main():
+    """独立调度进程入口：python -m scheduler。收到 SIGTERM / SIGINT 后停止"""
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    init_db()
+    service = SchedulerService()
+    stopping = threading.Event()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(sig, lambda signum, frame: stopping.set())
+    service.start()
+    logger.info("调度服务已启动（独立进程）")
+    while not stopping.wait(1):
+        pass
+    logger.info("调度服务正在停止")
+    service.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Web 进程与调度进程之间的通信（经 SQLite）
+Web 把需要调度器处理的请求写入 scheduler_commands（可与业务数据同一事务），调度进程轮询领取；
+每条命令按 id 删除领取，多个消费者也只会处理一次。调度进程定期把运行状态写入 service_heartbeats，供 Web 查询
+"""
+import json
+import os
+import socket
+import time
+
+from database import get_db
+
+EXECUTE_PLAN = 'execute_plan'
+BUILD_EVENT = 'build_event'
+INVALIDATE_JENKINS = 'invalidate_jenkins'
+
+SCHEDULER_SERVICE = 'scheduler'
+
+
+def _now_ms():
+    return int(time.time() * 1000)
+
+
+def send_command(conn, kind, payload):
+    """写入一条命令（不提交，由调用方提交）"""
+    cursor = conn.cursor()
+    cursor.execute(
+        'INSERT INTO scheduler_commands (kind, payload, created_ms) VALUES (?, ?, ?)',
+        (kind, json.dumps(payload, ensure_ascii=False), _now_ms())
+    )
+    return cursor.lastrowid
+
+
+def claim_commands(limit=100):
+    """领取一批命令，返回 [(kind, payload)]，按写入顺序"""
+    claimed = []
+    with get_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, kind, payload FROM scheduler_commands ORDER BY id LIMIT ?', (limit,))
+        for row in cursor.fetchall():
+            cursor.execute('DELETE FROM scheduler_commands WHERE id=?', (row['id'],))
+            if cursor.rowcount:
+                claimed.append((row['kind'], json.loads(row['payload']) if row['payload'] else None))
+        conn.commit()
+    return claimed
+
+
+def pending_command_count():
+    with get_db() as conn:
+        return conn.execute('SELECT COUNT(*) FROM scheduler_commands').fetchone()[0]
+
+
+def write_heartbeat(name, started_ms, state):
+    with get_db() as conn:
+        conn.execute('''
+            INSERT INTO service_heartbeats (name, host, pid, started_ms, heartbeat_ms, state)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(name) DO UPDATE SET host=excluded.host, pid=excluded.pid, started_ms=excluded.started_ms,
+                heartbeat_ms=excluded.heartbeat_ms, state=excluded.state
+        ''', (name, socket.gethostname(), os.getpid(), started_ms, _now_ms(), json.dumps(state, ensure_ascii=False)))
+        conn.commit()
+
+
+def read_heartbeat(name, stale_after):
+    """返回 {host, pid, started_ms, heartbeat_ms, age_seconds, alive, state}；从未上报时返回 None。
+    超过 stale_after 秒未上报视为不在运行"""
+    with get_db() as conn:
+        row = conn.execute('SELECT * FROM service_heartbeats WHERE name=?', (name,)).fetchone()
+    if not row:
+        return None
+    age = (_now_ms() - row['heartbeat_ms']) / 1000
+    return {
+        'host': row['host'],
+        'pid': row['pid'],
+        'started_ms': row['started_ms'],
+        'heartbeat_ms': row['heartbeat_ms'],
+        'age_seconds': round(age, 1),
+        'alive': age <= stale_after,
+        'state': json.loads(row['state']) if row['state'] else {}
+    }
@@ -0,0 +1,25 @@
+"""
+Server-Sent Events 公共工具：消息帧格式化与流式响应（构建日志、计划状态推送共用）
+"""
+import json
+
+from flask import Response, stream_with_context
+
+
+def sse_event(event, data, event_id=None):
+    """格式化一条 SSE 消息；data 序列化为 JSON，event_id 供断线重连（Last-Event-ID）续传"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    lines.append(f'event: {event}')
+    lines.append('data: ' + json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_response(stream):
+    """把消息生成器包装为 text/event-stream 响应；关闭反向代理缓冲，保证消息即时送达"""
+    return Response(
+        stream_with_context(stream),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
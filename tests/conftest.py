@@ -0,0 +1,46 @@
+"""
+测试公共配置：导入应用模块前把数据库指向临时目录、关闭飞书推送；
+db fixture 为每个用例提供一个已完成迁移的独立数据库
+"""
+import os
+import sys
+import tempfile
+import threading
+
+import pytest
+
+os.environ['DATABASE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='release-tests-'), 'release_plans.db')
+os.environ['FEISHU_WEBHOOK_URL'] = ''
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """切换到用例独立的数据库文件并执行迁移；各线程的连接缓存一并重置"""
+    monkeypatch.setattr(database, '_db_path', str(tmp_path / 'release_plans.db'))
+    monkeypatch.setattr(database, '_local', threading.local())
+    database.init_db()
+    yield database
+
+
+@pytest.fixture
+def make_plan(db):
+    """写入一个计划及其计划项，返回计划 id。items 为 success 取值（None / 1 / 0）的列表"""
+    def make(status='pending', scheduled_at='2026-10-01T10:00:00+08:00', run_started_at=None, items=()):
+        with database.get_db() as conn:
+            cursor = conn.cursor()
+            cursor.execute(
+                'INSERT INTO release_plans (scheduled_at, scheduled_epoch_ms, created_at, status, run_started_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (scheduled_at, database.epoch_ms(scheduled_at), scheduled_at, status, run_started_at)
+            )
+            plan_id = cursor.lastrowid
+            cursor.executemany(
+                'INSERT INTO release_plan_items (plan_id, jenkins_job_name, success) VALUES (?, ?, ?)',
+                [(plan_id, f'folder/job/app{i}', success) for i, success in enumerate(items)]
+            )
+            conn.commit()
+        return plan_id
+    return make
@@ -0,0 +1,37 @@
+from archive import archive_finished_plans, unpack_items
+from database import get_db
+
+OLD = '2025-01-01T10:00:00+08:00'
+
+
+def _plan_ids(table):
+    with get_db() as conn:
+        return [r[0] for r in conn.execute(f'SELECT id FROM {table} ORDER BY id')]
+
+
+def test_archive_respects_batches(make_plan):
+    old = [make_plan(status='completed', scheduled_at=OLD, items=[1, 0]) for _ in range(5)]
+    archived = archive_finished_plans(30, batch_size=2, max_batches=2)
+    assert archived == 4
+    assert _plan_ids('release_plan_archive') == old[:4]
+    assert _plan_ids('release_plans') == old[4:]
+    assert archive_finished_plans(30, batch_size=2, max_batches=2) == 1
+    assert _plan_ids('release_plans') == []
+    assert archive_finished_plans(30, batch_size=2, max_batches=2) == 0
+
+
+def test_archive_keeps_recent_and_unfinished_plans(make_plan):
+    keep = [
+        make_plan(status='pending', scheduled_at=OLD),
+        make_plan(status='running', scheduled_at=OLD),
+        make_plan(status='failed', scheduled_at='2099-01-01T10:00:00+08:00'),
+    ]
+    archived = make_plan(status='failed', scheduled_at=OLD, items=[0, None])
+    assert archive_finished_plans(30, batch_size=100) == 1
+    assert _plan_ids('release_plans') == keep
+    with get_db() as conn:
+        row = conn.execute('SELECT item_count, fail_count, items_blob FROM release_plan_archive WHERE id=?',
+                           (archived,)).fetchone()
+        assert conn.execute('SELECT COUNT(*) FROM release_plan_items WHERE plan_id=?', (archived,)).fetchone()[0] == 0
+    assert (row['item_count'], row['fail_count']) == (2, 1)
+    assert [item['success'] for item in unpack_items(row['items_blob'])] == [0, None]
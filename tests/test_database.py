@@ -0,0 +1,67 @@
+from database import get_db
+
+
+def _counts(plan_id):
+    with get_db() as conn:
+        row = conn.execute('SELECT item_count, success_count, fail_count FROM release_plans WHERE id=?',
+                           (plan_id,)).fetchone()
+    return tuple(row)
+
+
+def test_item_counters_follow_inserts(make_plan):
+    plan_id = make_plan(items=[None, 1, 0, 1])
+    assert _counts(plan_id) == (4, 2, 1)
+
+
+def test_item_counters_follow_result_updates(make_plan):
+    plan_id = make_plan(items=[None, None, 1])
+    with get_db() as conn:
+        ids = [r[0] for r in conn.execute('SELECT id FROM release_plan_items WHERE plan_id=? ORDER BY id', (plan_id,))]
+        conn.execute('UPDATE release_plan_items SET success=0 WHERE id=?', (ids[0],))
+        conn.execute('UPDATE release_plan_items SET success=1 WHERE id=?', (ids[1],))
+        # 结果从成功改为失败、以及重复写入相同结果
+        conn.execute('UPDATE release_plan_items SET success=0 WHERE id=?', (ids[2],))
+        conn.execute('UPDATE release_plan_items SET success=0 WHERE id=?', (ids[2],))
+        conn.commit()
+    assert _counts(plan_id) == (3, 1, 2)
+
+
+def test_item_counters_follow_deletes(make_plan):
+    plan_id = make_plan(items=[1, 0, None])
+    with get_db() as conn:
+        conn.execute('DELETE FROM release_plan_items WHERE plan_id=? AND success IS NOT NULL', (plan_id,))
+        conn.commit()
+    assert _counts(plan_id) == (1, 0, 0)
+
+
+def _schema(conn):
+    return sorted(tuple(r) for r in conn.execute("SELECT type, name, sql FROM sqlite_master WHERE name NOT LIKE 'sqlite_%'"))
+
+
+def test_init_db_is_noop_when_current(db, make_plan):
+    make_plan(items=[1])
+    with get_db() as conn:
+        before = _schema(conn)
+        versions = conn.execute('SELECT version, applied_at FROM schema_version ORDER BY version').fetchall()
+    db.init_db()
+    with get_db() as conn:
+        assert _schema(conn) == before
+        assert conn.execute('SELECT version, applied_at FROM schema_version ORDER BY version').fetchall() == versions
+        assert conn.execute('SELECT MAX(version) FROM schema_version').fetchone()[0] == db.MIGRATIONS[-1][0]
+
+
+def test_migrations_can_be_rerun(db, make_plan):
+    """迁移中途中断后会从头重跑未记录版本的迁移：每个迁移在已迁移的库上重复执行不报错、不改变数据"""
+    plan_id = make_plan(items=[1, 0, None])
+    with get_db() as conn:
+        before = _schema(conn)
+        conn.execute('DELETE FROM schema_version')
+        conn.commit()
+    db.init_db()
+    with get_db() as conn:
+        assert _schema(conn) == before
+        assert [r[0] for r in conn.execute('SELECT version FROM schema_version ORDER BY version')] == \
+            [version for version, _, _ in db.MIGRATIONS]
+        plan = conn.execute('SELECT item_count, success_count, fail_count, scheduled_epoch_ms FROM release_plans '
+                            'WHERE id=?', (plan_id,)).fetchone()
+    assert tuple(plan) == (3, 1, 1, db.epoch_ms('2026-10-01T10:00:00+08:00'))
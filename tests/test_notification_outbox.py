@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+import notification_outbox
+from config import Config
+from database import get_db
+from notification_outbox import OutboxSender, enqueue
+
+WEBHOOK = 'https://example.invalid/hook'
+
+
+@pytest.fixture
+def sender(db, monkeypatch):
+    monkeypatch.setattr(Config, 'FEISHU_MIN_SEND_INTERVAL', 0)
+    monkeypatch.setattr(Config, 'FEISHU_COALESCE_WINDOW', 0)
+    sender = OutboxSender(build_digest=lambda summaries: {'digest': [s['plan_id'] for s in summaries]})
+    sender.posted = []
+    sender._post = lambda url, payload: sender.posted.append(payload)
+    return sender
+
+
+def _enqueue(n, summary=True):
+    with get_db() as conn:
+        ids = [enqueue(conn, {'n': i}, WEBHOOK, 'release_end', plan_id=i,
+                       summary={'plan_id': i, 'title': f'#{i}', 'text': ''} if summary else None)
+               for i in range(n)]
+        conn.commit()
+    return ids
+
+
+def _rows():
+    with get_db() as conn:
+        return [dict(r) for r in conn.execute('SELECT * FROM notification_outbox ORDER BY id')]
+
+
+def _fail(exc):
+    def post(url, payload):
+        raise exc
+    return post
+
+
+def test_failed_delivery_is_retried_with_backoff(sender):
+    _enqueue(1, summary=False)
+    sender._post = _fail(RuntimeError('boom'))
+    assert sender.deliver_due() == 1
+    row = _rows()[0]
+    assert (row['status'], row['attempts'], row['last_error']) == ('pending', 1, 'boom')
+    assert row['next_attempt_ms'] > notification_outbox._now_ms()
+    # 未到重试时间不投递
+    assert sender.deliver_due() == 0
+    assert sender.counters['retried'] == 1
+
+
+def test_delivery_gives_up_after_max_attempts(sender, monkeypatch):
+    monkeypatch.setattr(Config, 'FEISHU_OUTBOX_MAX_ATTEMPTS', 2)
+    _enqueue(1, summary=False)
+    sender._post = _fail(RuntimeError('boom'))
+    sender.deliver_due()
+    with get_db() as conn:
+        conn.execute('UPDATE notification_outbox SET next_attempt_ms = 0')
+        conn.commit()
+    sender.deliver_due()
+    row = _rows()[0]
+    assert (row['status'], row['attempts']) == ('failed', 2)
+    assert sender.counters['failed'] == 1
+
+
+def test_rate_limit_does_not_count_as_attempt(sender):
+    _enqueue(1, summary=False)
+    sender._post = _fail(notification_outbox._RateLimited('HTTP 429', 30))
+    sender.deliver_due()
+    row = _rows()[0]
+    assert (row['status'], row['attempts']) == ('pending', 0)
+    assert row['next_attempt_ms'] >= notification_outbox._now_ms() + 29000
+
+
+def test_successful_delivery_is_marked_sent(sender):
+    _enqueue(1, summary=False)
+    assert sender.deliver_due() == 1
+    assert sender.posted == [{'n': 0}]
+    row = _rows()[0]
+    assert (row['status'], row['attempts'], row['last_error']) == ('sent', 1, None)
+
+
+def test_due_summaries_are_coalesced_into_one_digest(sender):
+    _enqueue(3)
+    assert sender.deliver_due() == 3
+    assert sender.posted == [{'digest': [0, 1, 2]}]
+    assert [r['status'] for r in _rows()] == ['sent'] * 3
+    assert sender.counters['coalesced'] == 3
+
+
+def test_notifications_without_summary_are_not_coalesced(sender):
+    _enqueue(2, summary=False)
+    _enqueue(1)
+    assert sender.deliver_due() == 3
+    assert sender.posted == [{'n': 0}, {'n': 1}, {'n': 0}]
+    assert sender.counters['coalesced'] == 0
+
+
+def test_coalescing_waits_for_window(sender, monkeypatch):
+    monkeypatch.setattr(Config, 'FEISHU_COALESCE_WINDOW', 60)
+    _enqueue(2)
+    assert sender.deliver_due() == 0
+    assert sender.posted == []
+
+
+def test_failed_digest_retries_every_coalesced_notification(sender):
+    _enqueue(2)
+    sender._post = _fail(RuntimeError('boom'))
+    sender.deliver_due()
+    assert [(r['status'], r['attempts']) for r in _rows()] == [('pending', 1), ('pending', 1)]
+    assert sender.counters['retried'] == 2
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from config import Config
+from database import get_db
+from feishu_notifier import FeishuNotifier
+from scheduler import Scheduler
+
+
+class FakeJenkins:
+    def __init__(self):
+        self.triggered = []
+
+    def trigger_build(self, job_path, params):
+        self.triggered.append(job_path)
+        return 100 + len(self.triggered)
+
+    def get_build_status(self, job_path, build_number):
+        return {'building': False, 'result': 'SUCCESS', 'duration': 1000}
+
+
+@pytest.fixture
+def scheduler(db, monkeypatch):
+    monkeypatch.setattr(Config, 'PLAN_RESUME_WINDOW', 600)
+    scheduler = Scheduler(FakeJenkins(), FeishuNotifier())
+    scheduler.submitted = []
+    scheduler.pool.submit = lambda plan_id, resume=False: scheduler.submitted.append((plan_id, resume))
+    return scheduler
+
+
+def _ago(seconds, tz=timezone(timedelta(hours=8))):
+    return (datetime.now(tz) - timedelta(seconds=seconds)).isoformat()
+
+
+def test_resume_selects_plans_started_within_window(scheduler, make_plan):
+    recent = make_plan(status='running', run_started_at=_ago(60))
+    # 与阈值字符串的时区不同：按字符串比较会被误判为过期
+    recent_utc = make_plan(status='running', run_started_at=_ago(60, timezone.utc))
+    recent_naive = make_plan(status='running', run_started_at=_ago(60).split('+')[0])
+    make_plan(status='running', run_started_at=_ago(3600))
+    make_plan(status='running', run_started_at=_ago(3600, timezone(timedelta(hours=14))))
+    make_plan(status='running', run_started_at='not a time')
+    make_plan(status='pending')
+    make_plan(status='completed', run_started_at=_ago(60))
+    scheduler._resume_running_plans()
+    assert scheduler.submitted == [(recent, True), (recent_utc, True), (recent_naive, True)]
+
+
+def test_resume_triggers_items_not_yet_triggered(scheduler, make_plan):
+    plan_id = make_plan(status='running', run_started_at=_ago(60), items=[1, None, None])
+    with get_db() as conn:
+        item_ids = [r[0] for r in conn.execute('SELECT id FROM release_plan_items WHERE plan_id=? ORDER BY id',
+                                               (plan_id,))]
+        # 第二项中断前已触发（构建 #7），第三项尚未触发
+        conn.execute('UPDATE release_plan_items SET triggered=1, build_number=7 WHERE id=?', (item_ids[1],))
+        conn.commit()
+    scheduler._execute_plan(plan_id, resume=True)
+    assert scheduler.jenkins_client.triggered == ['folder/job/app2']
+    with get_db() as conn:
+        plan = conn.execute('SELECT status, success_count, fail_count FROM release_plans WHERE id=?',
+                            (plan_id,)).fetchone()
+        items = conn.execute('SELECT triggered, build_number, success FROM release_plan_items WHERE plan_id=? '
+                             'ORDER BY id', (plan_id,)).fetchall()
+    assert tuple(plan) == ('completed', 3, 0)
+    assert [tuple(r) for r in items][1:] == [(1, 7, 1), (1, 101, 1)]